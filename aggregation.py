@@ -0,0 +1,303 @@
+"""Time-bucket SQL helpers shared by the dashboard query paths."""
+
+import calendar
+import time
+from datetime import datetime, timedelta
+
+# Storage format of every timestamp column in the project
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Timelines that are bucketed by a fixed number of minutes
+MINUTE_TIMELINES = {
+    '5min': 5,
+    '10min': 10,
+    '15min': 15,
+    '30min': 30,
+}
+
+# Timelines that return samples as stored (no bucketing)
+RAW_TIMELINES = ('live', 'raw')
+
+TIMELINES = RAW_TIMELINES + tuple(MINUTE_TIMELINES) + ('hourly', 'daily', 'weekly', 'monthly', 'yearly')
+
+# Look-back applied when a data request gives no start (None reads the whole history)
+DEFAULT_WINDOWS = {
+    'live': timedelta(hours=1),
+    'raw': timedelta(hours=1),
+    '5min': timedelta(days=1),
+    '10min': timedelta(days=2),
+    '15min': timedelta(days=3),
+    '30min': timedelta(days=7),
+    'hourly': timedelta(days=7),
+    'daily': timedelta(days=30),
+    'weekly': timedelta(weeks=26),
+    'monthly': timedelta(days=730),
+    'yearly': None,
+}
+
+AGGREGATIONS = {
+    'min': 'MIN',
+    'max': 'MAX',
+    'avg': 'AVG',
+}
+
+
+def _sqlite_bucket(column, timeline):
+    if timeline in MINUTE_TIMELINES:
+        step = MINUTE_TIMELINES[timeline]
+        return (f"printf('%s%02d:00', strftime('%Y-%m-%d %H:', {column}), "
+                f"CAST(strftime('%M', {column}) AS INTEGER) / {step} * {step})")
+    if timeline == 'hourly':
+        return f"strftime('%Y-%m-%d %H:00:00', {column})"
+    if timeline == 'daily':
+        return f"strftime('%Y-%m-%d', {column})"
+    if timeline == 'weekly':
+        # Monday of the week the sample falls in
+        return f"date({column}, 'weekday 0', '-6 days')"
+    if timeline == 'monthly':
+        return f"strftime('%Y-%m', {column})"
+    if timeline == 'yearly':
+        return f"strftime('%Y', {column})"
+    return column
+
+
+def _mysql_bucket(column, timeline):
+    if timeline in MINUTE_TIMELINES:
+        step = MINUTE_TIMELINES[timeline]
+        return (f"DATE_FORMAT(DATE_SUB({column}, INTERVAL MOD(MINUTE({column}), {step}) MINUTE), "
+                f"'%Y-%m-%d %H:%i:00')")
+    if timeline == 'hourly':
+        return f"DATE_FORMAT({column}, '%Y-%m-%d %H:00:00')"
+    if timeline == 'daily':
+        return f"DATE_FORMAT({column}, '%Y-%m-%d')"
+    if timeline == 'weekly':
+        return f"DATE_FORMAT(DATE_SUB(DATE({column}), INTERVAL WEEKDAY({column}) DAY), '%Y-%m-%d')"
+    if timeline == 'monthly':
+        return f"DATE_FORMAT({column}, '%Y-%m')"
+    if timeline == 'yearly':
+        return f"DATE_FORMAT({column}, '%Y')"
+    return column
+
+
+def _postgresql_bucket(column, timeline):
+    ts = f"CAST({column} AS timestamp)"
+    if timeline in MINUTE_TIMELINES:
+        step = MINUTE_TIMELINES[timeline]
+        return (f"to_char(date_trunc('hour', {ts}) + "
+                f"floor(extract(minute from {ts}) / {step}) * {step} * interval '1 minute', "
+                f"'YYYY-MM-DD HH24:MI:00')")
+    if timeline == 'hourly':
+        return f"to_char({ts}, 'YYYY-MM-DD HH24:00:00')"
+    if timeline == 'daily':
+        return f"to_char({ts}, 'YYYY-MM-DD')"
+    if timeline == 'weekly':
+        return f"to_char(date_trunc('week', {ts}), 'YYYY-MM-DD')"
+    if timeline == 'monthly':
+        return f"to_char({ts}, 'YYYY-MM')"
+    if timeline == 'yearly':
+        return f"to_char({ts}, 'YYYY')"
+    return column
+
+
+_BUCKET_BUILDERS = {
+    'sqlite': _sqlite_bucket,
+    'mysql': _mysql_bucket,
+    'mariadb': _mysql_bucket,
+    'postgresql': _postgresql_bucket,
+}
+
+
+def bucket_expression(dialect, column, timeline):
+    """Return a SQL expression that maps `column` to its timeline bucket label."""
+    if timeline in RAW_TIMELINES:
+        return column
+    if timeline not in TIMELINES:
+        raise ValueError(f"Unsupported timeline '{timeline}'")
+    builder = _BUCKET_BUILDERS.get(dialect)
+    if builder is None:
+        raise ValueError(f"Unsupported database dialect '{dialect}'")
+    return builder(column, timeline)
+
+
+def normalize_timestamp(value):
+    """Parse a user-supplied date/datetime string into the stored timestamp format.
+
+    Returns None for empty values and raises ValueError for unparseable ones.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromisoformat(value.strip().replace('Z', '')).strftime(TIMESTAMP_FORMAT)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{value}'")
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(str(value)[:19], TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def time_window(timeline, start=None, end=None, latest=None):
+    """Validated (start, end) bounds for a data query, as stored-format strings or None.
+
+    Without an explicit start, the timeline's default look-back is taken back
+    from `end`, else from `latest` (the newest stored timestamp), else now, and
+    aligned down to the minute, hour or day so repeated requests share cache
+    entries. `end` stays open unless given; timelines without a default
+    window (e.g. None) only validate the explicit bounds.
+    """
+    start, end = normalize_timestamp(start), normalize_timestamp(end)
+    if start and end and start > end:
+        raise ValueError("start must not be after end")
+    window = DEFAULT_WINDOWS.get(timeline)
+    if start is None and window is not None:
+        anchor = _as_datetime(end or latest) or datetime.now()
+        begin = anchor - window
+        if window <= timedelta(hours=1):
+            begin = begin.replace(second=0)
+        elif window < timedelta(days=1):
+            begin = begin.replace(minute=0, second=0)
+        else:
+            begin = begin.replace(hour=0, minute=0, second=0)
+        start = begin.strftime(TIMESTAMP_FORMAT)
+    return start, end
+
+
+def window_headers(response, start, end):
+    """Tell the client which time range was applied (the default window when none was given)."""
+    if start:
+        response.headers['X-Window-Start'] = start
+    if end:
+        response.headers['X-Window-End'] = end
+    return response
+
+
+def aggregate_function(aggregation):
+    """Return the SQL aggregate for `aggregation`, or None for raw rows."""
+    if aggregation in (None, '', 'raw'):
+        return None
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unsupported aggregation '{aggregation}'")
+    return AGGREGATIONS[aggregation]
+
+
+# Rollup granularities, finest first, as full 'YYYY-MM-DD HH:MM:SS' bucket starts
+_TRUNCATE_FORMATS = {
+    'sqlite': {
+        'minute': '%Y-%m-%d %H:%M:00',
+        'hour': '%Y-%m-%d %H:00:00',
+        'day': '%Y-%m-%d 00:00:00',
+    },
+    'mysql': {
+        'minute': '%Y-%m-%d %H:%i:00',
+        'hour': '%Y-%m-%d %H:00:00',
+        'day': '%Y-%m-%d 00:00:00',
+    },
+    'postgresql': {
+        'minute': 'YYYY-MM-DD HH24:MI:00',
+        'hour': 'YYYY-MM-DD HH24:00:00',
+        'day': 'YYYY-MM-DD 00:00:00',
+    },
+}
+_TRUNCATE_FORMATS['mariadb'] = _TRUNCATE_FORMATS['mysql']
+
+
+def truncate_expression(dialect, column, granularity):
+    """Return a SQL expression truncating `column` to the start of its minute/hour/day."""
+    formats = _TRUNCATE_FORMATS.get(dialect)
+    if formats is None:
+        raise ValueError(f"Unsupported database dialect '{dialect}'")
+    fmt = formats[granularity]
+    if dialect == 'sqlite':
+        return f"strftime('{fmt}', {column})"
+    if dialect == 'postgresql':
+        return f"to_char(CAST({column} AS timestamp), '{fmt}')"
+    return f"DATE_FORMAT({column}, '{fmt}')"
+
+
+def bucket_start(label):
+    """Full 'YYYY-MM-DD HH:MM:SS' start of a bucket label ('2024', '2024-05', '2024-05-06', ...)."""
+    label = str(label)
+    return label + '0000-01-01 00:00:00'[len(label):]
+
+
+# Seconds per fixed-width bucket for integer epoch timestamps
+EPOCH_BUCKET_SECONDS = {name: minutes * 60 for name, minutes in MINUTE_TIMELINES.items()}
+EPOCH_BUCKET_SECONDS.update({'hourly': 3600, 'daily': 86400})
+
+# 1970-01-01 was a Thursday: shift by three days so weeks start on Monday
+_EPOCH_WEEK_OFFSET = 3 * 86400
+
+_EPOCH_CALENDAR_BUCKETS = {
+    'sqlite': "CAST(strftime('%s', {column}, 'unixepoch', 'start of {unit}') AS INTEGER)",
+    # TIMESTAMPDIFF/DATE_ADD rather than (UN)FROM_UNIXTIME, which apply the session time zone
+    'mysql': ("TIMESTAMPDIFF(SECOND, '1970-01-01 00:00:00', "
+              "DATE_FORMAT(DATE_ADD('1970-01-01 00:00:00', INTERVAL {column} SECOND), '{fmt}'))"),
+    'postgresql': "CAST(EXTRACT(EPOCH FROM date_trunc('{unit}', to_timestamp({column}) AT TIME ZONE 'UTC')) AS BIGINT)",
+}
+_EPOCH_CALENDAR_BUCKETS['mariadb'] = _EPOCH_CALENDAR_BUCKETS['mysql']
+
+_EPOCH_CALENDAR_FORMATS = {
+    'monthly': ('%Y-%m-01 00:00:00', 'month'),
+    'yearly': ('%Y-01-01 00:00:00', 'year'),
+}
+
+# Label format per timeline, matching the string bucket labels of bucket_expression()
+_EPOCH_LABELS = dict.fromkeys(tuple(MINUTE_TIMELINES) + ('hourly',) + RAW_TIMELINES, TIMESTAMP_FORMAT)
+_EPOCH_LABELS.update({'daily': '%Y-%m-%d', 'weekly': '%Y-%m-%d', 'monthly': '%Y-%m', 'yearly': '%Y'})
+
+
+def epoch_bucket_expression(dialect, column, timeline):
+    """SQL mapping an integer epoch-seconds column to the epoch start of its bucket.
+
+    Fixed-width buckets are plain integer arithmetic (ts - ts % 3600); only
+    monthly and yearly buckets need the database's calendar functions.
+    """
+    if timeline in RAW_TIMELINES:
+        return column
+    if timeline in EPOCH_BUCKET_SECONDS:
+        return f"({column} - {column} % {EPOCH_BUCKET_SECONDS[timeline]})"
+    if timeline == 'weekly':
+        return f"({column} - ({column} + {_EPOCH_WEEK_OFFSET}) % 604800)"
+    if timeline not in _EPOCH_CALENDAR_FORMATS:
+        raise ValueError(f"Unsupported timeline '{timeline}'")
+    template = _EPOCH_CALENDAR_BUCKETS.get(dialect)
+    if template is None:
+        raise ValueError(f"Unsupported database dialect '{dialect}'")
+    fmt, unit = _EPOCH_CALENDAR_FORMATS[timeline]
+    return template.format(column=column, fmt=fmt, unit=unit)
+
+
+# Stored timestamp string -> epoch seconds, reading naive times as UTC like to_epoch()
+_EPOCH_FROM_TIMESTAMP = {
+    'sqlite': "CAST(strftime('%s', {column}) AS INTEGER)",
+    'mysql': "TIMESTAMPDIFF(SECOND, '1970-01-01 00:00:00', {column})",
+    'postgresql': "CAST(EXTRACT(EPOCH FROM CAST({column} AS timestamp)) AS BIGINT)",
+}
+_EPOCH_FROM_TIMESTAMP['mariadb'] = _EPOCH_FROM_TIMESTAMP['mysql']
+
+
+def epoch_expression(dialect, column):
+    """SQL converting a stored timestamp column to integer epoch seconds (used to backfill)."""
+    template = _EPOCH_FROM_TIMESTAMP.get(dialect)
+    if template is None:
+        raise ValueError(f"Unsupported database dialect '{dialect}'")
+    return template.format(column=column)
+
+
+def to_epoch(value):
+    """Epoch seconds (UTC) for a stored-format timestamp string or datetime; None passes through."""
+    if value in (None, ''):
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.strptime(str(value)[:19], TIMESTAMP_FORMAT)
+    return calendar.timegm(value.timetuple())
+
+
+def epoch_label(epoch, timeline):
+    """Format an epoch bucket start like the string labels of bucket_expression()."""
+    return time.strftime(_EPOCH_LABELS.get(timeline, TIMESTAMP_FORMAT), time.gmtime(int(epoch)))
@@ -1,15 +1,36 @@
-from flask import Flask, render_template, jsonify, request, send_file, session, redirect, url_for
-from sqlalchemy import create_engine, text, inspect
+from flask import Flask, Response, render_template, jsonify, request, session, redirect, url_for
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 import pandas as pd
-from fpdf import FPDF
-import tempfile
 import os
+import itertools
 import logging
 from functools import wraps
+from aggregation import (aggregate_function, bucket_expression, bucket_start, normalize_timestamp, time_window,
+                         window_headers)
+from engine_registry import registry
+from instrumentation import instrument_app
+import rollups
+from indexes import index_report
+from exports import CHUNK_SIZE, csv_response, iter_engine_rows, wants_gzip, write_csv_file, write_xlsx_file
+from export_jobs import export_jobs_blueprint, jobs
+from slow_queries import slow_queries_blueprint
+from reports import PERIODS, summarise, write_report_pdf
+import live_feed
+from series_format import epoch_seconds, negotiate, series_response
+from downsampling import DOWNSAMPLE_METHODS, downsample_rows, parse_max_points, shared_indices
+from response_cache import cached_distinct, cached_series, conditional_json, data_version
+from storage import get_storage, reset_storages
+from retention import archive_root
+from archive import archive_range, archive_stats, finish_stats, iter_archive, merge_stats, read_archive, with_archive
+from pagination import build_page, decode_cursor, explain_estimate, keyset_condition, page_size, sqlite_stat_estimate
 
 app = Flask(__name__)
 app.secret_key = "super-secret-key"  # Needed for session handling
+app.register_blueprint(export_jobs_blueprint)
+app.register_blueprint(slow_queries_blueprint)
+# Request latency, response size and SQL timings, served at /metrics
+instrument_app(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,13 +50,15 @@ def get_db_engine():
     db_url = session.get('db_url')
     if not db_url:
         raise RuntimeError("Database URL not configured in session.")
-    engine = create_engine(db_url)
-    # Defensive check for table existence
-    inspector = inspect(engine)
-    if 'simulation_data' not in inspector.get_table_names():
+    engine = registry.get_engine(db_url)
+    # Defensive check for table existence (served from the cached schema snapshot)
+    if 'simulation_data' not in registry.get_schema(db_url).tables:
         raise RuntimeError("Table 'simulation_data' does not exist in the database.")
     return engine
 
+def get_db_schema():
+    return registry.get_schema(session['db_url'])
+
 # ----------- DB Configuration Page (GET) -----------
 @app.route('/configure-db', methods=['GET'])
 def configure_db_form():
@@ -67,20 +90,21 @@ def configure_db():
         return jsonify({'error': 'Unsupported DB type'}), 400
 
     try:
-        engine = create_engine(db_url)
+        engine = registry.get_engine(db_url)
         with engine.connect() as conn:
             # Test connection
             conn.execute(text("SELECT 1"))
-            # Check for required table
-            inspector = inspect(engine)
-            if 'simulation_data' not in inspector.get_table_names():
-                return jsonify({'error': "Table 'simulation_data' does not exist in the database."}), 400
+        # Check for required table
+        if 'simulation_data' not in registry.get_schema(db_url, refresh=True).tables:
+            registry.dispose(db_url)
+            return jsonify({'error': "Table 'simulation_data' does not exist in the database."}), 400
 
         session['db_url'] = db_url
         logger.info(f"Connected to database: {db_url}")
         return jsonify({'message': 'Database connected successfully', 'redirect': url_for('home')})
     except SQLAlchemyError as e:
         logger.error(f"DB connection error: {str(e)}")
+        registry.dispose(db_url)
         return jsonify({'error': str(e)}), 500
 
 # ----------- Pages (require DB config) -----------
@@ -104,148 +128,547 @@ def export_index():
 @db_required
 def get_sensors():
     try:
-        engine = get_db_engine()
-        inspector = inspect(engine)
-        columns = inspector.get_columns('simulation_data')
-        sensor_cols = [col['name'] for col in columns if col['name'] not in ('id', 'timestamp', 'building', 'floor')]
-        return jsonify(sensor_cols)
+        get_db_engine()
+        return jsonify(list(get_db_schema().sensor_columns))
     except Exception as e:
         logger.error(f"Error fetching sensors: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def distinct_vals(column):
+def current_version(conn):
+    return data_version(lambda sql: conn.execute(text(sql)).fetchall(), 'simulation_data')
+
+def distinct_vals(column, building=None):
+    """Distinct values of `column` (optionally within one building), cached and topped up from new rows."""
     try:
         engine = get_db_engine()
-        query = text(f"SELECT DISTINCT {column} FROM simulation_data")
+        query = f"SELECT DISTINCT {column} FROM simulation_data"
+        params = {}
+        if building:
+            query += " WHERE building = :building"
+            params['building'] = building
+        since = query + (" AND" if building else " WHERE") + " id > :last_id"
+        key = ('distinct', session['db_url'], column, building)
         with engine.connect() as conn:
-            result = conn.execute(query)
-            return [row[0] for row in result]
+            version = current_version(conn)
+            return key, version, cached_distinct(
+                key, version,
+                lambda: [row[0] for row in conn.execute(text(query), params)],
+                lambda last_id: [row[0] for row in conn.execute(text(since), dict(params, last_id=last_id))],
+            )
     except Exception as e:
         logger.error(f"Error fetching distinct values for {column}: {str(e)}")
-        return []
+        return None, None, []
+
+def distinct_response(column, building=None):
+    key, version, values = distinct_vals(column, building)
+    if key is None:
+        return jsonify(values)
+    return conditional_json(key, version, lambda: values)
 
 @app.route('/buildings', methods=['GET'])
 @db_required
 def get_buildings():
-    return jsonify(distinct_vals('building'))
+    return distinct_response('building')
 
 @app.route('/floors', methods=['GET'])
 @db_required
 def get_floors():
-    return jsonify(distinct_vals('floor'))
+    return distinct_response('floor', request.args.get('building') or None)
+
+def data_filters(building, floor, start, end):
+    """WHERE terms and bind parameters for the building/floor/time filters of a data query."""
+    filters = []
+    params = {}
+    if building:
+        filters.append("building = :building")
+        params['building'] = building
+    if floor:
+        filters.append("floor = :floor")
+        params['floor'] = floor
+    if start:
+        filters.append("timestamp >= :start")
+        params['start'] = start
+    if end:
+        filters.append("timestamp <= :end")
+        params['end'] = end
+    return filters, params
+
+def fetch_start(start, since):
+    """Lower time bound when re-reading a cached series from the bucket labelled `since`."""
+    if since is None:
+        return start
+    since = bucket_start(since)
+    return max(start, since) if start else since
+
+def stored_series(engine, storage, sensor, timeline, aggregation, building, floor, start, end):
+    """Bucketed series from the raw table, merged with archived history when the range reaches back that far."""
+    if storage.layout != 'canonical':
+        root = archive_root(engine)
+        with engine.connect() as conn:
+            archived_range = archive_range(conn, root, 'simulation_data', building, start, end)
+        if archived_range is not None:
+            # Buckets holding both archived and live rows are merged from partial min/max/sum/count
+            archived = archive_stats(root, 'simulation_data', sensor, timeline, building, archived_range.start,
+                                     archived_range.end, {'floor': floor}, archived_range.live_ids)
+            live = storage.bucket_stats(sensor, timeline, building or None, floor or None, start, end)
+            return finish_stats(merge_stats(archived, live), aggregation)
+    return storage.series([sensor], timeline, aggregation, building or None, floor or None, start, end)
+
+def series_version(engine, rollup_table, storage, latest):
+    """Cache version of a bucketed series: copies that lag the raw table carry their own watermark."""
+    if rollup_table:
+        with engine.connect() as conn:
+            return (rollups.watermark(conn), None)
+    if storage.layout == 'canonical':
+        return (storage.watermark(), None)
+    return latest
+
+def oldest_change(engine, last_id):
+    """Oldest timestamp among rows written after id `last_id` (late rows can be older than cached buckets)."""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT MIN(timestamp) FROM simulation_data WHERE id > :last_id"),
+                            {'last_id': last_id}).scalar()
 
 @app.route('/data/sensor/<sensor_name>', methods=['GET'])
 @db_required
 def data_by_sensor(sensor_name):
     building = request.args.get('building')
     floor = request.args.get('floor')
+    timeline = request.args.get('timeline', 'live')
+    aggregation = request.args.get('aggregation', 'raw')
 
     try:
         engine = get_db_engine()
-        inspector = inspect(engine)
-        sensor_list = [col['name'] for col in inspector.get_columns('simulation_data')]
+        schema = get_db_schema()
 
-        if sensor_name not in sensor_list:
+        if sensor_name not in schema.sensor_columns:
             return jsonify({'error': 'Invalid sensor name'}), 400
 
-        query = f"SELECT timestamp, {sensor_name} AS value FROM simulation_data"
-        filters = []
-        params = {}
-
-        if building:
-            filters.append("building = :building")
-            params['building'] = building
-        if floor:
-            filters.append("floor = :floor")
-            params['floor'] = floor
+        with engine.connect() as conn:
+            latest = current_version(conn)
+
+        try:
+            agg_function = aggregate_function(aggregation)
+            bucket = bucket_expression(engine.dialect.name, 'timestamp', timeline)
+            # page_size switches to keyset pagination (newest first) with cursor tokens
+            limit = page_size(request.args['page_size']) if request.args.get('page_size') else None
+            # Explicit start/end, otherwise the timeline's default look-back from the newest row;
+            # paged raw rows are read straight off the index and are only bounded when asked
+            start, end = time_window(timeline if agg_function or not limit else None,
+                                     request.args.get('start'), request.args.get('end'), latest[1])
+            cursor_key, direction = decode_cursor(request.args.get('cursor')) if limit else (None, 'next')
+            # max_points (e.g. the chart width) bounds the points returned for charting
+            max_points = parse_max_points(request.args.get('max_points'))
+            method = request.args.get('downsample', 'lttb')
+            if method not in DOWNSAMPLE_METHODS:
+                raise ValueError(f"Unsupported downsample method '{method}'")
+            # Row dicts by default; columnar JSON, Arrow or packed Float64 on request
+            fmt = negotiate(request)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Raw rows are returned as stored; otherwise bucket and aggregate in the database,
+        # reading the coarsest materialized rollup that can answer the timeline and window
+        rollup_table = (rollups.rollup_table_for(timeline, sensor_name, schema.rollups, start, end)
+                        if agg_function else None)
+        if rollup_table:
+            rollups.maybe_refresh(engine, schema.rollups[rollup_table])
+            value = rollups.value_expression(sensor_name, aggregation)
+            query = f"SELECT {bucket} AS bucket, {value} AS value FROM {rollup_table}"
+        elif agg_function:
+            query = f"SELECT {bucket} AS bucket, {agg_function}({sensor_name}) AS value FROM simulation_data"
+        else:
+            query = f"SELECT timestamp AS bucket, {sensor_name} AS value, id FROM simulation_data"
+        filters, params = data_filters(building, floor, start, end)
+        base_filters = list(filters)
+
+        if agg_function and not limit:
+            # Cached buckets are reused; only those holding rows written since are re-aggregated
+            storage = get_storage(engine)
+
+            def fetch(since):
+                if not rollup_table:
+                    # Raw rows are bucketed through the configured storage layout
+                    return stored_series(engine, storage, sensor_name, timeline, aggregation, building, floor,
+                                         fetch_start(start, since), end)
+                fetch_query, fetch_params = query, dict(params)
+                fetch_filters = list(filters)
+                if since is not None:
+                    fetch_filters.append("timestamp >= :since")
+                    fetch_params['since'] = bucket_start(since)
+                if fetch_filters:
+                    fetch_query += " WHERE " + " AND ".join(fetch_filters)
+                fetch_query += f" GROUP BY {bucket} ORDER BY {bucket} ASC"
+                with engine.connect() as conn:
+                    return conn.execute(text(fetch_query), fetch_params).fetchall()
+
+            key = ('series', session['db_url'], rollup_table or storage.layout, sensor_name, building, floor,
+                   timeline, aggregation, start, end)
+            version = series_version(engine, rollup_table, storage, latest)
+            def build():
+                series = cached_series(key, version, fetch, lambda last_id: oldest_change(engine, last_id))
+                if max_points:
+                    series = downsample_rows(series, max_points, method)
+                return series_response(fmt, [label for label, _ in series], [value for _, value in series])
+            return window_headers(conditional_json(key + (max_points, method, fmt), version, build), start, end)
+
+        if cursor_key and agg_function:
+            # Every row of bucket L has timestamp >= L, so the cursor prunes the scan directly
+            filters.append("timestamp < :cursor_bucket" if direction == 'next' else "timestamp >= :cursor_bucket")
+            params['cursor_bucket'] = cursor_key[0]
+        elif cursor_key:
+            filters.append(keyset_condition(('timestamp', 'id'), (':cursor_ts', ':cursor_id'), direction))
+            params['cursor_ts'], params['cursor_id'] = cursor_key
 
         if filters:
             query += " WHERE " + " AND ".join(filters)
 
-        query += " ORDER BY timestamp DESC"
+        order = 'DESC' if direction == 'next' else 'ASC'
+        if agg_function:
+            query += f" GROUP BY {bucket}"
+            if cursor_key and direction == 'prev':
+                query += f" HAVING {bucket} > :cursor_bucket"
+            query += f" ORDER BY {bucket} {order if limit else 'ASC'}"
+        else:
+            query += f" ORDER BY timestamp {order}"
+            if limit:
+                query += f", id {order}"
+        if limit:
+            query += f" LIMIT {limit + 1}"
 
         with engine.connect() as conn:
             result = conn.execute(text(query), params)
             # FIXED: Use row._mapping to access by column names
-            data = [{'timestamp': row._mapping['timestamp'], 'value': row._mapping['value']} for row in result]
-
-        return jsonify(data)
+            rows = [row._mapping for row in result]
+
+            total_estimate = None
+            if limit and not agg_function:
+                if engine.dialect.name == 'sqlite':
+                    total_estimate = sqlite_stat_estimate(
+                        lambda sql: conn.execute(text(sql)).fetchall(),
+                        'simulation_data', {'building', 'floor'} if building and floor else
+                        ({'building'} if building else set()))
+                else:
+                    where = " WHERE " + " AND ".join(base_filters) if base_filters else ""
+                    total_estimate = explain_estimate(conn, f"SELECT id FROM simulation_data{where}", params)
+
+        if not limit:
+            series = [(row['bucket'], row['value']) for row in rows]
+            root = archive_root(engine)
+            with engine.connect() as conn:
+                archived_range = archive_range(conn, root, 'simulation_data', building, start, end)
+            if archived_range is not None:
+                # Archived raw rows are merged in by timestamp (newest first, like the SQL rows)
+                archived = read_archive(root, 'simulation_data', ['id', 'timestamp', sensor_name], building,
+                                        archived_range.start, archived_range.end, {'floor': floor},
+                                        archived_range.live_ids).iloc[::-1]
+                series += list(zip(archived['timestamp'], archived[sensor_name].astype(object)))
+                series.sort(key=lambda item: item[0], reverse=True)
+            if max_points:
+                series = downsample_rows(series, max_points, method, descending=True)
+            response = series_response(fmt, [timestamp for timestamp, _ in series], [value for _, value in series])
+            response.vary.add('Accept')
+            if rows:
+                # Live clients resume the /stream feed from here
+                response.headers['X-Last-Row-Id'] = str(max(row['id'] for row in rows))
+            return window_headers(response, start, end)
+
+        key_of = (lambda row: (row['bucket'],)) if agg_function else (lambda row: (row['bucket'], row['id']))
+        rows, next_cursor, prev_cursor = build_page(rows, limit, key_of, cursor_key, direction)
+        return window_headers(jsonify({
+            'rows': [{'timestamp': row['bucket'], 'value': row['value']} for row in rows],
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'total_estimate': total_estimate,
+        }), start, end)
 
     except Exception as e:
         logger.error(f"Error fetching sensor data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# ----------- Multi-sensor batch query -----------
+@app.route('/data/batch', methods=['GET'])
+@db_required
+def data_batch():
+    # Several sensors for one building/floor/window, read in a single scan onto a shared time axis
+    building = request.args.get('building')
+    floor = request.args.get('floor')
+    timeline = request.args.get('timeline', 'live')
+    aggregation = request.args.get('aggregation', 'raw')
+
+    try:
+        engine = get_db_engine()
+        schema = get_db_schema()
+
+        sensors = requested_sensors(request.args) or list(schema.sensor_columns)
+        invalid = [name for name in sensors if name not in schema.sensor_columns]
+        if invalid:
+            return jsonify({'error': f"Invalid sensor name(s): {', '.join(invalid)}"}), 400
+
+        with engine.connect() as conn:
+            latest = current_version(conn)
+
+        try:
+            agg_function = aggregate_function(aggregation)
+            bucket = bucket_expression(engine.dialect.name, 'timestamp', timeline)
+            start, end = time_window(timeline, request.args.get('start'), request.args.get('end'), latest[1])
+            max_points = parse_max_points(request.args.get('max_points'))
+            method = request.args.get('downsample', 'lttb')
+            if method not in DOWNSAMPLE_METHODS:
+                raise ValueError(f"Unsupported downsample method '{method}'")
+            fmt = request.args.get('format', 'rows')
+            if fmt not in ('rows', 'columnar'):
+                raise ValueError(f"Unsupported format '{fmt}'")
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # A rollup can replace the raw scan only when one table covers every requested sensor
+        tables = ({rollups.rollup_table_for(timeline, name, schema.rollups, start, end) for name in sensors}
+                  if agg_function else set())
+        rollup_table = tables.pop() if len(tables) == 1 else None
+        if rollup_table:
+            rollups.maybe_refresh(engine, schema.rollups[rollup_table])
+            values = [f"{rollups.value_expression(name, aggregation)} AS {name}" for name in sensors]
+            source = rollup_table
+        elif agg_function:
+            values = [f"{agg_function}({name}) AS {name}" for name in sensors]
+            source = 'simulation_data'
+        else:
+            values = list(sensors)
+            source = 'simulation_data'
+        query = f"SELECT {bucket} AS bucket, {', '.join(values)} FROM {source}"
+        filters, params = data_filters(building, floor, start, end)
+
+        storage = get_storage(engine)
+
+        def fetch(since):
+            if agg_function and not rollup_table:
+                return storage.series(sensors, timeline, aggregation, building or None, floor or None,
+                                      fetch_start(start, since), end)
+            fetch_query, fetch_params = query, dict(params)
+            fetch_filters = list(filters)
+            if since is not None:
+                fetch_filters.append("timestamp >= :since")
+                fetch_params['since'] = bucket_start(since)
+            if fetch_filters:
+                fetch_query += " WHERE " + " AND ".join(fetch_filters)
+            if agg_function:
+                fetch_query += f" GROUP BY {bucket} ORDER BY {bucket} ASC"
+            else:
+                fetch_query += " ORDER BY timestamp ASC, id ASC"
+            with engine.connect() as conn:
+                return conn.execute(text(fetch_query), fetch_params).fetchall()
+
+        key = ('batch', session['db_url'], rollup_table or storage.layout, tuple(sensors), building, floor,
+               timeline, aggregation, start, end)
+        version = series_version(engine, rollup_table, storage, latest) if agg_function else latest
+
+        def build():
+            # Raw rows can share a timestamp, so only bucketed series reuse closed buckets
+            rows = (cached_series(key, version, fetch, lambda last_id: oldest_change(engine, last_id))
+                    if agg_function else fetch(None))
+            timestamps = [row[0] for row in rows]
+            columns = [[row[i] for row in rows] for i in range(1, len(sensors) + 1)]
+            if max_points:
+                keep = shared_indices(timestamps, columns, max_points, method)
+                timestamps = [timestamps[i] for i in keep]
+                columns = [[column[i] for i in keep] for column in columns]
+            if fmt == 'columnar':
+                return {'t': epoch_seconds(timestamps).tolist(), 'series': dict(zip(sensors, columns))}
+            return {'timestamps': timestamps, 'series': dict(zip(sensors, columns))}
+        return window_headers(conditional_json(key + (max_points, method, fmt), version, build), start, end)
+
+    except Exception as e:
+        logger.error(f"Error fetching batch sensor data: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# ----------- Live updates (Server-Sent Events) -----------
+@app.route('/stream/sensor/<sensor_name>', methods=['GET'])
+@db_required
+def stream_sensor(sensor_name):
+    building = request.args.get('building') or None
+    floor = request.args.get('floor') or None
+    # EventSource sends Last-Event-ID when it reconnects
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+
+    try:
+        engine = get_db_engine()
+        schema = get_db_schema()
+        if sensor_name not in schema.sensor_columns:
+            return jsonify({'error': 'Invalid sensor name'}), 400
+        try:
+            last_id = int(last_id) if last_id else None
+        except ValueError:
+            return jsonify({'error': f"Invalid last_id '{last_id}'"}), 400
+
+        feed = live_feed.get_feed(session['db_url'], engine, schema.sensor_columns)
+        return Response(live_feed.stream_rows(feed, sensor_name, building, floor, last_id),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception as e:
+        logger.error(f"Error opening live stream: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/schema/refresh', methods=['POST'])
+@db_required
+def refresh_schema():
+    try:
+        snapshot = registry.get_schema(session['db_url'], refresh=True)
+        # Re-detect the storage layout and any newly filled ts column
+        reset_storages()
+        return jsonify({'tables': list(snapshot.tables), 'sensors': list(snapshot.sensor_columns)})
+    except Exception as e:
+        logger.error(f"Error refreshing schema: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/indexes', methods=['GET', 'POST'])
+@db_required
+def admin_indexes():
+    # GET reports missing indexes and query plans; POST also creates the missing ones
+    try:
+        engine = get_db_engine()
+        report = index_report(engine, apply=request.method == 'POST')
+        if report['created']:
+            registry.invalidate(session['db_url'])
+        return jsonify(report)
+    except Exception as e:
+        logger.error(f"Error checking indexes: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # ----------- Export Endpoints -----------
-@app.route('/export/csv', methods=['GET'])
+def requested_sensors(args):
+    return [name for name in args.get('sensors', args.get('sensor', '')).split(',') if name]
+
+def build_export_query(schema, args):
+    """Build the filtered simulation_data export query from request arguments."""
+    sensors = requested_sensors(args)
+    invalid = [name for name in sensors if name not in schema.sensor_columns]
+    if invalid:
+        raise ValueError(f"Invalid sensor name(s): {', '.join(invalid)}")
+    columns = ['id', 'timestamp', 'building', 'floor'] + sensors if sensors else ['*']
+
+    filters = []
+    params = {}
+    if args.get('building'):
+        filters.append("building = :building")
+        params['building'] = args['building']
+    if args.get('floor'):
+        filters.append("floor = :floor")
+        params['floor'] = args['floor']
+    start = normalize_timestamp(args.get('start'))
+    end = normalize_timestamp(args.get('end'))
+    if start:
+        filters.append("timestamp >= :start")
+        params['start'] = start
+    if end:
+        filters.append("timestamp <= :end")
+        params['end'] = end
+
+    query = f"SELECT {', '.join(columns)} FROM simulation_data"
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    query += " ORDER BY id"
+    return text(query), params
+
+def archived_export(engine, args, columns=None):
+    """Archived simulation_data rows an export covers, one DataFrame per month, or None."""
+    start = normalize_timestamp(args.get('start'))
+    end = normalize_timestamp(args.get('end'))
+    root = archive_root(engine)
+    with engine.connect() as conn:
+        archived_range = archive_range(conn, root, 'simulation_data', args.get('building'), start, end)
+    if archived_range is None:
+        return None
+    sensors = requested_sensors(args)
+    if columns is None and sensors:
+        columns = ['id', 'timestamp', 'building', 'floor'] + sensors
+    return iter_archive(root, 'simulation_data', columns, args.get('building'), archived_range.start,
+                        archived_range.end, {'floor': args.get('floor')}, archived_range.live_ids)
+
+def export_chunks(engine, query, params, args):
+    """(columns, rows) chunks of an export: archived history first, then the live table."""
+    chunks = iter_engine_rows(engine, query, params)
+    frames = archived_export(engine, args)
+    return chunks if frames is None else with_archive(chunks, frames)
+
+def count_export_rows(engine, query, params, args):
+    with engine.connect() as conn:
+        total = conn.execute(text(f"SELECT COUNT(*) FROM ({query.text}) AS export_rows"), params).scalar()
+    frames = archived_export(engine, args, columns=['id'])
+    return total + sum(len(frame) for frame in frames or ())
+
+def build_csv_file(job, engine, query, params, args):
+    job.set_total(count_export_rows(engine, query, params, args))
+    return write_csv_file(os.path.join(job.directory, job.filename),
+                          export_chunks(engine, query, params, args), job.advance)
+
+def build_excel_file(job, engine, query, params, args):
+    job.set_total(count_export_rows(engine, query, params, args))
+    return write_xlsx_file(os.path.join(job.directory, job.filename),
+                           export_chunks(engine, query, params, args), job.advance)
+
+def build_pdf_report(job, engine, query, params, args, sensors, period, appendix_rows):
+    job.set_total(count_export_rows(engine, query, params, args))
+    frames = pd.read_sql(query, engine, params=params, chunksize=CHUNK_SIZE)
+    archived = archived_export(engine, args)
+    if archived is not None:
+        frames = itertools.chain(archived, frames)
+    summary, appendix = summarise(frames, ['building', 'floor'], period, wide_columns=sensors,
+                                  appendix_rows=appendix_rows,
+                                  progress=lambda rows: setattr(job, 'rows_done', rows))
+    path = os.path.join(job.directory, job.filename)
+    return write_report_pdf(path, "Simulation Data Report", summary,
+                            ['building', 'floor'], ['Building', 'Floor'], appendix)
+
+@app.route('/export/csv', methods=['GET', 'POST'])
 @db_required
 def export_csv():
-    tmp_path = None
     try:
-        df = pd.read_sql('SELECT * FROM simulation_data', get_db_engine())
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp:
-            df.to_csv(tmp.name, index=False)
-            tmp_path = tmp.name
-        return send_file(tmp_path, as_attachment=True, download_name='simulation_data.csv')
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp file: {tmp_path}, error: {e}")
-
-@app.route('/export/excel', methods=['GET'])
+        engine = get_db_engine()
+        query, params = build_export_query(get_db_schema(), request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if request.method == 'POST':
+        job = jobs.submit('csv', 'simulation_data.csv', build_csv_file, engine, query, params,
+                          request.args.to_dict())
+        return jsonify(job.to_dict()), 202
+    # Rows are streamed in chunks straight from a server-side cursor (after any archived history)
+    return csv_response(export_chunks(engine, query, params, request.args), 'simulation_data.csv',
+                        compress=wants_gzip(request.args))
+
+# Jobs are only created by POST, so link prefetchers and crawlers cannot queue them (GET is a 405)
+@app.route('/export/excel', methods=['POST'])
 @db_required
 def export_excel():
-    tmp_path = None
+    # Workbooks are written in the background; poll the returned status URL
     try:
-        df = pd.read_sql('SELECT * FROM simulation_data', get_db_engine())
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-            df.to_excel(tmp.name, index=False)
-            tmp_path = tmp.name
-        return send_file(tmp_path, as_attachment=True, download_name='simulation_data.xlsx')
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp file: {tmp_path}, error: {e}")
-
-@app.route('/export/pdf', methods=['GET'])
+        engine = get_db_engine()
+        query, params = build_export_query(get_db_schema(), request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    job = jobs.submit('excel', 'simulation_data.xlsx', build_excel_file, engine, query, params,
+                      request.args.to_dict())
+    return jsonify(job.to_dict()), 202
+
+@app.route('/export/pdf', methods=['POST'])
 @db_required
 def export_pdf():
-    tmp_path = None
+    # Summary report (min/max/avg per sensor, building/floor and period) built in the background
+    period = request.args.get('period', 'monthly')
+    if period not in PERIODS:
+        return jsonify({'error': f"Unsupported period '{period}'"}), 400
     try:
-        df = pd.read_sql('SELECT * FROM simulation_data', get_db_engine())
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=10)
-        col_width = pdf.w / (len(df.columns) + 1)
-
-        # Header
-        for col in df.columns:
-            pdf.cell(col_width, 10, str(col), border=1)
-        pdf.ln()
-
-        # Rows
-        for _, row in df.iterrows():
-            for item in row:
-                text = str(item)
-                if len(text) > 15:
-                    text = text[:12] + "..."
-                pdf.cell(col_width, 10, text, border=1)
-            pdf.ln()
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            pdf.output(tmp.name)
-            tmp_path = tmp.name
-
-        return send_file(tmp_path, as_attachment=True, download_name='simulation_data.pdf')
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp file: {tmp_path}, error: {e}")
+        engine = get_db_engine()
+        schema = get_db_schema()
+        query, params = build_export_query(schema, request.args)
+        appendix_rows = int(request.args.get('appendix', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    sensors = requested_sensors(request.args) or list(schema.sensor_columns)
+    job = jobs.submit('pdf', 'simulation_data.pdf', build_pdf_report,
+                      engine, query, params, request.args.to_dict(), sensors, period, appendix_rows)
+    return jsonify(job.to_dict()), 202
 
 # ----------- Health Check -----------
 @app.route('/health')
@@ -253,5 +676,6 @@ def health_check():
     return jsonify({'status': 'ok'})
 
 # ----------- Run the App -----------
+# Development server (debugger and reloader); serve.py runs the app for production
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,16 +1,31 @@
 # File: app.py
 
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, render_template, jsonify, request
 import sqlite3
 from functools import wraps
-from prometheus_client import start_http_server, Counter, generate_latest
+from prometheus_client import Counter
 import threading
+import os
 import webbrowser
 import pandas as pd
-from fpdf import FPDF
+from aggregation import normalize_timestamp, time_window, window_headers
+from exports import CHUNK_SIZE, csv_response, iter_sqlite_rows, wants_gzip, write_csv_file, write_xlsx_file
+from export_jobs import export_jobs_blueprint, jobs
+from slow_queries import slow_queries_blueprint
+from reports import PERIODS, summarise, write_report_pdf
+from series_format import negotiate, series_response
+from response_cache import cached_distinct, conditional_json, data_version
+from engine_registry import registry
+from instrumentation import instrument_app, sqlite_connect
+from storage import get_storage
+from pagination import build_page, decode_cursor, keyset_condition, keyset_params, page_size, sqlite_stat_estimate
 
 
 app = Flask(__name__)
+app.register_blueprint(export_jobs_blueprint)
+app.register_blueprint(slow_queries_blueprint)
+# Request latency, response size and SQL timings, served at /metrics
+instrument_app(app)
 
 # Mapping sensor types to their respective units
 SENSOR_UNITS = {
@@ -21,12 +36,14 @@ SENSOR_UNITS = {
 }
 
 # Prometheus counter for page requests
-page_requests_counter = Counter('page_requests', 'Total number of requests to open the webpage', ['ip'])
+page_requests_counter = Counter('page_requests', 'Total number of requests to open the webpage')
+
+DB_PATH = os.environ.get('SENSOR_DB_PATH', 'sensor_data.db')
 
 # Database connection utility function
 def get_db_connection():
     try:
-        conn = sqlite3.connect('sensor_data.db')
+        conn = sqlite_connect(DB_PATH)
         return conn
     except sqlite3.Error as e:
         raise Exception(f"Database connection error: {e}")
@@ -43,8 +60,7 @@ def handle_db_error(func):
 
 @app.route('/')
 def home():
-    ip_address = request.remote_addr  # Get the IP address of the client
-    page_requests_counter.labels(ip=ip_address).inc()  # Increment the counter
+    page_requests_counter.inc()
     return render_template('index.html')
 
 # New route for graphical view
@@ -61,33 +77,41 @@ def export_page():
 @app.route('/tabular')
 def tabular_view():
     return render_template('tabular.html')
+# Distinct values of a sensor_data column, cached and topped up from rows written since
+def distinct_values(cursor, column, where='', params=()):
+    query = f'SELECT DISTINCT {column} FROM sensor_data' + (f' WHERE {where}' if where else '')
+    since = query + (' AND' if where else ' WHERE') + ' id > ?'
+    key = ('distinct', DB_PATH, column, where, tuple(params))
+    version = data_version(lambda sql: cursor.execute(sql).fetchall(), 'sensor_data')
+    values = cached_distinct(
+        key, version,
+        lambda: [row[0] for row in cursor.execute(query, params)],
+        lambda last_id: [row[0] for row in cursor.execute(since, tuple(params) + (last_id,))],
+    )
+    return key, version, values
+
 # API to fetch available buildings
 @app.route('/buildings', methods=['GET'])
 @handle_db_error
 def get_buildings():
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT DISTINCT building_id FROM sensor_data')
-    rows = cursor.fetchall()
-    buildings = [row[0] for row in rows]
+    key, version, buildings = distinct_values(conn.cursor(), 'building_id')
     conn.close()
     if not buildings:
         return jsonify({"error": "No buildings found"}), 404
-    return jsonify(buildings)
+    return conditional_json(key, version, lambda: buildings)
 
 # API to fetch available floors
 @app.route('/floors/<building_id>', methods=['GET'])
 @handle_db_error
 def get_floors(building_id):
     conn = get_db_connection()
-    cursor = conn.cursor()
     if building_id == 'all':
-        cursor.execute('SELECT DISTINCT floor_number FROM sensor_data')
+        key, version, floors = distinct_values(conn.cursor(), 'floor_number')
     else:
-        cursor.execute('SELECT DISTINCT floor_number FROM sensor_data WHERE building_id = ?', (building_id,))
-    rows = cursor.fetchall()
+        key, version, floors = distinct_values(conn.cursor(), 'floor_number', 'building_id = ?', (building_id,))
     conn.close()
-    return jsonify([row[0] for row in rows])
+    return conditional_json(key, version, lambda: floors)
 
 # Updated sensor-types endpoint in app.py
 
@@ -95,27 +119,42 @@ def get_floors(building_id):
 @handle_db_error
 def get_sensor_types():
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Dynamically fetch distinct sensor types from the sensor_type column
-    cursor.execute('SELECT DISTINCT sensor_type FROM sensor_data')
-    rows = cursor.fetchall()
+    # Distinct sensor types from the sensor_type column, served from the response cache
+    key, version, sensor_types = distinct_values(conn.cursor(), 'sensor_type')
     conn.close()
-    
-    # Convert the result to a list of sensor types
-    sensor_types = [row[0] for row in rows]
-    return jsonify(sensor_types)
+    return conditional_json(key, version, lambda: sensor_types)
+
+# Validated start/end bounds for a data request; without a start the timeline's default window applies
+def request_window(cursor, timeline):
+    latest = data_version(lambda sql: cursor.execute(sql).fetchall(), 'sensor_data')[1]
+    return time_window(timeline, request.args.get('start'), request.args.get('end'), latest)
 
 # API to fetch sensor data
 @app.route('/data/<building_id>/<floor>/<sensor_type>/<timeline>/<aggregation>', methods=['GET'])
 @handle_db_error
 def get_sensor_data(building_id, floor, sensor_type, timeline, aggregation):
+    # Row dicts by default; columnar JSON, Arrow or packed Float64 on request (analog sensors)
+    try:
+        fmt = negotiate(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # Explicit start/end, otherwise the timeline's default look-back from the newest row
+    bucket_timeline = timeline if timeline in ('hourly', 'daily', 'weekly', 'monthly', 'yearly') else 'raw'
+    try:
+        start, end = request_window(cursor, bucket_timeline)
+    except ValueError as e:
+        conn.close()
+        return jsonify({"error": str(e)}), 400
+
     # Build conditions for building and floor
     building_condition = '' if building_id == 'all' else 'AND building_id = ?'
     floor_condition = '' if floor == 'all' else 'AND floor_number = ?'
+    time_condition = ('AND timestamp >= ? ' if start else '') + ('AND timestamp <= ?' if end else '')
+    time_params = [value for value in (start, end) if value]
     
     params = []
 
@@ -125,12 +164,13 @@ def get_sensor_data(building_id, floor, sensor_type, timeline, aggregation):
             SELECT building_id, floor_number, fan_status, rotor_status, pipe_status, fan_id
             FROM sensor_data
             WHERE sensor_type = 'digital'
-            {building_condition} {floor_condition}
+            {building_condition} {floor_condition} {time_condition}
         '''
         if building_id != 'all':
             params.append(building_id)
         if floor != 'all':
             params.append(floor)
+        params += time_params
         cursor.execute(query, tuple(params))
         rows = cursor.fetchall()
 
@@ -146,59 +186,37 @@ def get_sensor_data(building_id, floor, sensor_type, timeline, aggregation):
                 "unit": SENSOR_UNITS.get(sensor_type, "")
             })
 
-    # For non-digital sensors, aggregate data by timeline
+    # For non-digital sensors, aggregate data by timeline through the storage layer
     else:
-        # Determine aggregation function
-        agg_function = 'AVG(CAST(value AS REAL))'
-        if aggregation == 'min':
-            agg_function = 'MIN(CAST(value AS REAL))'
-        elif aggregation == 'max':
-            agg_function = 'MAX(CAST(value AS REAL))'
-            
-        # Mapping for timeline formatting
-        timeline_mapping = {
-            'hourly': '%Y-%m-%d %H:00:00',
-            'daily': '%Y-%m-%d',
-            'weekly': '%Y-%W',
-            'monthly': '%Y-%m',
-            'yearly': '%Y'
-        }
-        period_format = timeline_mapping.get(timeline, '%Y-%m-%d %H:%M:%S')
-
-        query = f'''
-            SELECT strftime('{period_format}', timestamp) AS period,
-                   {agg_function} AS agg_value,
-                   status, fan_status, rotor_status, pipe_status
-            FROM sensor_data
-            WHERE sensor_type = ? {building_condition} {floor_condition}
-            GROUP BY period
-            ORDER BY period ASC
-        '''
-        # First parameter is sensor_type
-        params = [sensor_type]
-        if building_id != 'all':
-            params.append(building_id)
-        if floor != 'all':
-            params.append(floor)
+        conn.close()
+        series = get_storage(registry.get_engine(f"sqlite:///{DB_PATH}")).series(
+            [sensor_type], bucket_timeline, aggregation if aggregation in ('min', 'max') else 'avg',
+            None if building_id == 'all' else building_id, None if floor == 'all' else floor, start, end)
 
-        cursor.execute(query, tuple(params))
-        rows = cursor.fetchall()
+        if fmt != 'rows':
+            return window_headers(series_response(fmt, [row[0] for row in series], [row[1] for row in series],
+                                                  extra={"unit": SENSOR_UNITS.get(sensor_type, "")}), start, end)
 
         data = []
-        for row in rows:
+        for row in series:
             data.append({
                 "timestamp": row[0],
                 "value": round(row[1], 2) if row[1] is not None else None,
-                "status": row[2],
-                "fan_status": row[3],
-                "rotor_status": row[4],
-                "pipe_status": row[5],
+                "status": None,
+                "fan_status": None,
+                "rotor_status": None,
+                "pipe_status": None,
                 "fan_id": None,
                 "unit": SENSOR_UNITS.get(sensor_type, "")
             })
+        return window_headers(jsonify(data), start, end)
 
     conn.close()
-    return jsonify(data)
+    return window_headers(jsonify(data), start, end)
+# Timelines that group tabular rows by period (labelled like the chart buckets)
+TABULAR_PERIODS = ('hourly', 'daily', 'weekly', 'monthly', 'yearly')
+
+# Keyset-paginated tabular data, newest first; pages are addressed by opaque cursors
 @app.route('/tabular-data', methods=['GET'])
 @handle_db_error
 def get_tabular_data():
@@ -207,180 +225,218 @@ def get_tabular_data():
     sensor_type = request.args.get('sensor_type', 'all')
     timeline = request.args.get('timeline', 'raw')
     aggregation = request.args.get('aggregation', 'raw')
-    limit = int(request.args.get('limit', 30))  # Default to 30 records per page
-    offset = int(request.args.get('offset', 0))  # Default to start at the first record
-
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Base Query
-    select_fields = '''
-        building_id, 
-        floor_number, 
-        sensor_type, 
-        strftime('%Y-%m-%d %H:%M:%S', timestamp) AS timestamp, 
-        value, 
-        status, 
-        fan_status, 
-        rotor_status, 
-        pipe_status
-    '''
-    group_by = ''
-    
-    # Apply timeline grouping
-    if timeline == 'hourly':
-        select_fields = select_fields.replace(
-            "strftime('%Y-%m-%d %H:%M:%S', timestamp)", 
-            "strftime('%Y-%m-%d %H:00', timestamp)"
-        )
-        group_by = "GROUP BY strftime('%Y-%m-%d %H:00', timestamp), sensor_type"
-    elif timeline == 'daily':
-        select_fields = select_fields.replace(
-            "strftime('%Y-%m-%d %H:%M:%S', timestamp)", 
-            "strftime('%Y-%m-%d', timestamp)"
-        )
-        group_by = "GROUP BY strftime('%Y-%m-%d', timestamp), sensor_type"
-    elif timeline == 'weekly':
-        select_fields = select_fields.replace(
-            "strftime('%Y-%m-%d %H:%M:%S', timestamp)", 
-            "strftime('%Y-%W', timestamp)"
-        )
-        group_by = "GROUP BY strftime('%Y-%W', timestamp), sensor_type"
-    elif timeline == 'monthly':
-        select_fields = select_fields.replace(
-            "strftime('%Y-%m-%d %H:%M:%S', timestamp)", 
-            "strftime('%Y-%m', timestamp)"
-        )
-        group_by = "GROUP BY strftime('%Y-%m', timestamp), sensor_type"
-    elif timeline == 'yearly':
-        select_fields = select_fields.replace(
-            "strftime('%Y-%m-%d %H:%M:%S', timestamp)", 
-            "strftime('%Y', timestamp)"
-        )
-        group_by = "GROUP BY strftime('%Y', timestamp), sensor_type"
-
-    # Apply aggregation
-    if aggregation == 'min':
-        select_fields = select_fields.replace('value', 'MIN(value) AS value')
-    elif aggregation == 'max':
-        select_fields = select_fields.replace('value', 'MAX(value) AS value')
-    elif aggregation == 'avg':
-        select_fields = select_fields.replace('value', 'AVG(value) AS value')
-
-    # Build query
-    query = f'''
-        SELECT {select_fields}
-        FROM sensor_data
-        WHERE 1=1
-    '''
-    
+    try:
+        limit = page_size(request.args.get('limit'), 30)  # Default to 30 records per page
+        cursor_key, direction = decode_cursor(request.args.get('cursor'))
+        # Grouped views aggregate the whole window before paging, so they get the default window;
+        # raw rows are paged straight off the index and are only bounded when asked
+        start, end = request_window(conn.cursor(), timeline if timeline in TABULAR_PERIODS else None)
+    except ValueError as e:
+        conn.close()
+        return jsonify({"error": str(e)}), 400
+
+    filters = []
     params = []
-    
+    filtered_columns = set()
     if building_id != 'all':
-        query += ' AND building_id = ?'
+        filters.append('building_id = ?')
         params.append(building_id)
-    
+        filtered_columns.add('building_id')
     if floor_id != 'all':
-        query += ' AND floor_number = ?'
+        filters.append('floor_number = ?')
         params.append(floor_id)
-    
+        filtered_columns.add('floor_number')
     if sensor_type != 'all':
-        query += ' AND sensor_type = ?'
+        filters.append('sensor_type = ?')
         params.append(sensor_type)
+        filtered_columns.add('sensor_type')
+    grouped = timeline in TABULAR_PERIODS
+    # Periods are bucketed by the storage layer, arithmetically on the integer ts column when it is filled
+    storage = get_storage(registry.get_engine(f"sqlite:///{DB_PATH}")) if grouped else None
+    time_column = storage.time_column if grouped else 'timestamp'
+    if start:
+        filters.append(f'{time_column} >= ?')
+        params.append(storage.time_param(start) if grouped else start)
+    if end:
+        filters.append(f'{time_column} <= ?')
+        params.append(storage.time_param(end) if grouped else end)
+    where = ' WHERE ' + ' AND '.join(filters) if filters else ''
+    order = 'DESC' if direction == 'next' else 'ASC'
+
+    if grouped:
+        # Group by period and sensor type; raw aggregation over a period falls back to the average
+        agg_function = {'min': 'MIN', 'max': 'MAX'}.get(aggregation, 'AVG')
+        key_columns = ('period', 'sensor_type')
+        query = f'''
+            SELECT period, sensor_type, value, status, fan_status, rotor_status, pipe_status
+            FROM (
+                SELECT {storage.bucket(timeline)} AS period,
+                       sensor_type,
+                       {agg_function}(value) AS value,
+                       status, fan_status, rotor_status, pipe_status
+                FROM sensor_data{where}
+                GROUP BY period, sensor_type
+            )
+        '''
+        if cursor_key:
+            query += ' WHERE ' + keyset_condition(key_columns, ('?', '?'), direction)
+            params += keyset_params(cursor_key)
+        query += f' ORDER BY period {order}, sensor_type {order} LIMIT ?'
+    else:
+        key_columns = ('timestamp', 'id')
+        query = f'''
+            SELECT timestamp, sensor_type, value, status, fan_status, rotor_status, pipe_status,
+                   fan_id, building_id, floor_number, id
+            FROM sensor_data{where}
+        '''
+        if cursor_key:
+            query += (' AND ' if where else ' WHERE ') + keyset_condition(key_columns, ('?', '?'), direction)
+            params += keyset_params(cursor_key)
+        query += f' ORDER BY timestamp {order}, id {order} LIMIT ?'
+    params.append(limit + 1)
 
-    # Append GROUP BY and ORDER BY clauses
-    if group_by:
-        query += f' {group_by}'
-
-    query += " ORDER BY timestamp DESC"
-    query += f" LIMIT {limit} OFFSET {offset}"
-
-    cursor.execute(query, tuple(params))
-    rows = cursor.fetchall()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, tuple(params))
+        rows = cursor.fetchall()
+        total_estimate = None
+        if not grouped:
+            total_estimate = sqlite_stat_estimate(lambda sql: conn.execute(sql).fetchall(),
+                                                  'sensor_data', filtered_columns)
+    finally:
+        conn.close()
+
+    if grouped:
+        key_of = lambda row: (row[0], row[1])
+        period_label = lambda period: storage.label(period, timeline)
+    else:
+        key_of = lambda row: (row[0], row[10])
+        period_label = lambda timestamp: timestamp
+    rows, next_cursor, prev_cursor = build_page(rows, limit, key_of, cursor_key, direction)
 
     data = [
         {
-                "timestamp": row[0],
-                "value": round(row[1], 2) if row[1] is not None else None,
-                "status": row[2],
-                "fan_status": row[3],
-                "rotor_status": row[4],
-                "pipe_status": row[5],
-                "fan_id": None,
-                "unit": SENSOR_UNITS.get(sensor_type, "")
+                "timestamp": period_label(row[0]),
+                "sensor_type": row[1],
+                "value": round(row[2], 2) if row[2] is not None else None,
+                "status": row[3],
+                "fan_status": row[4],
+                "rotor_status": row[5],
+                "pipe_status": row[6],
+                "fan_id": row[7] if len(row) > 7 else None,
+                "building_id": row[8] if len(row) > 8 else building_id,
+                "floor_number": row[9] if len(row) > 9 else floor_id,
+                "unit": SENSOR_UNITS.get(row[1], "")
         } for row in rows
     ]
 
-    return jsonify(data)
+    return window_headers(jsonify({
+        "rows": data,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "total_estimate": total_estimate,
+    }), start, end)
 
 
-# Prometheus metrics    
-@app.route('/metrics')
-def metrics():
-    return generate_latest()
+# Build WHERE clause and parameters for sensor_data export filters
+def build_export_filters(args):
+    filters = []
+    params = []
+    building_id = args.get('building_id', 'all')
+    floor_id = args.get('floor_id', 'all')
+    sensor_type = args.get('sensor_type', 'all')
+    if building_id != 'all':
+        filters.append('building_id = ?')
+        params.append(building_id)
+    if floor_id != 'all':
+        filters.append('floor_number = ?')
+        params.append(floor_id)
+    if sensor_type != 'all':
+        filters.append('sensor_type = ?')
+        params.append(sensor_type)
+    start = normalize_timestamp(args.get('start'))
+    end = normalize_timestamp(args.get('end'))
+    if start:
+        filters.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        filters.append('timestamp <= ?')
+        params.append(end)
+    where = ' WHERE ' + ' AND '.join(filters) if filters else ''
+    return where, params
+
+def count_export_rows(query, params):
+    conn = sqlite_connect(DB_PATH)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM ({query})', params).fetchone()[0]
+    finally:
+        conn.close()
 
-# Export data route (new route)
-@app.route('/export/<format>', methods=['GET'])
+# Export data route: CSV GETs stream directly; POSTs start a background job
+@app.route('/export/<format>', methods=['GET', 'POST'])
 @handle_db_error
 def export_data(format):
-    conn = get_db_connection()
-    df = pd.read_sql_query('SELECT * FROM sensor_data', conn)
-    conn.close()
-
+    try:
+        where, params = build_export_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    query = f'SELECT * FROM sensor_data{where} ORDER BY id'
+
+    if request.method == 'GET' and format in ('excel', 'pdf'):
+        # Jobs are only created by POST, so link prefetchers and crawlers cannot queue them
+        return jsonify({"error": f"Start a {format} export with POST"}), 405, {'Allow': 'POST'}
     if format == 'csv':
-        return export_csv(df)
+        if request.method == 'GET':
+            # Stream rows in chunks instead of materialising the table in pandas
+            return csv_response(iter_sqlite_rows(DB_PATH, query, params), 'sensor_data.csv',
+                                compress=wants_gzip(request.args))
+        job = jobs.submit('csv', 'sensor_data.csv', export_csv, query, params)
     elif format == 'excel':
-        return export_excel(df)
+        job = jobs.submit('excel', 'sensor_data.xlsx', export_excel, query, params)
     elif format == 'pdf':
-        return export_pdf(df)
+        period = request.args.get('period', 'monthly')
+        if period not in PERIODS:
+            return jsonify({"error": f"Unsupported period '{period}'"}), 400
+        try:
+            appendix_rows = int(request.args.get('appendix', 0))
+        except ValueError:
+            return jsonify({"error": "Invalid appendix row count"}), 400
+        job = jobs.submit('pdf', 'sensor_data.pdf', export_pdf, query, params, period, appendix_rows)
     else:
         return jsonify({"error": "Invalid format"}), 400
+    return jsonify(job.to_dict()), 202
 
 
-def export_csv(df):
-    file_path = "sensor_data.csv"
-    df.to_csv(file_path, index=False)
-    return send_file(file_path, as_attachment=True)
-
-def export_excel(df):
-    file_path = "sensor_data.xlsx"
-    df.to_excel(file_path, index=False)
-    return send_file(file_path, as_attachment=True)
-
-def export_pdf(df):
-    file_path = "sensor_data.pdf"
-    
-    # Create a PDF instance
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="Sensor Data Report", ln=True, align='C')
-    pdf.ln(10)
-
-    # Add table header
-    col_names = df.columns.tolist()
-    for col in col_names:
-        pdf.cell(40, 10, col, border=1)
-    pdf.ln()
-
-    # Add table rows
-    for _, row in df.iterrows():
-        for col in col_names:
-            pdf.cell(40, 10, str(row[col]), border=1)
-        pdf.ln()
-
-    # Output PDF to file
-    pdf.output(file_path)
-    
-    return send_file(file_path, as_attachment=True)
+def export_csv(job, query, params):
+    job.set_total(count_export_rows(query, params))
+    return write_csv_file(os.path.join(job.directory, job.filename),
+                          iter_sqlite_rows(DB_PATH, query, params), job.advance)
 
+def export_excel(job, query, params):
+    job.set_total(count_export_rows(query, params))
+    return write_xlsx_file(os.path.join(job.directory, job.filename),
+                           iter_sqlite_rows(DB_PATH, query, params), job.advance)
 
+def export_pdf(job, query, params, period, appendix_rows):
+    job.set_total(count_export_rows(query, params))
+    conn = sqlite_connect(DB_PATH)
+    try:
+        frames = pd.read_sql_query(query, conn, params=params, chunksize=CHUNK_SIZE)
+        summary, appendix = summarise(frames, ['building_id', 'floor_number'], period,
+                                      sensor_col='sensor_type', appendix_rows=appendix_rows,
+                                      progress=lambda rows: setattr(job, 'rows_done', rows))
+    finally:
+        conn.close()
+    path = os.path.join(job.directory, job.filename)
+    return write_report_pdf(path, "Sensor Data Report", summary,
+                            ['building_id', 'floor_number'], ['Building', 'Floor'], appendix)
+
+
+# Development server; serve.py runs the app for production
 if __name__ == '__main__':
     port = 5000
     url = f"http://127.0.0.1:{port}/"
     # Open the browser automatically after a short delay
     threading.Timer(1.0, lambda: webbrowser.open(url)).start()
-    start_http_server(8001)  # Prometheus metrics server
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,215 @@
+"""Reader for the cold-storage partitions written by retention.py.
+
+Archived rows live under <archive root>/<table>/building=<b>/month=<YYYY-MM>/,
+where the root is retention.archive_root() of the database they came from.
+Reads skip every building and month directory outside the request and load
+only the columns asked for, so a multi-year trend or a year-end export never
+touches the transactional database for history it no longer holds. The
+helpers below merge those rows with the live SQL table for ranges that span
+both. The archived extent comes from the manifest retention keeps, and rows
+present in both places are taken from the live table.
+"""
+
+import glob
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from aggregation import MINUTE_TIMELINES, RAW_TIMELINES, TIMESTAMP_FORMAT
+from retention import ARCHIVE_EXTENSIONS, RAW_TABLES, _partition_name, load_manifest
+
+_SUFFIXES = tuple(ARCHIVE_EXTENSIONS.values())
+
+ArchiveRange = namedtuple('ArchiveRange', ['start', 'end', 'live_ids'])
+
+# Label format per timeline, as produced by aggregation.bucket_expression()
+_LABEL_FORMATS = {
+    'hourly': '%Y-%m-%d %H:00:00',
+    'daily': '%Y-%m-%d',
+    'weekly': '%Y-%m-%d',
+    'monthly': '%Y-%m',
+    'yearly': '%Y',
+}
+
+
+def archive_extents(archive_dir, table):
+    """{building: {month: extent}} of what retention has archived for `table`.
+
+    Read from the manifest retention writes. Archives written before it had
+    one are described from their layout instead: whole months, with the ids
+    from the file names.
+    """
+    manifest = load_manifest(os.path.join(archive_dir, table))
+    if manifest is not None:
+        return manifest
+    extents = {}
+    for path in glob.glob(os.path.join(archive_dir, table, 'building=*', 'month=*', '*')):
+        if not path.endswith(_SUFFIXES):
+            continue
+        month_dir = os.path.dirname(path)
+        building = os.path.basename(os.path.dirname(month_dir))[len('building='):]
+        month = os.path.basename(month_dir)[len('month='):]
+        first, last = (int(value) for value in os.path.basename(path).split('.')[0].split('-'))
+        extent = extents.setdefault(building, {}).setdefault(month, {
+            'min_timestamp': f"{month}-01 00:00:00", 'max_timestamp': f"{month}-31 23:59:59",
+            'min_id': first, 'max_id': last})
+        extent['min_id'], extent['max_id'] = min(extent['min_id'], first), max(extent['max_id'], last)
+    return extents
+
+
+def archive_range(conn, archive_dir, table, building=None, start=None, end=None):
+    """Part of [start, end] the archive holds rows for, or None when SQL alone answers the request.
+
+    The bounds come from the archived extents, not from the live table, so
+    live rows older than the archive (backfills, late inserts) do not hide
+    archived ones. `live_ids` are the live rows inside those bounds. Rows a
+    retention run archived but did not delete yet are among them, and their
+    archived copies are skipped.
+    """
+    extents = archive_extents(archive_dir, table)
+    if building not in (None, ''):
+        extents = {name: months for name, months in extents.items() if name == _partition_name(building)}
+    overlapping = [extent for months in extents.values() for extent in months.values()
+                   if not (start and extent['max_timestamp'] < start) and not (end and extent['min_timestamp'] > end)]
+    if not overlapping:
+        return None
+    low = min(extent['min_timestamp'] for extent in overlapping)
+    high = max(extent['max_timestamp'] for extent in overlapping)
+    low, high = max(low, start) if start else low, min(high, end) if end else high
+    filters = ["timestamp >= :low", "timestamp <= :high", "id >= :min_id", "id <= :max_id"]
+    params = {'low': low, 'high': high, 'min_id': min(extent['min_id'] for extent in overlapping),
+              'max_id': max(extent['max_id'] for extent in overlapping)}
+    if building not in (None, ''):
+        filters.append(f"{RAW_TABLES.get(table, 'building')} = :building")
+        params['building'] = building
+    live_ids = conn.execute(text(f"SELECT id FROM {table} WHERE {' AND '.join(filters)}"), params).scalars().all()
+    return ArchiveRange(low, high, set(live_ids))
+
+
+def partitions(archive_dir, table, building=None, start=None, end=None):
+    """Archive files for `building` whose month overlaps [start, end], oldest month first."""
+    building_dirs = (os.path.join(archive_dir, table, f"building={_partition_name(building)}")
+                     if building not in (None, '') else os.path.join(archive_dir, table, 'building=*'))
+    first, last = (start or '')[:7], (end or '')[:7]
+    paths = []
+    for month_dir in glob.glob(os.path.join(building_dirs, 'month=*')):
+        month = os.path.basename(month_dir)[len('month='):]
+        if (first and month < first) or (last and month > last):
+            continue
+        for path in os.listdir(month_dir):
+            if path.endswith(_SUFFIXES):
+                paths.append((month, os.path.join(month_dir, path)))
+    return [path for _, path in sorted(paths)]
+
+
+def _read_file(path, columns, start, end):
+    if path.endswith(ARCHIVE_EXTENSIONS['parquet']):
+        # Row groups outside the range are skipped using the file's statistics
+        filters = [('timestamp', '>=', start)] if start else []
+        filters += [('timestamp', '<=', end)] if end else []
+        return pd.read_parquet(path, columns=columns, filters=filters or None)
+    usecols = None if columns is None else (lambda column: column in columns)
+    return pd.read_csv(path, usecols=usecols, dtype={'timestamp': str}, compression='gzip',
+                       float_precision='round_trip')
+
+
+def read_archive(archive_dir, table, columns, building=None, start=None, end=None, equals=None, exclude_ids=None):
+    """Archived rows of `table` in [start, end] as one DataFrame, reading only `columns`.
+
+    `equals` adds column == value filters (floor, sensor type, ...) and rows
+    whose id is in `exclude_ids` (e.g. ArchiveRange.live_ids) are skipped.
+    """
+    frames = list(iter_archive(archive_dir, table, columns, building, start, end, equals, exclude_ids))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def iter_archive(archive_dir, table, columns, building=None, start=None, end=None, equals=None, exclude_ids=None):
+    """Yield one DataFrame per archived month, rows in id order, filtered like read_archive().
+
+    `columns=None` reads every archived column.
+    """
+    equals = {column: value for column, value in (equals or {}).items() if value not in (None, '')}
+    wanted = None if columns is None else list(dict.fromkeys(['id', 'timestamp'] + list(columns) + list(equals)))
+    by_month = {}
+    for path in partitions(archive_dir, table, building, start, end):
+        by_month.setdefault(os.path.basename(os.path.dirname(path)), []).append(path)
+    for month in sorted(by_month):
+        frame = pd.concat([_read_file(path, wanted, start, end) for path in by_month[month]], ignore_index=True)
+        mask = np.ones(len(frame), dtype=bool)
+        if start:
+            mask &= (frame['timestamp'] >= start).to_numpy()
+        if end:
+            mask &= (frame['timestamp'] <= end).to_numpy()
+        for column, value in equals.items():
+            mask &= (frame[column].astype(str) == str(value)).to_numpy()
+        if exclude_ids:
+            mask &= ~frame['id'].isin(exclude_ids).to_numpy()
+        # A retention run interrupted between archiving and deleting may have written rows twice
+        frame = frame[mask].drop_duplicates('id').sort_values('id')
+        if len(frame):
+            yield frame if columns is None else frame.reindex(columns=list(columns))
+
+
+def bucket_labels(timestamps, timeline):
+    """Bucket labels for stored timestamp strings, matching aggregation.bucket_expression()."""
+    if timeline in RAW_TIMELINES:
+        return timestamps.astype(str)
+    parsed = pd.to_datetime(timestamps, format='mixed')
+    if timeline in MINUTE_TIMELINES:
+        return parsed.dt.floor(f"{MINUTE_TIMELINES[timeline]}min").dt.strftime(TIMESTAMP_FORMAT)
+    if timeline == 'weekly':
+        parsed = parsed.dt.normalize() - pd.to_timedelta(parsed.dt.weekday, unit='D')
+    return parsed.dt.strftime(_LABEL_FORMATS[timeline])
+
+
+def archive_stats(archive_dir, table, value_column, timeline, building=None, start=None, end=None, equals=None,
+                  exclude_ids=None):
+    """Rows (label, min, max, sum, count) over archived rows, like Storage.bucket_stats()."""
+    frame = read_archive(archive_dir, table, ['timestamp', value_column], building, start, end, equals, exclude_ids)
+    values = pd.to_numeric(frame[value_column], errors='coerce')
+    grouped = values.groupby(bucket_labels(frame['timestamp'], timeline).to_numpy())
+    stats = grouped.agg(['min', 'max', 'sum', 'count'])
+    return list(stats.itertuples(name=None))
+
+
+def merge_stats(*parts):
+    """Combine partial (label, min, max, sum, count) rows and return them sorted by label."""
+    merged = {}
+    for rows in parts:
+        for label, low, high, total, count in rows:
+            if not count:
+                continue
+            if label in merged:
+                m_low, m_high, m_total, m_count = merged[label]
+                merged[label] = (min(m_low, low), max(m_high, high), m_total + total, m_count + count)
+            else:
+                merged[label] = (low, high, total, count)
+    return [(label,) + merged[label] for label in sorted(merged)]
+
+
+def finish_stats(rows, aggregation):
+    """(label, value) rows for `aggregation` from merged partial aggregates."""
+    pick = {
+        'min': lambda low, high, total, count: low,
+        'max': lambda low, high, total, count: high,
+        'avg': lambda low, high, total, count: total / count,
+    }[aggregation]
+    return [(label, float(pick(*stats))) for label, *stats in rows]
+
+
+def with_archive(chunks, frames):
+    """Put archived rows ahead of a (columns, rows) chunk stream from exports.iter_*_rows().
+
+    Archived rows are aligned to the SQL columns; missing values become None.
+    """
+    columns, rows = next(chunks)
+    yield columns, rows
+    for frame in frames:
+        frame = frame.reindex(columns=columns).astype(object)
+        yield columns, list(frame.where(frame.notna(), None).itertuples(index=False, name=None))
+    yield from chunks
@@ -0,0 +1,516 @@
+"""Endpoint benchmarks against synthetic simulation_data and sensor_data databases.
+
+Datasets are generated once per scale under BENCH_DATA_DIR and reused by
+later runs. simulation_data rows come from the simulator's engine
+(project intenship/main.py), and sensor_data rows use the value ranges of
+data_generator.py. Each route is then requested through the Flask test
+client of the app that serves it: app.py for simulation_data and
+application.py for sensor_data. The report records the cold (first) latency,
+warm p50/p95, bytes returned and peak RSS per route. It is written as JSON
+so that two runs can be compared.
+
+The concurrency command starts each app twice as a real HTTP server. One is
+its development server (app.run() as `python app.py` runs it) and the other
+is serve.py. For each server it reports the throughput and latency of
+read-only dashboard requests at several numbers of concurrent clients.
+
+Usage:
+    python benchmark.py run --scales 1e4 1e5 1e6 [--repeat 5] [--output bench.json]
+    python benchmark.py run --scales 1e7 --max-export-rows 1e6 --routes /data /tabular-data
+    python benchmark.py compare bench_before.json bench_after.json
+    python benchmark.py concurrency --scales 1e5 --clients 1 8 32 [--duration 10] [--workers 4 --threads 8]
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import numpy as np
+
+from aggregation import TIMESTAMP_FORMAT, to_epoch
+from data_generator import INSERT_SQL, SENSOR_TYPES, VALUE_RANGES, create_database, unit_keys
+
+BENCH_DATA_DIR = os.environ.get('BENCH_DATA_DIR', 'bench_data')
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SIMULATOR_PATH = os.path.join(REPO_DIR, 'project intenship', 'main.py')
+
+# Rows written per executemany while generating
+GENERATE_BATCH = 50000
+# Seconds between generated samples of one unit
+SAMPLE_INTERVAL = 60
+# Units per dataset: buildings x floors (x sensor types for sensor_data)
+BUILDINGS, FLOORS = 10, 10
+
+# (label, method, path) per app; exports are timed from submission to the downloaded artefact
+APP_ROUTES = [
+    ('buildings', 'GET', '/buildings'),
+    ('sensors', 'GET', '/sensors'),
+    ('floors', 'GET', '/floors?building=1'),
+    ('data raw', 'GET', '/data/sensor/ra_temp'),
+    ('data hourly avg', 'GET', '/data/sensor/ra_temp?timeline=hourly&aggregation=avg'),
+    ('data daily max b1f1', 'GET', '/data/sensor/ra_temp?building=1&floor=1&timeline=daily&aggregation=max'),
+    ('data batch hourly', 'GET', '/data/batch?sensors=ra_temp,sa_temp,chws_temp&timeline=hourly&aggregation=avg'),
+    ('export csv stream', 'GET', '/export/csv'),
+    ('export csv job', 'POST', '/export/csv'),
+    ('export excel job', 'POST', '/export/excel'),
+    ('export pdf job', 'POST', '/export/pdf?period=daily'),
+]
+
+APPLICATION_ROUTES = [
+    ('buildings', 'GET', '/buildings'),
+    ('sensor types', 'GET', '/sensor-types'),
+    ('tabular raw', 'GET', '/tabular-data'),
+    ('tabular daily avg', 'GET', '/tabular-data?timeline=daily&aggregation=avg'),
+    ('data hourly avg', 'GET', f"/data/{quote('Building 1')}/all/temperature/hourly/avg"),
+    ('export csv stream', 'GET', '/export/csv'),
+    ('export csv job', 'POST', '/export/csv'),
+    ('export excel job', 'POST', '/export/excel'),
+    ('export pdf job', 'POST', '/export/pdf?period=daily'),
+]
+
+# Read-only requests cycled through by every client of the concurrency benchmark
+CONCURRENCY_ROUTES = {
+    'app': ['/buildings', '/data/sensor/ra_temp?timeline=hourly&aggregation=avg',
+            '/data/sensor/ra_temp?building=1&floor=1&timeline=daily&aggregation=max', '/floors?building=1'],
+    'application': ['/buildings', '/tabular-data', '/tabular-data?timeline=daily&aggregation=avg',
+                    f"/data/{quote('Building 1')}/all/temperature/hourly/avg"],
+}
+# debug= of each app's development server (app.py runs with the debugger)
+DEV_SERVER_DEBUG = {'app': True, 'application': False}
+SERVER_START_TIMEOUT = 60
+
+
+def load_simulator():
+    """The simulator module (its folder name has a space, so it is loaded by path)."""
+    spec = importlib.util.spec_from_file_location('hvac_simulator', SIMULATOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def dataset_path(table, rows):
+    return os.path.join(BENCH_DATA_DIR, f"{table}_{rows:.0e}.db".replace('+', ''))
+
+
+def row_count(path, table):
+    if not os.path.exists(path):
+        return 0
+    with sqlite3.connect(path) as conn:
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+
+
+def _bulk_connection(path):
+    conn = sqlite3.connect(path)
+    # Throwaway data: no fsync while loading (the schema already put the file in WAL mode)
+    conn.execute('PRAGMA synchronous=OFF')
+    return conn
+
+
+def generate_simulation_data(path, rows, seed=0):
+    """simulation_data with `rows` rows from the simulator engine, ending now."""
+    simulator = load_simulator()
+    simulator.make_engine(f"sqlite:///{path}").dispose()
+    engine = simulator.SimulationEngine.grid(BUILDINGS, FLOORS, seed)
+    columns = ['timestamp', 'ts', 'building', 'floor'] + list(engine.state)
+    insert = f"INSERT INTO simulation_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    ticks = -(-rows // len(engine))
+    now = datetime.now().replace(microsecond=0)
+    clock = now - timedelta(seconds=SAMPLE_INTERVAL * ticks)
+    pending, written = [], 0
+    with _bulk_connection(path) as conn:
+        while written < rows:
+            clock += timedelta(seconds=SAMPLE_INTERVAL)
+            engine.step(SAMPLE_INTERVAL, clock)
+            values = np.column_stack([engine.state[column] for column in engine.state]).round(3).tolist()
+            timestamp = clock.strftime(TIMESTAMP_FORMAT)
+            ts = to_epoch(timestamp)
+            take = min(len(values), rows - written)
+            pending += [(timestamp, ts, b, f, *row) for b, f, row in
+                        zip(engine.building.tolist()[:take], engine.floor.tolist()[:take], values[:take])]
+            written += take
+            if len(pending) >= GENERATE_BATCH or written >= rows:
+                conn.executemany(insert, pending)
+                conn.commit()
+                pending = []
+        conn.execute('ANALYZE')
+
+
+def generate_sensor_data(path, rows, seed=0):
+    """sensor_data with `rows` rows in data_generator.py's value ranges, ending now."""
+    create_database(path)
+    rng = np.random.default_rng(seed)
+    units = unit_keys(BUILDINGS, FLOORS)
+    buildings = [b for b, _, _ in units]
+    floors = [f for _, f, _ in units]
+    sensor_types = [s for _, _, s in units]
+    low = np.array([VALUE_RANGES.get(s, (0, 0))[0] for s in sensor_types])
+    high = np.array([VALUE_RANGES.get(s, (0, 0))[1] for s in sensor_types])
+    digital = np.array([s == 'digital' for s in sensor_types])
+    on_off = np.array(['ON', 'OFF'], dtype=object)
+    fans = np.array([None, 'Fan A', 'Fan B', 'Fan C'], dtype=object)
+
+    ticks = -(-rows // len(units))
+    clock = datetime.now().replace(microsecond=0) - timedelta(seconds=SAMPLE_INTERVAL * ticks)
+    pending, written = [], 0
+    with _bulk_connection(path) as conn:
+        while written < rows:
+            clock += timedelta(seconds=SAMPLE_INTERVAL)
+            n = len(units)
+            values = np.where(digital, rng.integers(0, 2, n), rng.uniform(low, high)).round(3).tolist()
+            status = np.where(digital, on_off[rng.integers(0, 2, n)], None).tolist()
+            flags = on_off[rng.integers(0, 2, (3, n))].tolist()
+            fan_id = np.where(digital, fans[rng.integers(0, 4, n)], None).tolist()
+            timestamp = clock.strftime(TIMESTAMP_FORMAT)
+            ts = to_epoch(timestamp)
+            take = min(n, rows - written)
+            pending += [(buildings[i], floors[i], sensor_types[i], timestamp, ts, values[i], status[i],
+                         flags[0][i], flags[1][i], flags[2][i], fan_id[i]) for i in range(take)]
+            written += take
+            if len(pending) >= GENERATE_BATCH or written >= rows:
+                conn.executemany(INSERT_SQL, pending)
+                conn.commit()
+                pending = []
+        conn.execute('ANALYZE')
+
+
+GENERATORS = {'simulation_data': generate_simulation_data, 'sensor_data': generate_sensor_data}
+
+
+def ensure_dataset(table, rows, regenerate=False):
+    """Path of the `table` dataset with `rows` rows, generating it when missing or stale."""
+    os.makedirs(BENCH_DATA_DIR, exist_ok=True)
+    path = dataset_path(table, rows)
+    if regenerate or row_count(path, table) != rows:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        started = time.perf_counter()
+        GENERATORS[table](path, rows)
+        print(f"Generated {path} ({rows} rows) in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return path
+
+
+class RssSampler:
+    """Peak resident set size while a block runs, sampled from /proc (Linux) or getrusage (0 on Windows)."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def current(self):
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * self._page
+        except OSError:
+            try:
+                import resource
+            except ImportError:
+                # Windows: not measured
+                return 0
+            # Lifetime peak only: KiB on Linux, bytes on macOS
+            scale = 1 if sys.platform == 'darwin' else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def request_once(client, method, path, job_timeout):
+    """(status, bytes) of one request; export jobs are polled and their artefact downloaded."""
+    response = client.open(path, method=method)
+    if response.status_code != 202:
+        return response.status_code, len(response.data)
+    job = response.get_json()
+    deadline = time.monotonic() + job_timeout
+    while job['status'] not in ('done', 'failed'):
+        if time.monotonic() > deadline:
+            return 504, 0
+        time.sleep(0.01)
+        job = client.get(job['status_url']).get_json()
+    if job['status'] == 'failed':
+        return 500, 0
+    download = client.get(job['download_url'])
+    return download.status_code, len(download.data)
+
+
+def time_route(client, method, path, repeat, job_timeout):
+    latencies, status, size = [], None, 0
+    with RssSampler() as rss:
+        for _ in range(repeat + 1):
+            started = time.perf_counter()
+            status, size = request_once(client, method, path, job_timeout)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                break
+    to_ms = lambda seconds: round(seconds * 1000, 2)
+    warm = np.array(latencies[1:] or latencies)
+    return {
+        'status': status,
+        'cold_ms': to_ms(latencies[0]),
+        'p50_ms': to_ms(np.percentile(warm, 50)),
+        'p95_ms': to_ms(np.percentile(warm, 95)),
+        'bytes': size,
+        'peak_rss_mb': round(rss.peak / 2 ** 20, 1) if rss.peak else None,
+    }
+
+
+def app_client(path):
+    """Test client for app.py, connected to the simulation_data dataset `path`."""
+    import app as dashboard
+    client = dashboard.app.test_client()
+    with client.session_transaction() as session:
+        session['db_url'] = f"sqlite:///{os.path.abspath(path)}"
+    return client
+
+
+def application_client(path):
+    """Test client for application.py, pointed at the sensor_data dataset `path`."""
+    import application
+    application.DB_PATH = os.path.abspath(path)
+    return application.app.test_client()
+
+
+SUITES = [
+    ('simulation_data', 'app', app_client, APP_ROUTES),
+    ('sensor_data', 'application', application_client, APPLICATION_ROUTES),
+]
+
+
+def run(scales, repeat=5, routes=None, max_export_rows=1e6, job_timeout=600, regenerate=False):
+    meta, results = run_metadata(repeat), []
+    for rows in scales:
+        for table, app_name, make_client, suite in SUITES:
+            path = ensure_dataset(table, rows, regenerate)
+            client = make_client(path)
+            for label, method, route in suite:
+                if routes and not any(route.startswith(prefix) for prefix in routes):
+                    continue
+                result = {'dataset': table, 'rows': rows, 'app': app_name, 'route': label,
+                          'method': method, 'path': route}
+                if route.startswith('/export') and rows > max_export_rows:
+                    result['skipped'] = f"more than {max_export_rows:.0e} rows"
+                else:
+                    result.update(time_route(client, method, route, repeat, job_timeout))
+                    print(f"{table:16} {rows:>10} {label:22} p50 {result['p50_ms']:>9} ms  "
+                          f"p95 {result['p95_ms']:>9} ms  {result['bytes']:>11} B", file=sys.stderr)
+                results.append(result)
+    return {'meta': meta, 'results': results}
+
+
+def run_metadata(repeat):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'started': datetime.now().strftime(TIMESTAMP_FORMAT),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'units': {'buildings': BUILDINGS, 'floors': FLOORS, 'sensor_types': len(SENSOR_TYPES)},
+    }
+
+
+def compare(before, after):
+    """Rows of (dataset, rows, route, before p50, after p50, ratio) for routes timed in both runs."""
+    key = lambda result: (result['dataset'], result['rows'], result['route'])
+    previous = {key(result): result for result in before['results'] if 'p50_ms' in result}
+    rows = []
+    for result in after['results']:
+        old = previous.get(key(result))
+        if old and 'p50_ms' in result:
+            ratio = round(result['p50_ms'] / old['p50_ms'], 2) if old['p50_ms'] else None
+            rows.append(key(result) + (old['p50_ms'], result['p50_ms'], ratio))
+    return rows
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def http_get(port, path, headers=None, method='GET', body=None):
+    """(status, body, response headers) of one request on a fresh connection."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read(), response.headers
+    finally:
+        conn.close()
+
+
+def start_server(app_name, dataset, server, workers, threads):
+    """(process, port) of `app_name` served by its dev server or serve.py, once it answers."""
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, SENSOR_DB_PATH=os.path.abspath(dataset))
+    if server == 'dev':
+        # The reloader only adds a watcher process, so it is left out
+        code = (f"import {app_name}; "
+                f"{app_name}.app.run(port={port}, debug={DEV_SERVER_DEBUG[app_name]}, use_reloader=False)")
+        command = [sys.executable, '-c', code]
+    else:
+        command = [sys.executable, os.path.join(REPO_DIR, 'serve.py'), app_name, '--bind', f"127.0.0.1:{port}",
+                   '--workers', str(workers), '--threads', str(threads)]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} server for {app_name} exited with {process.returncode}")
+        try:
+            http_get(port, '/metrics')
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{server} server for {app_name} did not start")
+
+
+def session_headers(app_name, port, dataset):
+    """Headers for a client of `app_name`: app.py needs a session connected to the dataset."""
+    if app_name != 'app':
+        return {}
+    body = json.dumps({'type': 'sqlite', 'database': os.path.abspath(dataset)[:-len('.db')]})
+    status, _, headers = http_get(port, '/configure-db', {'Content-Type': 'application/json'}, 'POST', body)
+    if status != 200:
+        raise RuntimeError(f"/configure-db answered {status}")
+    return {'Cookie': headers['Set-Cookie'].split(';')[0]}
+
+
+def load_test(port, paths, clients, duration, headers):
+    """Throughput and latency of `clients` threads requesting `paths` in turn for `duration` seconds."""
+    latencies, errors = [[] for _ in range(clients)], [0] * clients
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        request = index
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                status = http_get(port, paths[request % len(paths)], headers)[0]
+            except OSError:
+                status = 599
+            if status >= 400:
+                errors[index] += 1
+            latencies[index].append(time.perf_counter() - started)
+            request += 1
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    timings = np.concatenate([np.array(chunk) for chunk in latencies]) * 1000
+    return {
+        'clients': clients,
+        'requests': len(timings),
+        'errors': sum(errors),
+        'requests_per_s': round(len(timings) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(timings, 50)), 2) if len(timings) else None,
+        'p95_ms': round(float(np.percentile(timings, 95)), 2) if len(timings) else None,
+    }
+
+
+def concurrency(scales, clients=(1, 8, 32), duration=10, workers=4, threads=8, regenerate=False):
+    meta, results = run_metadata(None), []
+    meta.update({'duration_s': duration, 'workers': workers, 'threads': threads, 'cpus': os.cpu_count()})
+    for rows in scales:
+        for table, app_name, _, _ in SUITES:
+            path = ensure_dataset(table, rows, regenerate)
+            paths = CONCURRENCY_ROUTES[app_name]
+            for server in ('dev', 'serve'):
+                process, port = start_server(app_name, path, server, workers, threads)
+                try:
+                    headers = session_headers(app_name, port, path)
+                    # Warm the response caches and the workers' first connections
+                    load_test(port, paths, max(clients), 1, headers)
+                    for count in clients:
+                        result = {'dataset': table, 'rows': rows, 'app': app_name, 'server': server}
+                        result.update(load_test(port, paths, count, duration, headers))
+                        print(f"{table:16} {rows:>10} {server:6} {count:>4} clients "
+                              f"{result['requests_per_s']:>9} req/s  p50 {result['p50_ms']:>9} ms  "
+                              f"p95 {result['p95_ms']:>9} ms  {result['errors']} errors", file=sys.stderr)
+                        results.append(result)
+                finally:
+                    process.terminate()
+                    process.wait()
+    return {'meta': meta, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard endpoints")
+    parser.add_argument('command', choices=['run', 'compare', 'concurrency'])
+    parser.add_argument('files', nargs='*', help="compare: the two JSON reports")
+    parser.add_argument('--scales', nargs='+', type=float, default=[1e4, 1e5, 1e6], help="rows per dataset")
+    parser.add_argument('--repeat', type=int, default=5, help="warm requests per route after the first")
+    parser.add_argument('--routes', nargs='*', default=None, help="only routes starting with these prefixes")
+    parser.add_argument('--max-export-rows', type=float, default=1e6, help="skip exports on larger datasets")
+    parser.add_argument('--job-timeout', type=float, default=600)
+    parser.add_argument('--regenerate', action='store_true', help="rebuild datasets even if present")
+    parser.add_argument('--clients', nargs='+', type=int, default=[1, 8, 32],
+                        help="concurrency: concurrent clients per measurement")
+    parser.add_argument('--duration', type=float, default=10, help="concurrency: seconds per measurement")
+    parser.add_argument('--workers', type=int, default=4, help="concurrency: serve.py worker processes")
+    parser.add_argument('--threads', type=int, default=8, help="concurrency: serve.py threads per worker")
+    parser.add_argument('--output', default=None, help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        if len(args.files) != 2:
+            parser.error("compare takes two report files")
+        reports = []
+        for path in args.files:
+            with open(path) as report:
+                reports.append(json.load(report))
+        for dataset, rows, route, old, new, ratio in compare(*reports):
+            print(f"{dataset:16} {rows:>10} {route:22} {old:>9} -> {new:>9} ms  x{ratio}")
+        return
+
+    scales = [int(rows) for rows in args.scales]
+    if args.command == 'concurrency':
+        report = concurrency(scales, args.clients, args.duration, args.workers, args.threads, args.regenerate)
+    else:
+        report = run(scales, args.repeat, args.routes, args.max_export_rows, args.job_timeout, args.regenerate)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
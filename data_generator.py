@@ -1,19 +1,51 @@
+import argparse
 import sqlite3
 import random
 from datetime import datetime, timedelta
 import time
 
-def create_database():
+from aggregation import to_epoch
+
+DB_PATH = 'sensor_data.db'
+
+INSERT_SQL = '''
+    INSERT INTO sensor_data
+    (building_id, floor_number, sensor_type, timestamp, ts, value, status, fan_status, rotor_status, pipe_status, fan_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SENSOR_TYPES = ['temperature', 'humidity', 'pressure', 'digital']
+ON_OFF = ('ON', 'OFF')
+
+# Value ranges per sensor type
+VALUE_RANGES = {
+    'temperature': (15.0, 30.0),  # °C
+    'humidity': (40.0, 60.0),  # %
+    'pressure': (990.0, 1020.0),  # hPa
+}
+
+def configure_connection(conn):
+    """Apply write-friendly pragmas: WAL journal, relaxed fsync and a larger page cache."""
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-65536')  # 64 MiB
+    conn.execute('PRAGMA temp_store=MEMORY')
+
+def create_database(db_path=DB_PATH):
     """Create the database and the sensor_data table."""
-    with sqlite3.connect('sensor_data.db') as conn:
+    with sqlite3.connect(db_path) as conn:
+        # Lets retention.py hand freed pages back in small steps (only takes effect on a new file)
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        configure_connection(conn)
         cursor = conn.cursor()
-        cursor.execute(''' 
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS sensor_data (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 building_id TEXT,
                 floor_number INTEGER,
                 sensor_type TEXT,
                 timestamp TEXT,
+                ts INTEGER,
                 value REAL,
                 status TEXT,
                 fan_status TEXT,
@@ -22,69 +54,177 @@ def create_database():
                 fan_id TEXT
             );
         ''')
+        # Dashboard queries filter on sensor type, building and floor and order by timestamp
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS ix_sensor_data_type_building_floor_timestamp
+            ON sensor_data (sensor_type, building_id, floor_number, timestamp);
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS ix_sensor_data_timestamp ON sensor_data (timestamp);
+        ''')
+        # Integer epoch seconds next to the timestamp string; older databases get the column here
+        # and existing rows are filled by `python storage.py epoch sqlite:///sensor_data.db`
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(sensor_data)')]
+        if 'ts' not in columns:
+            cursor.execute('ALTER TABLE sensor_data ADD COLUMN ts INTEGER')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS ix_sensor_data_type_building_floor_ts
+            ON sensor_data (sensor_type, building_id, floor_number, ts);
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS ix_sensor_data_ts ON sensor_data (ts);
+        ''')
         conn.commit()
 
-def generate_sample_data():
-    """Generate sample sensor data every second."""
-    # Sample buildings, floors, and sensor types
-    buildings = ['Building 1', 'Building 2', 'Building 3']
-    floors = [1, 2, 3, 4]
-    sensor_types = ['temperature', 'humidity', 'pressure', 'digital']
+def sample_row(building, floor, sensor_type, timestamp, ts):
+    """Build one sample sensor_data row (`ts` is `timestamp` in epoch seconds)."""
+    # Generate sample value based on sensor type
+    if sensor_type == 'digital':
+        value = random.choice([0, 1])  # Digital flag as numeric value
+    elif sensor_type in VALUE_RANGES:
+        low, high = VALUE_RANGES[sensor_type]
+        value = random.uniform(low, high)
+    else:
+        value = None
+
+    # For digital sensors, set status and fan_id; for non-digital, leave as None
+    # (getrandbits keeps the hot loop cheap when generating thousands of rows per batch)
+    status = ON_OFF[random.getrandbits(1)] if sensor_type == 'digital' else None
+    fan_status = ON_OFF[random.getrandbits(1)]
+    rotor_status = ON_OFF[random.getrandbits(1)]
+    pipe_status = ON_OFF[random.getrandbits(1)]
+    fan_id = random.choice([None, 'Fan A', 'Fan B', 'Fan C']) if sensor_type == 'digital' else None
+    return (building, floor, sensor_type, timestamp, ts, value, status,
+            fan_status, rotor_status, pipe_status, fan_id)
+
+def unit_keys(buildings, floors):
+    """All (building, floor, sensor_type) combinations for N buildings x M floors."""
+    return [(f'Building {b}', f, sensor_type)
+            for b in range(1, buildings + 1)
+            for f in range(1, floors + 1)
+            for sensor_type in SENSOR_TYPES]
+
+def generate_sample_data(db_path=DB_PATH, buildings=3, floors=4, interval=1.0, batch_size=1000):
+    """Generate one sample per building/floor/sensor every `interval` seconds."""
+    units = unit_keys(buildings, floors)
 
     # Open the connection once and use it throughout
-    with sqlite3.connect('sensor_data.db') as conn:
+    with sqlite3.connect(db_path) as conn:
+        configure_connection(conn)
         cursor = conn.cursor()
         while True:
             # Get the current timestamp (current time for each entry)
-            current_timestamp = datetime.now()
-
-            # For each cycle, generate a sample row for each building, floor, and sensor type
-            for building in buildings:
-                for floor in floors:
-                    for sensor_type in sensor_types:
-                        # Generate sample value based on sensor type
-                        if sensor_type == 'temperature':
-                            value = random.uniform(15.0, 30.0)  # °C
-                        elif sensor_type == 'humidity':
-                            value = random.uniform(40.0, 60.0)  # %
-                        elif sensor_type == 'pressure':
-                            value = random.uniform(990.0, 1020.0)  # hPa
-                        elif sensor_type == 'digital':
-                            value = random.choice([0, 1])  # Digital flag as numeric value
-                        else:
-                            value = None
-
-                        # For digital sensors, set status and fan_id; for non-digital, leave as None
-                        status = random.choice(['ON', 'OFF']) if sensor_type == 'digital' else None
-                        fan_status = random.choice(['ON', 'OFF'])
-                        rotor_status = random.choice(['ON', 'OFF'])
-                        pipe_status = random.choice(['ON', 'OFF'])
-                        fan_id = random.choice([None, 'Fan A', 'Fan B', 'Fan C']) if sensor_type == 'digital' else None
-
-                        # Insert the sample row into sensor_data table
-                        cursor.execute('''
-                            INSERT INTO sensor_data 
-                            (building_id, floor_number, sensor_type, timestamp, value, status, fan_status, rotor_status, pipe_status, fan_id)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            building,
-                            floor,
-                            sensor_type,
-                            current_timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                            value,
-                            status,
-                            fan_status,
-                            rotor_status,
-                            pipe_status,
-                            fan_id
-                        ))
+            current_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            ts = to_epoch(current_timestamp)
+            rows = [sample_row(b, f, s, current_timestamp, ts) for b, f, s in units]
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(INSERT_SQL, rows[start:start + batch_size])
             # Commit the data after each cycle
             conn.commit()
 
-            # Sleep for 1 second before generating the next set of data
-            time.sleep(1)
+            # Sleep before generating the next set of data
+            time.sleep(interval)
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def load_test(db_path=DB_PATH, buildings=100, floors=10, rate=10000, duration=30.0,
+              batch_size=5000, commit_interval=1.0):
+    """Insert rows for N buildings x M floors at a target rows/s and report throughput.
+
+    Rows are written with executemany in batches of `batch_size` and committed
+    every `commit_interval` seconds (0 commits after every batch).
+    """
+    units = unit_keys(buildings, floors)
+    commit_latencies = []
+    inserted = 0
+    unit_index = 0
+
+    with sqlite3.connect(db_path) as conn:
+        configure_connection(conn)
+        cursor = conn.cursor()
+        start = time.perf_counter()
+        last_commit = start
+        pending = 0
+        while True:
+            now = time.perf_counter()
+            elapsed = now - start
+            if elapsed >= duration:
+                break
+            due = min(int(rate * elapsed) - inserted, batch_size)
+            if due <= 0:
+                # Ahead of the target rate: wait for the next batch to become due
+                time.sleep(min(batch_size / rate, duration - elapsed, 0.05))
+                continue
+
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            ts = to_epoch(timestamp)
+            rows = []
+            for _ in range(due):
+                building, floor, sensor_type = units[unit_index]
+                rows.append(sample_row(building, floor, sensor_type, timestamp, ts))
+                unit_index = (unit_index + 1) % len(units)
+            cursor.executemany(INSERT_SQL, rows)
+            inserted += due
+            pending += due
+
+            if time.perf_counter() - last_commit >= commit_interval:
+                commit_start = time.perf_counter()
+                conn.commit()
+                last_commit = time.perf_counter()
+                commit_latencies.append(last_commit - commit_start)
+                pending = 0
+
+        if pending:
+            commit_start = time.perf_counter()
+            conn.commit()
+            commit_latencies.append(time.perf_counter() - commit_start)
+        elapsed = time.perf_counter() - start
+
+    to_ms = lambda seconds: None if seconds is None else round(seconds * 1000, 2)
+    return {
+        'units': len(units),
+        'target_rows_per_s': rate,
+        'rows': inserted,
+        'seconds': round(elapsed, 2),
+        'achieved_rows_per_s': round(inserted / elapsed, 1) if elapsed else None,
+        'commits': len(commit_latencies),
+        'commit_ms_p50': to_ms(percentile(commit_latencies, 50)),
+        'commit_ms_p95': to_ms(percentile(commit_latencies, 95)),
+        'commit_ms_p99': to_ms(percentile(commit_latencies, 99)),
+        'commit_ms_max': to_ms(max(commit_latencies) if commit_latencies else None),
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate sample HVAC sensor data")
+    parser.add_argument('--db', default=DB_PATH, help="SQLite database file")
+    parser.add_argument('--buildings', type=int, default=3)
+    parser.add_argument('--floors', type=int, default=4)
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="seconds between sample cycles (continuous mode)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="rows per executemany call")
+    parser.add_argument('--load-test', action='store_true',
+                        help="insert at a target rate for a fixed duration and report throughput")
+    parser.add_argument('--rate', type=int, default=10000, help="target rows/s (load test)")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to run (load test)")
+    parser.add_argument('--commit-interval', type=float, default=1.0,
+                        help="seconds between commits (load test, 0 = every batch)")
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    create_database()        # Create the database and table
-    generate_sample_data()   # Continuously generate and insert sample data every second
-    print("Database and sample data generation started...")
+    args = parse_args()
+    create_database(args.db)        # Create the database and table
+    if args.load_test:
+        report = load_test(args.db, args.buildings, args.floors, args.rate, args.duration,
+                           args.batch_size, args.commit_interval)
+        for key, value in report.items():
+            print(f"{key}: {value}")
+    else:
+        print("Database and sample data generation started...")
+        # Continuously generate and insert sample data every interval
+        generate_sample_data(args.db, args.buildings, args.floors, args.interval, args.batch_size)
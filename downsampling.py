@@ -0,0 +1,117 @@
+"""Chart downsampling: bound the points sent to the browser for long time ranges."""
+
+import numpy as np
+import pandas as pd
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+# Fewer points than this cannot keep both endpoints plus a shape
+MIN_POINTS = 3
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of `threshold` visually significant points.
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the previously kept point and
+    the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, threshold):
+    """Indices of the minimum and maximum of each of ~threshold/2 equal-count buckets."""
+    n = len(y)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+    buckets = max(1, (threshold - 2) // 2)
+    bucket = np.arange(n) * buckets // n
+    # Sorted by bucket, then value: each bucket's first entry is its min, its last its max
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket, np.arange(buckets))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([order[starts], order[ends], [0, n - 1]]))
+
+
+def shared_indices(timestamps, columns, max_points, method='lttb'):
+    """Row indices that keep every column's significant points on one shared time axis.
+
+    Each of the k columns is sampled to ~max_points/k points and the picks are
+    merged, so all series are downsampled the same way and stay aligned.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unsupported downsample method '{method}'")
+    n = len(timestamps)
+    if n <= max_points or not columns:
+        return np.arange(n)
+    per_column = max(MIN_POINTS, max_points // len(columns))
+    x = None
+    if method == 'lttb':
+        x = pd.to_datetime(pd.Series(timestamps, dtype=object), format='mixed').to_numpy('datetime64[ns]')
+        x = x.astype('int64').astype(float)
+    keep = [np.array([0, n - 1])]
+    for column in columns:
+        y = pd.to_numeric(pd.Series(column, dtype=object), errors='coerce').to_numpy(float)
+        present = np.flatnonzero(~np.isnan(y))
+        if method == 'lttb':
+            picked = lttb_indices(x[present], y[present], per_column)
+        else:
+            picked = minmax_indices(y[present], per_column)
+        keep.append(present[picked])
+    return np.unique(np.concatenate(keep))
+
+
+def parse_max_points(value):
+    """`max_points` query parameter: None when absent, otherwise an int >= MIN_POINTS."""
+    if value in (None, ''):
+        return None
+    try:
+        points = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid max_points '{value}'")
+    if points < MIN_POINTS:
+        raise ValueError(f"max_points must be at least {MIN_POINTS}")
+    return points
+
+
+def downsample_rows(rows, max_points, method='lttb', descending=False):
+    """Reduce (timestamp, value) rows to at most ~max_points for charting.
+
+    Rows without a value are dropped before sampling. `descending` rows are
+    sampled in time order and returned in their original order.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unsupported downsample method '{method}'")
+    rows = list(rows)
+    if len(rows) <= max_points:
+        return rows
+    if descending:
+        rows.reverse()
+
+    y = pd.to_numeric(pd.Series([row[1] for row in rows], dtype=object), errors='coerce').to_numpy(float)
+    present = np.flatnonzero(~np.isnan(y))
+    if method == 'lttb':
+        x = pd.to_datetime(pd.Series([row[0] for row in rows])).to_numpy('datetime64[ns]').astype('int64')
+        keep = lttb_indices(x[present].astype(float), y[present], max_points)
+    else:
+        keep = minmax_indices(y[present], max_points)
+
+    sampled = [rows[i] for i in present[keep]]
+    if descending:
+        sampled.reverse()
+    return sampled
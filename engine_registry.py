@@ -0,0 +1,109 @@
+"""Process-wide SQLAlchemy engine registry with cached schema snapshots."""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import create_engine, inspect
+
+from instrumentation import InstrumentedConnection, instrument_engine
+from rollups import NON_SENSOR_COLUMNS, ROLLUP_TABLES, rollup_sensors
+
+# Connection pool settings (ignored by SQLite, which uses its own pool)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+
+# Seconds a schema snapshot is trusted before it is reflected again
+SCHEMA_TTL = float(os.environ.get('DB_SCHEMA_TTL', 300))
+
+SchemaSnapshot = namedtuple('SchemaSnapshot', ['tables', 'columns', 'sensor_columns', 'rollups', 'loaded_at'])
+
+
+class EngineRegistry:
+    def __init__(self, schema_ttl=SCHEMA_TTL):
+        self.schema_ttl = schema_ttl
+        self._engines = {}
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def get_engine(self, db_url):
+        """Return the shared engine for `db_url`, creating it on first use."""
+        engine = self._engines.get(db_url)
+        if engine is not None:
+            return engine
+        with self._lock:
+            engine = self._engines.get(db_url)
+            if engine is None:
+                engine = instrument_engine(create_engine(db_url, **self._engine_options(db_url)))
+                self._engines[db_url] = engine
+            return engine
+
+    def get_schema(self, db_url, refresh=False):
+        """Return the cached schema snapshot, reflecting it when stale or on request."""
+        snapshot = self._schemas.get(db_url)
+        if refresh or snapshot is None or time.monotonic() - snapshot.loaded_at > self.schema_ttl:
+            snapshot = self._reflect(db_url)
+            self._schemas[db_url] = snapshot
+        return snapshot
+
+    def invalidate(self, db_url=None):
+        """Drop cached schema snapshots so the next lookup reflects again."""
+        with self._lock:
+            if db_url is None:
+                self._schemas.clear()
+            else:
+                self._schemas.pop(db_url, None)
+
+    def dispose(self, db_url=None):
+        """Close pooled connections and forget the engine(s)."""
+        with self._lock:
+            urls = list(self._engines) if db_url is None else [db_url]
+            for url in urls:
+                engine = self._engines.pop(url, None)
+                if engine is not None:
+                    engine.dispose()
+                self._schemas.pop(url, None)
+
+    def release_connections(self):
+        """Close pooled connections but keep engines and schema snapshots.
+
+        Called before forking worker processes, so that no worker inherits a
+        socket or SQLite handle opened by the parent.
+        """
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+
+    def _engine_options(self, db_url):
+        options = {'pool_pre_ping': True}
+        if db_url.startswith('sqlite'):
+            # Query timings and row counts come from the instrumented sqlite3 cursor
+            options['connect_args'] = {'factory': InstrumentedConnection}
+        else:
+            options.update(
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                pool_recycle=POOL_RECYCLE,
+                pool_timeout=POOL_TIMEOUT,
+            )
+        return options
+
+    def _reflect(self, db_url):
+        inspector = inspect(self.get_engine(db_url))
+        tables = tuple(inspector.get_table_names())
+        columns = ()
+        if 'simulation_data' in tables:
+            columns = tuple(col['name'] for col in inspector.get_columns('simulation_data'))
+        sensor_columns = tuple(col for col in columns if col not in NON_SENSOR_COLUMNS)
+        # Rollup tables present in this database and the sensors each one covers
+        rollups = {
+            table: rollup_sensors(col['name'] for col in inspector.get_columns(table))
+            for table in ROLLUP_TABLES.values() if table in tables
+        }
+        return SchemaSnapshot(tables, columns, sensor_columns, rollups, time.monotonic())
+
+
+registry = EngineRegistry()
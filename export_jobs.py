@@ -0,0 +1,292 @@
+"""Background export jobs: run export builders off the request thread.
+
+Each job writes into its own directory under EXPORT_JOB_DIR, reports progress
+while it runs and is deleted (with its artefact) once it is older than
+EXPORT_JOB_TTL. Job state is also saved as job.json in that directory, so
+under a multi-process server any worker can answer the status and download
+requests for a job another worker is running. A job whose worker process
+exited before it finished is marked failed. Jobs that never finish are deleted
+EXPORT_JOB_MAX_AGE after they were created.
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, jsonify, send_file, url_for
+
+from instrumentation import observe_export
+
+logger = logging.getLogger(__name__)
+
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+
+# Seconds a finished job and its file are kept, and how often expired jobs are swept
+EXPORT_JOB_TTL = float(os.environ.get('EXPORT_JOB_TTL', 3600))
+CLEANUP_INTERVAL = float(os.environ.get('EXPORT_CLEANUP_INTERVAL', 300))
+# Seconds after creation a job is deleted even if it never finished
+EXPORT_JOB_MAX_AGE = float(os.environ.get('EXPORT_JOB_MAX_AGE', 86400))
+# Shared by every worker process; job directories are export-<id>-* in here
+EXPORT_JOB_DIR = os.environ.get('EXPORT_JOB_DIR', tempfile.gettempdir())
+# Minimum seconds between progress saves of a running job
+PROGRESS_SAVE_INTERVAL = 1.0
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+_JOB_DIRECTORY = re.compile(r'export-[0-9a-f]{32}-')
+_SAVED_FIELDS = ('id', 'kind', 'filename', 'status', 'error', 'path', 'directory', 'created_at', 'finished_at',
+                 'rows_done', 'rows_total', 'host', 'pid')
+
+
+def _process_alive(host, pid):
+    """False when process `pid` on this host has exited; True when that cannot be told."""
+    # Signal 0 only probes on POSIX (on Windows os.kill would stop the process)
+    if not pid or host != socket.gethostname() or os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class ExportJob:
+    def __init__(self, kind, filename):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.status = 'queued'
+        self.error = None
+        self.path = None
+        self.directory = tempfile.mkdtemp(prefix=f'export-{self.id}-', dir=EXPORT_JOB_DIR)
+        self.created_at = time.time()
+        self.finished_at = None
+        self._rows_done = 0
+        self.rows_total = None
+        # The worker process running the job, to tell when it died mid-run
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self._saved_at = 0
+
+    @classmethod
+    def load(cls, job_id):
+        """A job saved by any process, or None."""
+        if not _JOB_ID.fullmatch(job_id):
+            return None
+        for path in glob.glob(os.path.join(EXPORT_JOB_DIR, f'export-{job_id}-*', 'job.json')):
+            return cls._from_file(path)
+        return None
+
+    @classmethod
+    def _from_file(cls, path):
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls.__new__(cls)
+        job.__dict__.update({field: state.get(field) for field in _SAVED_FIELDS if field != 'rows_done'})
+        job._rows_done = state.get('rows_done') or 0
+        job._saved_at = 0
+        return job
+
+    def save(self):
+        """Write the job state to job.json (atomically, readers never see a partial file)."""
+        self._saved_at = time.monotonic()
+        state = {field: getattr(self, field) for field in _SAVED_FIELDS}
+        path = os.path.join(self.directory, 'job.json')
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            # The directory is gone once the job has been removed
+            logger.debug(f"Could not save export job {self.id}: {e}")
+
+    @property
+    def rows_done(self):
+        return self._rows_done
+
+    @rows_done.setter
+    def rows_done(self, rows):
+        self._rows_done = rows
+        if time.monotonic() - self._saved_at > PROGRESS_SAVE_INTERVAL:
+            self.save()
+
+    def set_total(self, rows):
+        self.rows_total = rows
+        self.save()
+
+    def advance(self, rows):
+        self.rows_done += rows
+
+    @property
+    def progress(self):
+        if self.status == 'done':
+            return 1.0
+        if not self.rows_total:
+            return None
+        return min(self.rows_done / self.rows_total, 1.0)
+
+    def expired(self, now, ttl, max_age):
+        if self.finished_at is not None:
+            return now - self.finished_at > ttl
+        return now - (self.created_at or 0) > max_age
+
+    def orphaned(self):
+        """True when the job never finished and the process that ran it is gone."""
+        return self.finished_at is None and not _process_alive(self.host, self.pid)
+
+    def fail_orphan(self):
+        self.status = 'failed'
+        self.error = "The worker running this export exited before it finished"
+        self.finished_at = time.time()
+        self.save()
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'filename': self.filename,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'rows_done': self.rows_done,
+            'rows_total': self.rows_total,
+            'progress': self.progress,
+            'status_url': url_for('export_jobs.job_status', job_id=self.id),
+        }
+        if self.status == 'done':
+            data['download_url'] = url_for('export_jobs.job_download', job_id=self.id)
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class ExportJobQueue:
+    def __init__(self, workers=EXPORT_WORKERS, ttl=EXPORT_JOB_TTL, cleanup_interval=CLEANUP_INTERVAL,
+                 max_age=EXPORT_JOB_MAX_AGE):
+        self.ttl = ttl
+        self.max_age = max_age
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        self.cleanup_interval = cleanup_interval
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # Started with the first job, so that a server forking workers after import gets one per worker
+        self._sweeper = None
+
+    def submit(self, kind, filename, builder, *args, **kwargs):
+        """Queue `builder(job, *args, **kwargs)`, which writes the file and returns its path."""
+        job = ExportJob(kind, filename)
+        job.save()
+        with self._lock:
+            self._jobs[job.id] = job
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep, args=(self.cleanup_interval,),
+                                                 name='export-cleanup', daemon=True)
+                self._sweeper.start()
+        self._executor.submit(self._run, job, builder, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """A job of this process, else one saved by another worker (failed if that worker died)."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = ExportJob.load(job_id)
+            if job is not None and job.orphaned():
+                job.fail_orphan()
+        return job
+
+    def remove(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        job = job or ExportJob.load(job_id)
+        if job:
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+    def cleanup(self):
+        """Delete expired jobs (and their files), whichever worker ran them.
+
+        Jobs expire `ttl` seconds after they finished, or `max_age` seconds
+        after they were created if they never did. Jobs whose worker died are
+        marked failed first.
+        """
+        now = time.time()
+        saved = [ExportJob._from_file(path) for path in glob.glob(os.path.join(EXPORT_JOB_DIR, 'export-*', 'job.json'))]
+        for job in saved:
+            if job and job.id not in self._jobs and job.orphaned():
+                job.fail_orphan()
+        expired = {job.id for job in list(self._jobs.values()) + saved
+                   if job and job.expired(now, self.ttl, self.max_age)}
+        for job_id in expired:
+            self.remove(job_id)
+        # Directories of jobs that crashed before their state was first saved
+        for directory in glob.glob(os.path.join(EXPORT_JOB_DIR, 'export-*')):
+            if (_JOB_DIRECTORY.match(os.path.basename(directory)) and os.path.isdir(directory)
+                    and not os.path.exists(os.path.join(directory, 'job.json'))
+                    and now - os.path.getmtime(directory) > self.max_age):
+                shutil.rmtree(directory, ignore_errors=True)
+        return len(expired)
+
+    def shutdown(self, wait=True):
+        """Stop taking jobs; with `wait`, block until the running ones have finished."""
+        self._executor.shutdown(wait=wait)
+
+    def _sweep(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                removed = self.cleanup()
+                if removed:
+                    logger.info(f"Removed {removed} expired export job(s)")
+            except Exception as e:
+                logger.warning(f"Export cleanup failed: {e}")
+
+    def _run(self, job, builder, args, kwargs):
+        job.status = 'running'
+        job.save()
+        try:
+            job.path = builder(job, *args, **kwargs)
+            job.status = 'done'
+        except Exception as e:
+            logger.error(f"Export job {job.id} ({job.kind}) failed: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            job.save()
+            observe_export(job.kind, job.status, job.finished_at - job.created_at)
+
+
+jobs = ExportJobQueue()
+
+export_jobs_blueprint = Blueprint('export_jobs', __name__)
+
+
+@export_jobs_blueprint.route('/export/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown export job'}), 404
+    return jsonify(job.to_dict())
+
+
+@export_jobs_blueprint.route('/export/jobs/<job_id>/download', methods=['GET'])
+def job_download(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown export job'}), 404
+    if job.status != 'done':
+        return jsonify({'error': f"Export job is {job.status}"}), 409
+    # send_file streams the artefact from disk in blocks
+    return send_file(job.path, as_attachment=True, download_name=job.filename)
@@ -0,0 +1,122 @@
+"""Streaming export helpers: chunked row readers and CSV/gzip response bodies."""
+
+import csv
+import io
+import zlib
+
+from flask import Response, stream_with_context
+
+from instrumentation import sqlite_connect
+
+# Rows fetched from the database per round trip
+CHUNK_SIZE = 5000
+
+# Data rows that fit on one Excel worksheet (plus the header row)
+EXCEL_MAX_ROWS = 1048575
+
+
+def iter_engine_rows(engine, sql, params=None, chunk_size=CHUNK_SIZE):
+    """Yield (columns, rows) chunks from a SQLAlchemy engine using a server-side cursor."""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(sql, params or {})
+        columns = list(result.keys())
+        # Header-only chunk first, so empty results still produce column names
+        yield columns, []
+        for rows in result.partitions(chunk_size):
+            yield columns, rows
+
+
+def iter_sqlite_rows(db_path, sql, params=(), chunk_size=CHUNK_SIZE):
+    """Yield (columns, rows) chunks from a sqlite3 database file."""
+    conn = sqlite_connect(db_path)
+    try:
+        cursor = conn.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        yield columns, []
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, rows
+    finally:
+        conn.close()
+
+
+def iter_csv(chunks):
+    """Encode (columns, rows) chunks as CSV bytes, one block per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, rows in chunks:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def iter_gzip(blocks):
+    """Gzip-compress a stream of byte blocks."""
+    compressor = zlib.compressobj(wbits=31)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _counted(chunks, progress):
+    for columns, rows in chunks:
+        yield columns, rows
+        if progress and rows:
+            progress(len(rows))
+
+
+def write_csv_file(path, chunks, progress=None):
+    """Write (columns, rows) chunks to a CSV file; `progress(n)` is called per chunk."""
+    with open(path, 'wb') as f:
+        for block in iter_csv(_counted(chunks, progress)):
+            f.write(block)
+    return path
+
+
+def write_xlsx_file(path, chunks, progress=None):
+    """Write (columns, rows) chunks to an .xlsx file using openpyxl's streaming writer."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('data')
+    written = 0
+    header_written = False
+    for columns, rows in _counted(chunks, progress):
+        if not header_written:
+            sheet.append(columns)
+            header_written = True
+        written += len(rows)
+        if written > EXCEL_MAX_ROWS:
+            raise ValueError(f"Export exceeds Excel's {EXCEL_MAX_ROWS} row limit; use CSV instead")
+        for row in rows:
+            sheet.append(list(row))
+    workbook.save(path)
+    return path
+
+
+def wants_gzip(args):
+    return str(args.get('gzip', '')).lower() in ('1', 'true', 'yes')
+
+
+def csv_response(chunks, filename, compress=False):
+    """Build a streaming CSV (optionally .csv.gz) download response."""
+    body = iter_csv(chunks)
+    mimetype = 'text/csv'
+    if compress:
+        body = iter_gzip(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Let reverse proxies pass chunks straight through
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
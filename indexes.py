@@ -0,0 +1,169 @@
+"""Index definitions for the dashboard tables and a checker that adds missing ones.
+
+Usage:
+    python indexes.py check sqlite:///simulation_data.db
+    python indexes.py apply sqlite:///sensor_data.db
+"""
+
+import argparse
+import json
+import logging
+
+from sqlalchemy import Index, MetaData, Table, create_engine, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Composite indexes matching the building/floor (+ sensor type) filters and timestamp ordering
+INDEXES = {
+    'simulation_data': [
+        ('ix_simulation_data_building_floor_timestamp', ('building', 'floor', 'timestamp')),
+        # Time-window queries that span every building
+        ('ix_simulation_data_timestamp', ('timestamp',)),
+        # Integer epoch column, once added by `python storage.py epoch`
+        ('ix_simulation_data_building_floor_ts', ('building', 'floor', 'ts')),
+        ('ix_simulation_data_ts', ('ts',)),
+    ],
+    'sensor_data': [
+        ('ix_sensor_data_type_building_floor_timestamp',
+         ('sensor_type', 'building_id', 'floor_number', 'timestamp')),
+        ('ix_sensor_data_timestamp', ('timestamp',)),
+        ('ix_sensor_data_type_building_floor_ts', ('sensor_type', 'building_id', 'floor_number', 'ts')),
+        ('ix_sensor_data_ts', ('ts',)),
+    ],
+}
+
+# Representative dashboard queries, checked with EXPLAIN against each table
+DASHBOARD_QUERIES = {
+    'simulation_data': [
+        ("SELECT timestamp, id FROM simulation_data "
+         "WHERE building = :building AND floor = :floor ORDER BY timestamp DESC",
+         {'building': 1, 'floor': 1}),
+    ],
+    'sensor_data': [
+        ("SELECT timestamp, value FROM sensor_data "
+         "WHERE sensor_type = :sensor_type AND building_id = :building_id AND floor_number = :floor_number "
+         "ORDER BY timestamp ASC",
+         {'sensor_type': 'temperature', 'building_id': 'Building 1', 'floor_number': 1}),
+    ],
+}
+
+
+def explain_prefix(dialect):
+    return 'EXPLAIN QUERY PLAN' if dialect == 'sqlite' else 'EXPLAIN'
+
+
+def plan_lines(dialect, rows):
+    """EXPLAIN output rows as a list of text lines."""
+    if dialect == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [' '.join(str(value) for value in row if value is not None) for row in rows]
+
+
+def is_full_scan(dialect, plan):
+    """Whether a plan from plan_lines() reads a whole table instead of an index range."""
+    if dialect == 'sqlite':
+        # 'SCAN (subquery-N)' reads an intermediate result, not a table
+        return any(line.startswith('SCAN ') and 'INDEX' not in line and 'CONSTANT ROW' not in line
+                   and not line.startswith('SCAN (')
+                   for line in plan)
+    if dialect == 'postgresql':
+        return any('Seq Scan' in line for line in plan)
+    # MySQL: access type ALL
+    return any(' ALL ' in f" {line} " for line in plan)
+
+
+def explain(conn, sql, params=None):
+    """Return the query plan for `sql` as a list of text lines."""
+    dialect = conn.dialect.name
+    rows = conn.execute(text(f"{explain_prefix(dialect)} {sql}"), params or {})
+    return plan_lines(dialect, rows)
+
+
+def missing_indexes(engine):
+    """Return {table: [(name, columns), ...]} for indexes that do not exist yet."""
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    missing = {}
+    for table, wanted in INDEXES.items():
+        if table not in tables:
+            continue
+        existing_names = set()
+        existing_columns = set()
+        for index in inspector.get_indexes(table):
+            existing_names.add(index['name'])
+            existing_columns.add(tuple(index['column_names']))
+        # Indexes on optional columns (e.g. ts) only apply once the column exists
+        table_columns = {column['name'] for column in inspector.get_columns(table)}
+        absent = [(name, columns) for name, columns in wanted
+                  if name not in existing_names and columns not in existing_columns
+                  and table_columns.issuperset(columns)]
+        if absent:
+            missing[table] = absent
+    return missing
+
+
+def analyze(engine, table):
+    """Refresh planner statistics (also used for cheap row-count estimates)."""
+    keyword = 'ANALYZE TABLE' if engine.dialect.name in ('mysql', 'mariadb') else 'ANALYZE'
+    with engine.begin() as conn:
+        conn.execute(text(f"{keyword} {table}"))
+
+
+def apply_indexes(engine):
+    """Create every missing index and refresh statistics; returns the names created."""
+    created = []
+    metadata = MetaData()
+    for table_name, absent in missing_indexes(engine).items():
+        table = Table(table_name, metadata, autoload_with=engine)
+        for name, columns in absent:
+            Index(name, *(table.c[col] for col in columns)).create(engine)
+            logger.info(f"Created index {name} on {table_name}{columns}")
+            created.append(name)
+        analyze(engine, table_name)
+    return created
+
+
+def check_plans(engine):
+    """EXPLAIN the dashboard queries and report whether each uses one of our indexes."""
+    tables = inspect(engine).get_table_names()
+    report = []
+    with engine.connect() as conn:
+        for table, queries in DASHBOARD_QUERIES.items():
+            if table not in tables:
+                continue
+            names = [name for name, _ in INDEXES[table]]
+            for sql, params in queries:
+                plan = explain(conn, sql, params)
+                report.append({
+                    'table': table,
+                    'query': sql,
+                    'plan': plan,
+                    'uses_index': any(name in line for line in plan for name in names),
+                })
+    return report
+
+
+def index_report(engine, apply=False):
+    created = apply_indexes(engine) if apply else []
+    return {
+        'created': created,
+        'missing': {table: [name for name, _ in absent]
+                    for table, absent in missing_indexes(engine).items()},
+        'plans': check_plans(engine),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and add dashboard indexes")
+    parser.add_argument('command', choices=['check', 'apply'])
+    parser.add_argument('db_url', nargs='?', default='sqlite:///simulation_data.db')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(args.db_url)
+    print(json.dumps(index_report(engine, apply=args.command == 'apply'), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""Asyncio ingest server for hvac_data readings (the simulator's /store and /ws contract).
+
+Readings are buffered and written to the database in group commits: a batch
+is flushed when it reaches INGEST_FLUSH_ROWS readings or INGEST_FLUSH_INTERVAL
+seconds after its first reading, whichever comes first, while the next batch
+fills up. A request is answered once the commit holding its readings is done,
+so many concurrent clients share one transaction instead of paying for one
+each. Every stored reading is pushed to the WebSocket subscribers.
+
+Endpoints:
+    POST /store   one reading {"unit_id", "parameter_name", "value"[, "timestamp"]},
+                  a JSON list of readings, or NDJSON (one reading per line)
+    GET  /ws      WebSocket; each stored reading arrives as {"unit_id", "parameter", "value", "timestamp"}
+                  (?unit_id= keeps one unit, ?batch=1 sends one JSON list per commit)
+    GET  /stats   counters as JSON
+
+Usage:
+    python ingest_server.py "sqlite:///project intenship/hvac.db" [--host 0.0.0.0] [--port 8000]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from aiohttp import WSMsgType, web
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, create_engine, event, inspect, text
+
+from aggregation import TIMESTAMP_FORMAT, to_epoch
+from data_generator import configure_connection
+
+logger = logging.getLogger(__name__)
+
+# A batch is committed when it holds this many readings or is this many seconds old
+INGEST_FLUSH_ROWS = int(os.environ.get('INGEST_FLUSH_ROWS', 5000))
+INGEST_FLUSH_INTERVAL = float(os.environ.get('INGEST_FLUSH_INTERVAL', 0.05))
+# Readings waiting for a commit before /store answers 503
+INGEST_MAX_PENDING = int(os.environ.get('INGEST_MAX_PENDING', 200000))
+
+# Messages buffered per WebSocket client; a client that falls further behind is disconnected
+WS_QUEUE_SIZE = 1000
+
+metadata = MetaData()
+
+# The simulator's hvac_data table; new databases store timestamps as strings like the other tables
+hvac_data = Table(
+    'hvac_data', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('unit_id', String),
+    Column('parameter_name', String),
+    Column('value', Float),
+    Column('timestamp', String),
+    Index('ix_hvac_data_unit_id', 'unit_id'),
+    Index('ix_hvac_data_parameter_name', 'parameter_name'),
+)
+
+
+def parse_reading(item, now):
+    """Validate one reading into an hvac_data row; raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError("each reading must be a JSON object")
+    try:
+        unit_id, parameter_name = str(item['unit_id']), str(item['parameter_name'])
+        value = float(item['value'])
+    except KeyError as e:
+        raise ValueError(f"missing field {e}") from None
+    except (TypeError, ValueError):
+        raise ValueError(f"value must be numeric, got {item.get('value')!r}") from None
+    timestamp = item.get('timestamp')
+    if timestamp is None:
+        timestamp = now
+    else:
+        timestamp = datetime.fromisoformat(str(timestamp)).strftime(TIMESTAMP_FORMAT)
+    return {'unit_id': unit_id, 'parameter_name': parameter_name, 'value': value, 'timestamp': timestamp}
+
+
+def parse_body(body, content_type):
+    """Rows from a /store body: one JSON reading, a JSON list or NDJSON."""
+    now = datetime.now().strftime(TIMESTAMP_FORMAT)
+    try:
+        if content_type == 'application/x-ndjson':
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}") from None
+    if isinstance(items, dict) and 'readings' in items:
+        items = items['readings']
+    if not isinstance(items, list):
+        items = [items]
+    return [parse_reading(item, now) for item in items]
+
+
+class Batch:
+    def __init__(self, loop):
+        self.rows = []
+        self.committed = loop.create_future()
+        self.started = None
+
+
+class GroupCommitWriter:
+    """Collects rows from many requests and inserts them one transaction per batch.
+
+    The insert runs on a single worker thread, so the event loop keeps
+    accepting readings (into the next batch) while a commit is in flight.
+    """
+
+    def __init__(self, engine, flush_rows=INGEST_FLUSH_ROWS, flush_interval=INGEST_FLUSH_INTERVAL,
+                 on_commit=None):
+        self.engine = engine
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self.with_ts = 'ts' in {column['name'] for column in inspect(engine).get_columns('hvac_data')}
+        columns = ['unit_id', 'parameter_name', 'value', 'timestamp'] + (['ts'] if self.with_ts else [])
+        self.insert = text(f"INSERT INTO hvac_data ({', '.join(columns)}) "
+                           f"VALUES ({', '.join(':' + column for column in columns)})")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-writer')
+        self.stats = {'accepted': 0, 'committed': 0, 'commits': 0, 'failed': 0, 'last_commit_ms': None}
+        self.batch = None
+        self.in_flight = 0
+        self._wake = None
+        self._task = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self.batch = Batch(loop)
+        self._wake = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    def pending(self):
+        return len(self.batch.rows) + self.in_flight
+
+    def submit(self, rows):
+        """Queue rows for the next commit; returns a future resolved once they are stored."""
+        batch = self.batch
+        if not batch.rows:
+            batch.started = time.monotonic()
+        batch.rows.extend(rows)
+        self.stats['accepted'] += len(rows)
+        self._wake.set()
+        return batch.committed
+
+    def _write(self, rows):
+        if self.with_ts:
+            epochs = {}
+            for row in rows:
+                if row['timestamp'] not in epochs:
+                    epochs[row['timestamp']] = to_epoch(row['timestamp'])
+                row['ts'] = epochs[row['timestamp']]
+        with self.engine.begin() as conn:
+            conn.execute(self.insert, rows)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            batch = self.batch
+            if not batch.rows:
+                continue
+            # Keep filling until the batch is full or old enough
+            while len(batch.rows) < self.flush_rows:
+                remaining = batch.started + self.flush_interval - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wake.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self._wake.clear()
+            await self._commit(loop, batch)
+
+    async def _commit(self, loop, batch):
+        self.batch = Batch(loop)
+        self.in_flight = len(batch.rows)
+        started = time.perf_counter()
+        try:
+            await loop.run_in_executor(self.executor, self._write, batch.rows)
+        except Exception as e:
+            logger.exception(f"Failed to store {len(batch.rows)} readings")
+            self.stats['failed'] += len(batch.rows)
+            batch.committed.set_exception(e)
+            # Awaiting requests report the error; nothing else needs to retrieve it
+            batch.committed.exception()
+            return
+        finally:
+            self.in_flight = 0
+        self.stats['commits'] += 1
+        self.stats['committed'] += len(batch.rows)
+        self.stats['last_commit_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        batch.committed.set_result(len(batch.rows))
+        if self.on_commit:
+            self.on_commit(batch.rows)
+
+    async def close(self):
+        """Commit whatever is buffered and stop the writer."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.batch and self.batch.rows:
+            await self._commit(asyncio.get_running_loop(), self.batch)
+        self.executor.shutdown(wait=True)
+
+
+class Subscriber:
+    def __init__(self, unit_id=None, batch=False):
+        self.unit_id = unit_id
+        self.batch = batch
+        self.queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def publish(self, messages):
+        for message in messages:
+            try:
+                self.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.overflowed = True
+                return
+
+    async def send_loop(self, ws):
+        try:
+            while not self.overflowed or not self.queue.empty():
+                await ws.send_str(await self.queue.get())
+            await ws.close(message=b'subscriber fell behind')
+        except ConnectionResetError:
+            pass
+
+
+class Broadcaster:
+    """Fans each committed batch out to every WebSocket subscriber."""
+
+    def __init__(self):
+        self.subscribers = set()
+
+    def subscribe(self, unit_id=None, batch=False):
+        subscriber = Subscriber(unit_id, batch)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, rows):
+        if not self.subscribers:
+            return
+        # Encode each reading once, however many clients receive it
+        encoded = {}
+        for subscriber in list(self.subscribers):
+            key = (subscriber.unit_id, subscriber.batch)
+            if key not in encoded:
+                readings = [{'unit_id': row['unit_id'], 'parameter': row['parameter_name'],
+                             'value': row['value'], 'timestamp': row['timestamp']}
+                            for row in rows if subscriber.unit_id is None or row['unit_id'] == subscriber.unit_id]
+                if subscriber.batch:
+                    encoded[key] = [json.dumps(readings)] if readings else []
+                else:
+                    encoded[key] = [json.dumps(reading) for reading in readings]
+            subscriber.publish(encoded[key])
+
+
+async def store(request):
+    writer = request.app['writer']
+    try:
+        rows = parse_body(await request.read(), request.content_type)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    if not rows:
+        return web.json_response({'status': 'stored', 'count': 0})
+    if writer.pending() + len(rows) > INGEST_MAX_PENDING:
+        return web.json_response({'error': "Ingest backlog is full, retry later"}, status=503)
+    try:
+        # The commit future is shared by every request in the batch; a client hanging up must not cancel it
+        await asyncio.shield(writer.submit(rows))
+    except Exception as e:
+        return web.json_response({'error': f"Failed to store readings: {e}"}, status=500)
+    return web.json_response({'status': 'stored', 'count': len(rows)})
+
+
+async def websocket(request):
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    subscriber = request.app['broadcaster'].subscribe(request.query.get('unit_id'),
+                                                      request.query.get('batch') == '1')
+    sender = asyncio.create_task(subscriber.send_loop(ws))
+    try:
+        # Clients only listen; reading keeps pings answered and notices disconnects
+        async for message in ws:
+            if message.type == WSMsgType.ERROR:
+                break
+    finally:
+        request.app['broadcaster'].unsubscribe(subscriber)
+        sender.cancel()
+    return ws
+
+
+async def stats(request):
+    writer = request.app['writer']
+    return web.json_response(dict(writer.stats, pending=writer.pending(),
+                                  subscribers=len(request.app['broadcaster'].subscribers)))
+
+
+def create_app(db_url, flush_rows=INGEST_FLUSH_ROWS, flush_interval=INGEST_FLUSH_INTERVAL):
+    engine = create_engine(db_url)
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', lambda dbapi_connection, record: configure_connection(dbapi_connection))
+    metadata.create_all(engine)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app['broadcaster'] = Broadcaster()
+    app['writer'] = GroupCommitWriter(engine, flush_rows, flush_interval, on_commit=app['broadcaster'].publish)
+
+    async def start_writer(app):
+        app['writer'].start()
+
+    async def stop_writer(app):
+        await app['writer'].close()
+        engine.dispose()
+
+    app.on_startup.append(start_writer)
+    app.on_cleanup.append(stop_writer)
+    app.router.add_post('/store', store)
+    app.router.add_get('/ws', websocket)
+    app.router.add_get('/stats', stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched ingest server for hvac_data readings")
+    parser.add_argument('db_url', nargs='?', default='sqlite:///hvac.db')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--flush-rows', type=int, default=INGEST_FLUSH_ROWS)
+    parser.add_argument('--flush-interval', type=float, default=INGEST_FLUSH_INTERVAL)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # No per-request access log: at ingest rates it would cost more than the inserts
+    web.run_app(create_app(args.db_url, args.flush_rows, args.flush_interval), host=args.host, port=args.port,
+                access_log=None)
+
+
+if __name__ == '__main__':
+    main()
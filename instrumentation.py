@@ -0,0 +1,284 @@
+"""Prometheus instrumentation shared by app.py and application.py.
+
+Metrics (served at /metrics by every instrumented app):
+    http_request_duration_seconds{app, method, route, status}   request latency per URL rule
+    http_response_size_bytes{app, route}                         body size, streamed bodies included
+    db_query_duration_seconds{statement}                         SQL execution time per statement template
+    db_rows_returned_total{statement}                            rows fetched (or affected) per template
+    db_pool_checkout_wait_seconds{database}                      time spent waiting for a pooled connection
+    export_duration_seconds{kind, status}                        background export jobs, queue to finish
+
+Statement templates are the SQL with literals and placeholders replaced by
+`?` and IN lists collapsed, so each query shape is one label. SQLite is timed
+by a sqlite3 cursor factory: raw connections opened with sqlite_connect() and
+registry engines use it. Other databases are timed with SQLAlchemy cursor
+events. The same hooks feed the slow-query log (slow_queries.py). Under a
+multi-process server, set PROMETHEUS_MULTIPROC_DIR so that /metrics
+aggregates all workers.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache, partial
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest,
+                               multiprocess)
+from prometheus_client import REGISTRY as DEFAULT_REGISTRY
+from sqlalchemy import event
+
+from slow_queries import explain_engine, explain_sqlite, slow_log
+
+# Distinct statement labels kept; further shapes are counted under 'other'
+MAX_STATEMENTS = int(os.environ.get('METRICS_MAX_STATEMENTS', 500))
+MAX_STATEMENT_LENGTH = 300
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency',
+                            ['app', 'method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'HTTP response body size',
+                          ['app', 'route'], buckets=SIZE_BUCKETS)
+QUERY_LATENCY = Histogram('db_query_duration_seconds', 'SQL execution time per statement template',
+                          ['statement'], buckets=LATENCY_BUCKETS)
+ROWS_RETURNED = Counter('db_rows_returned', 'Rows fetched or affected per statement template', ['statement'])
+POOL_WAIT = Histogram('db_pool_checkout_wait_seconds', 'Time waiting for a pooled connection',
+                      ['database'], buckets=LATENCY_BUCKETS)
+EXPORT_DURATION = Histogram('export_duration_seconds', 'Export job duration',
+                            ['kind', 'status'], buckets=LATENCY_BUCKETS)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"\?|%s|%\(\w+\)s|(?<![:\w]):\w+")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+_statements = set()
+_statements_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4096)
+def statement_template(sql):
+    """SQL with literals and placeholders as `?`, IN lists collapsed and whitespace squeezed."""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(?...)', sql)
+    return _SPACE.sub(' ', sql).strip()[:MAX_STATEMENT_LENGTH]
+
+
+def statement_label(sql):
+    template = statement_template(sql)
+    if template in _statements:
+        return template
+    with _statements_lock:
+        if len(_statements) >= MAX_STATEMENTS:
+            return 'other'
+        _statements.add(template)
+    return template
+
+
+# ----------- SQLite -----------
+class InstrumentedCursor(sqlite3.Cursor):
+    """sqlite3 cursor that times execute() and counts fetched rows per statement template.
+
+    While the slow-query log is on, it also tracks each statement until its
+    result has been read (execution plus fetch time) and hands it to the log.
+    """
+
+    statement = None
+    # [sql, parameters, seconds, rows] of the result being read, while the slow-query log is on
+    _pending = None
+
+    def _timed(self, method, sql, parameters, many=False):
+        self._finish()
+        self.statement = statement_label(sql)
+        started = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            QUERY_LATENCY.labels(self.statement).observe(elapsed)
+            if slow_log.enabled:
+                self._pending = [sql, None if many else parameters, elapsed, 0]
+                if many or self.description is None:
+                    # Nothing to fetch: the statement is complete
+                    self._pending[3] = max(self.rowcount, 0)
+                    self._finish()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            database = self.connection.database
+            explainable = database not in ('', ':memory:') and not database.startswith('file:')
+            slow_log.observe(self.statement, *pending, 'sqlite',
+                             partial(explain_sqlite, database) if explainable else None)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        cursor = self._timed(super().executemany, sql, parameters, many=True)
+        if self.rowcount > 0:
+            ROWS_RETURNED.labels(self.statement).inc(self.rowcount)
+        return cursor
+
+    def _fetched(self, rows, started, exhausted):
+        if rows and self.statement is not None:
+            ROWS_RETURNED.labels(self.statement).inc(rows)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - started
+            self._pending[3] += rows
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(int(row is not None), started, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(len(rows), started, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), started, True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        # Kept for EXPLAIN in the slow-query log
+        self.database = os.fspath(database)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3's connection shortcuts build a plain cursor without calling cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+
+def sqlite_connect(path, **kwargs):
+    """sqlite3.connect() with query metrics."""
+    return sqlite3.connect(path, factory=InstrumentedConnection, **kwargs)
+
+
+# ----------- SQLAlchemy -----------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    label = statement_label(statement)
+    QUERY_LATENCY.labels(label).observe(elapsed)
+    # Buffered drivers (psycopg2, pymysql) report the size of a SELECT result here
+    rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+    if rows:
+        ROWS_RETURNED.labels(label).inc(rows)
+    if slow_log.enabled:
+        slow_log.observe(label, statement, None if executemany else parameters, elapsed, rows,
+                         conn.dialect.name, partial(explain_engine, conn.engine))
+
+
+def _time_checkouts(pool, database):
+    # The pool has no pre-checkout event, so its checkout call is wrapped instead
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            POOL_WAIT.labels(database).observe(time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+
+
+def instrument_engine(engine):
+    """Record pool checkout waits and, for non-SQLite engines, statement timings of `engine`.
+
+    SQLite engines are timed by InstrumentedCursor (pass it as the connect
+    factory, as the engine registry does).
+    """
+    database = os.path.basename(engine.url.database or '') or engine.url.get_backend_name()
+    _time_checkouts(engine.pool, database)
+    # dispose() replaces the pool
+    event.listen(engine, 'engine_disposed', lambda engine: _time_checkouts(engine.pool, database))
+    if engine.dialect.name != 'sqlite':
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    return engine
+
+
+def observe_export(kind, status, seconds):
+    EXPORT_DURATION.labels(kind, status).observe(seconds)
+
+
+# ----------- Flask -----------
+def metrics_response():
+    """The Prometheus exposition, merged across worker processes when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = DEFAULT_REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_app(app, name=None):
+    """Time every request of a Flask app and serve /metrics from it."""
+    name = name or app.name
+
+    def observe(route, method, status, started, size):
+        REQUEST_LATENCY.labels(name, method, route, status).observe(time.perf_counter() - started)
+        RESPONSE_SIZE.labels(name, route).observe(size)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        # The URL rule, not the path, so /data/sensor/<sensor_name> is one label
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method, status = request.method, str(response.status_code)
+        if response.is_streamed and response.content_length is None:
+            # Streamed bodies (CSV exports, SSE) are measured when the last chunk has been sent
+            body, sent = response.response, [0]
+
+            def counted():
+                for chunk in body:
+                    sent[0] += len(chunk)
+                    yield chunk
+
+            response.response = counted()
+            response.call_on_close(lambda: observe(route, method, status, started, sent[0]))
+        else:
+            observe(route, method, status, started, response.content_length or 0)
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', metrics_response)
+    return app
@@ -0,0 +1,210 @@
+"""Server-Sent Events feed of newly inserted simulation_data rows.
+
+One poller thread per database reads the rows past its id watermark and fans
+them out to every subscribed client, so database load follows the insert rate
+rather than the number of open dashboards.
+
+Each stream holds a server thread while it is open. Streams therefore end
+after LIVE_MAX_LIFETIME seconds, or as soon as close_streams() is called when
+a worker shuts down. The browser's EventSource then reconnects after
+LIVE_RETRY_MS and resumes from the id sent with Last-Event-ID.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Seconds between polls for new rows, and between keep-alive comments on idle streams
+LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', 2))
+LIVE_HEARTBEAT = float(os.environ.get('LIVE_HEARTBEAT', 15))
+# Seconds a stream stays open before the client is made to reconnect, and the reconnect delay it is given
+LIVE_MAX_LIFETIME = float(os.environ.get('LIVE_MAX_LIFETIME', 300))
+LIVE_RETRY_MS = int(os.environ.get('LIVE_RETRY_MS', 1000))
+
+LIVE_BATCH_SIZE = 5000
+# Batches buffered per client; a client that falls further behind is told to reload
+LIVE_QUEUE_SIZE = 100
+
+
+class Subscription:
+    def __init__(self, building=None, floor=None):
+        self.building = building
+        self.floor = floor
+        self.queue = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.overflowed = False
+        self.closed = False
+
+    def matches(self, row):
+        return ((self.building is None or str(row['building']) == self.building) and
+                (self.floor is None or str(row['floor']) == self.floor))
+
+    def publish(self, rows):
+        selected = [row for row in rows if self.matches(row)]
+        if not selected:
+            return
+        try:
+            self.queue.put_nowait(selected)
+        except queue.Full:
+            self.overflowed = True
+
+    def close(self):
+        self.closed = True
+        try:
+            # Wake the stream waiting on the queue
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class LiveFeed:
+    def __init__(self, engine, sensor_columns, interval=LIVE_POLL_INTERVAL, batch_size=LIVE_BATCH_SIZE):
+        self.engine = engine
+        self.columns = ['id', 'building', 'floor', 'timestamp'] + list(sensor_columns)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_id = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def latest_id(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT MAX(id) FROM simulation_data")).scalar() or 0
+
+    def fetch_since(self, last_id, building=None, floor=None):
+        """Rows with id > last_id (oldest first), optionally for one building/floor."""
+        filters = ["id > :last_id"]
+        params = {'last_id': last_id, 'limit': self.batch_size}
+        if building is not None:
+            filters.append("building = :building")
+            params['building'] = building
+        if floor is not None:
+            filters.append("floor = :floor")
+            params['floor'] = floor
+        query = (f"SELECT {', '.join(self.columns)} FROM simulation_data "
+                 f"WHERE {' AND '.join(filters)} ORDER BY id LIMIT :limit")
+        with self.engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(text(query), params)]
+
+    def subscribe(self, building=None, floor=None):
+        subscription = Subscription(building, floor)
+        if _closing.is_set():
+            subscription.close()
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll, name='live-feed', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def close_subscriptions(self):
+        with self._lock:
+            for subscription in self._subscribers:
+                subscription.close()
+
+    def _poll(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Last client left; the next subscribe() starts a fresh poller from the newest row
+                    # (each stream catches up on its own through fetch_since)
+                    self._thread = None
+                    self.last_id = None
+                    return
+                subscribers = list(self._subscribers)
+            rows = []
+            try:
+                if self.last_id is None:
+                    self.last_id = self.latest_id()
+                rows = self.fetch_since(self.last_id)
+            except Exception as e:
+                logger.warning(f"Live feed poll failed: {e}")
+            if rows:
+                self.last_id = rows[-1]['id']
+                for subscription in subscribers:
+                    subscription.publish(rows)
+            if len(rows) < self.batch_size:
+                time.sleep(self.interval)
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+# Set once this process is shutting down
+_closing = threading.Event()
+
+
+def get_feed(db_url, engine, sensor_columns):
+    """Shared feed for a database (one poller no matter how many clients)."""
+    key = (db_url, tuple(sensor_columns))
+    with _feeds_lock:
+        feed = _feeds.get(key)
+        if feed is None:
+            feed = _feeds[key] = LiveFeed(engine, sensor_columns)
+        return feed
+
+
+def close_streams():
+    """End every open stream, and any opened later, so a shutting-down worker is not held up by them."""
+    _closing.set()
+    with _feeds_lock:
+        for feed in _feeds.values():
+            feed.close_subscriptions()
+
+
+def _event(rows, sensor):
+    payload = {'rows': [{'id': row['id'], 'timestamp': row['timestamp'], 'value': row[sensor]}
+                        for row in rows]}
+    return f"id: {rows[-1]['id']}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+def stream_rows(feed, sensor, building=None, floor=None, last_id=None, heartbeat=LIVE_HEARTBEAT,
+                max_lifetime=LIVE_MAX_LIFETIME):
+    """Yield SSE messages for rows after `last_id` for one building/floor/sensor, for up to `max_lifetime` seconds."""
+    # Subscribe before catching up so rows inserted meanwhile are queued, not lost
+    subscription = feed.subscribe(building, floor)
+    deadline = time.monotonic() + max_lifetime
+    try:
+        if last_id is None:
+            last_id = feed.latest_id()
+        # An id-only message: a client that reconnects before any row arrives still resumes from here
+        yield f"retry: {LIVE_RETRY_MS}\nid: {last_id}\n\n"
+        while True:
+            rows = feed.fetch_since(last_id, building, floor)
+            if rows:
+                last_id = rows[-1]['id']
+                yield _event(rows, sensor)
+            if len(rows) < feed.batch_size:
+                break
+
+        while True:
+            if subscription.overflowed:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            remaining = deadline - time.monotonic()
+            if subscription.closed or remaining <= 0:
+                # The client reconnects with Last-Event-ID and carries on from last_id
+                return
+            try:
+                rows = subscription.queue.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if rows is None:
+                continue
+            rows = [row for row in rows if row['id'] > last_id]
+            if rows:
+                last_id = rows[-1]['id']
+                yield _event(rows, sensor)
+    finally:
+        feed.unsubscribe(subscription)
@@ -0,0 +1,126 @@
+"""Keyset (cursor) pagination helpers and statistics-based row-count estimates."""
+
+import base64
+import json
+
+from sqlalchemy import text
+
+from indexes import INDEXES
+
+# Upper bound on rows per page
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(key, direction):
+    """Encode a sort key and direction ('next' or 'prev') as an opaque URL-safe token."""
+    payload = json.dumps({'k': list(key), 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token into (key, direction); raises ValueError if it is malformed."""
+    if not token:
+        return None, 'next'
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        key, direction = payload['k'], payload['d']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid page cursor")
+    if direction not in ('next', 'prev') or not isinstance(key, list):
+        raise ValueError("Invalid page cursor")
+    return key, direction
+
+
+def page_size(value, default=30):
+    try:
+        size = int(value) if value not in (None, '') else default
+    except ValueError:
+        raise ValueError(f"Invalid page size '{value}'")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_condition(columns, placeholders, direction):
+    """SQL selecting rows after (next) or before (prev) a key in descending order.
+
+    Written as expanded OR terms rather than a row-value comparison so every
+    backend can use the leading index column.
+    """
+    op = '<' if direction == 'next' else '>'
+    terms = []
+    for i, column in enumerate(columns):
+        equal = [f"{columns[j]} = {placeholders[j]}" for j in range(i)]
+        terms.append('(' + ' AND '.join(equal + [f"{column} {op} {placeholders[i]}"]) + ')')
+    return '(' + ' OR '.join(terms) + ')'
+
+
+def keyset_params(key):
+    """Positional parameters for keyset_condition() written with '?' placeholders."""
+    params = []
+    for i in range(len(key)):
+        params += list(key[:i + 1])
+    return params
+
+
+def build_page(rows, limit, key_of, cursor_key, direction):
+    """Trim an over-fetched page (limit + 1 rows) and compute its cursors.
+
+    `rows` are in query order (descending for 'next', ascending for 'prev');
+    the returned rows are always in descending order.
+    """
+    more = len(rows) > limit
+    rows = list(rows[:limit])
+    if direction == 'prev':
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+    has_next = more if direction == 'next' else True
+    has_prev = (cursor_key is not None) if direction == 'next' else more
+    next_cursor = encode_cursor(key_of(rows[-1]), 'next') if has_next else None
+    prev_cursor = encode_cursor(key_of(rows[0]), 'prev') if has_prev else None
+    return rows, next_cursor, prev_cursor
+
+
+def sqlite_stat_estimate(execute, table, filtered_columns):
+    """Estimate matching rows from sqlite_stat1 instead of running COUNT(*).
+
+    `execute(sql)` returns result rows. Uses an index of the table whose
+    leading columns are exactly the equality-filtered ones. Returns None when
+    no index has that prefix (the table-wide figure would be far off) or the
+    database has not been ANALYZEd.
+    """
+    try:
+        stats = dict(execute(f"SELECT idx, stat FROM sqlite_stat1 WHERE tbl = '{table}'"))
+    except Exception:
+        return None
+    if not stats:
+        return None
+
+    if not filtered_columns:
+        # Table-level row count is the first number of any index entry
+        first = next(iter(stats.values())).split()
+        return int(first[0]) if first and first[0].isdigit() else None
+    best = None
+    for name, columns in INDEXES.get(table, []):
+        if name not in stats or set(columns[:len(filtered_columns)]) != set(filtered_columns):
+            continue
+        numbers = [int(n) for n in stats[name].split() if n.isdigit()]
+        prefix = len(filtered_columns)
+        if prefix < len(numbers) and (best is None or numbers[prefix] < best):
+            best = numbers[prefix]
+    return best
+
+
+def explain_estimate(conn, sql, params):
+    """Estimate rows a query returns from the planner (PostgreSQL / MySQL)."""
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    if dialect in ('mysql', 'mariadb'):
+        result = conn.execute(text(f"EXPLAIN {sql}"), params)
+        rows_index = list(result.keys()).index('rows')
+        return max((row[rows_index] or 0 for row in result), default=0)
+    return None
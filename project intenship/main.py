@@ -1,12 +1,21 @@
-import tkinter as tk
-from tkinter import ttk
-from datetime import datetime
+"""HVAC simulator: a headless engine that writes simulation_data, with a Tk front end (simulator_gui.py).
+
+Usage:
+    python main.py                                        # Tk window
+    python main.py simulate --buildings 100 --floors 20 --rate 20000 --duration 60
+    python main.py simulate --buildings 10 --floors 5 --start "2026-01-01 00:00:00" --end "2026-02-01 00:00:00" --interval 60
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import calendar
 import time
 
+import numpy as np
+
 # SQLAlchemy Imports
-from sqlalchemy import create_engine, Column, Integer, String, Float
+from sqlalchemy import create_engine, event, inspect, text, BigInteger, Column, Integer, String, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 # ---------------------------
 # SQLAlchemy Base & Model
@@ -17,6 +26,8 @@ class SimulationData(Base):
     __tablename__ = 'simulation_data'
     id = Column(Integer, primary_key=True)
     timestamp = Column(String)
+    # The timestamp as integer epoch seconds, for index range scans and arithmetic bucketing
+    ts = Column(BigInteger)
     building = Column(Integer)
     floor = Column(Integer)
     unit_status_fb = Column(Float)
@@ -38,328 +49,287 @@ class SimulationData(Base):
     hw_actuator_level = Column(Float)
     hw_actuator_fb = Column(Float)
 
+    # Dashboard queries filter on building/floor and order by timestamp
+    __table_args__ = (
+        Index('ix_simulation_data_building_floor_timestamp', 'building', 'floor', 'timestamp'),
+        Index('ix_simulation_data_timestamp', 'timestamp'),
+        Index('ix_simulation_data_building_floor_ts', 'building', 'floor', 'ts'),
+        Index('ix_simulation_data_ts', 'ts'),
+    )
+
+def create_schema(engine):
+    """Create the table, adding the ts column to databases created before it existed."""
+    inspector = inspect(engine)
+    if 'simulation_data' in inspector.get_table_names() and \
+            'ts' not in {col['name'] for col in inspector.get_columns('simulation_data')}:
+        # Older rows are filled by `python storage.py epoch <db url>` from the dashboard folder
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE simulation_data ADD COLUMN ts BIGINT"))
+    Base.metadata.create_all(engine)
+
 # ---------------------------
-# HVAC Simulator Application
+# Simulation Engine
 # ---------------------------
-class HVACSimulatorApp(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title("HVAC Simulator")
-        self.geometry("950x750")
-        
-        # Simulation context: Building and Floor
-        self.building = 1
-        self.floor = 1
-
-        # Auto dump settings
-        self.auto_dump_interval = None  # seconds between dumps
-        self.auto_dump_end_time = None  # timestamp when auto-dump stops
-        self.auto_dump_job = None       # reference to the after() job
-
-        # Database sessionmaker (will be set via connect_database)
-        self.SessionLocal = None
-        self.engine = None
-        
-        # HVAC parameters with initial values.
-        self.params = {
-            "Unit Status F/B": 0,
-            "RA Temp": 22.0,
-            "RA Humidity": 50.0,
-            "SA Temp": 22.0,
-            "SA DPT": 10.0,
-            "CHWS Temp": 6.0,
-            "CHWR Temp": 12.0,
-            "Delta TCW": 4.0,
-            "CW Actuator Level": 50.0,
-            "CW Actuator F/B": 0,
-            "FA Temp": 22.0,
-            "Delta T Air": 2.0,
-            "RA DFT": 0.0,
-            "RA Set Temp": 22.0,
-            "DH %RH Set": 50.0,
-            "Unit Status": 1,
-            "HW Actuator Level": 50.0,
-            "HW Actuator F/B": 0,
-        }
-        self.param_vars = {}  # holds tkinter DoubleVars for each parameter
-
-        self.create_widgets()
-    
-    def create_widgets(self):
-        # ---------------------------
-        # Database Settings Panel
-        # ---------------------------
-        db_frame = tk.LabelFrame(self, text="Database Settings", padx=10, pady=10)
-        db_frame.pack(pady=10, fill="x", padx=10)
-        
-        # Database Type: OptionMenu
-        tk.Label(db_frame, text="DB Type:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.db_type_var = tk.StringVar(value="SQLite")
-        db_type_menu = ttk.Combobox(db_frame, textvariable=self.db_type_var, 
-                                    values=["SQLite", "PostgreSQL", "MySQL"], state="readonly", width=12)
-        db_type_menu.grid(row=0, column=1, padx=5, pady=5)
-
-        # For SQLite, we only need a file path.
-        tk.Label(db_frame, text="File/Host:").grid(row=0, column=2, padx=5, pady=5, sticky="w")
-        self.db_file_var = tk.StringVar(value="simulation_data.db")
-        self.db_file_entry = tk.Entry(db_frame, textvariable=self.db_file_var, width=20)
-        self.db_file_entry.grid(row=0, column=3, padx=5, pady=5)
-        
-        # Additional fields for PostgreSQL/MySQL
-        tk.Label(db_frame, text="Port:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        self.db_port_var = tk.StringVar(value="5432")  # default PostgreSQL port
-        self.db_port_entry = tk.Entry(db_frame, textvariable=self.db_port_var, width=10)
-        self.db_port_entry.grid(row=1, column=1, padx=5, pady=5)
-        
-        tk.Label(db_frame, text="Username:").grid(row=1, column=2, padx=5, pady=5, sticky="w")
-        self.db_username_var = tk.StringVar(value="postgres")
-        self.db_username_entry = tk.Entry(db_frame, textvariable=self.db_username_var, width=15)
-        self.db_username_entry.grid(row=1, column=3, padx=5, pady=5)
-        
-        tk.Label(db_frame, text="Password:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
-        self.db_password_var = tk.StringVar(value="")
-        self.db_password_entry = tk.Entry(db_frame, textvariable=self.db_password_var, width=15, show="*")
-        self.db_password_entry.grid(row=2, column=1, padx=5, pady=5)
-        
-        tk.Label(db_frame, text="Database Name:").grid(row=2, column=2, padx=5, pady=5, sticky="w")
-        self.db_name_var = tk.StringVar(value="hvac_db")
-        self.db_name_entry = tk.Entry(db_frame, textvariable=self.db_name_var, width=15)
-        self.db_name_entry.grid(row=2, column=3, padx=5, pady=5)
-        
-        tk.Button(db_frame, text="Connect Database", command=self.connect_database, bg="lightyellow")\
-            .grid(row=3, column=0, columnspan=4, pady=10)
-        
-        # ---------------------------
-        # Top Frame: Building & Floor Controls
-        # ---------------------------
-        top_frame = tk.Frame(self)
-        top_frame.pack(pady=10)
-        
-        # Building control
-        building_frame = tk.Frame(top_frame)
-        building_frame.pack(side=tk.LEFT, padx=20)
-        tk.Label(building_frame, text="Building").grid(row=0, column=0)
-        self.building_label = tk.Label(building_frame, text=str(self.building), width=5, relief="sunken")
-        self.building_label.grid(row=0, column=1)
-        tk.Button(building_frame, text="+", width=3, command=self.increase_building)\
-            .grid(row=0, column=2, padx=2)
-        tk.Button(building_frame, text="-", width=3, command=self.decrease_building)\
-            .grid(row=0, column=3, padx=2)
-        
-        # Floor control
-        floor_frame = tk.Frame(top_frame)
-        floor_frame.pack(side=tk.LEFT, padx=20)
-        tk.Label(floor_frame, text="Floor").grid(row=0, column=0)
-        self.floor_label = tk.Label(floor_frame, text=str(self.floor), width=5, relief="sunken")
-        self.floor_label.grid(row=0, column=1)
-        tk.Button(floor_frame, text="+", width=3, command=self.increase_floor)\
-            .grid(row=0, column=2, padx=2)
-        tk.Button(floor_frame, text="-", width=3, command=self.decrease_floor)\
-            .grid(row=0, column=3, padx=2)
-        
-        # ---------------------------
-        # Auto Dump Settings
-        # ---------------------------
-        auto_dump_frame = tk.Frame(self)
-        auto_dump_frame.pack(pady=10)
-        
-        tk.Label(auto_dump_frame, text="Dump Interval (s):").grid(row=0, column=0, padx=5)
-        self.dump_interval_entry = tk.Entry(auto_dump_frame, width=5)
-        self.dump_interval_entry.insert(0, "5")  # default 5 seconds
-        self.dump_interval_entry.grid(row=0, column=1, padx=5)
-        
-        tk.Label(auto_dump_frame, text="Total Duration (s):").grid(row=0, column=2, padx=5)
-        self.total_duration_entry = tk.Entry(auto_dump_frame, width=5)
-        self.total_duration_entry.insert(0, "60")  # default 60 seconds
-        self.total_duration_entry.grid(row=0, column=3, padx=5)
-        
-        tk.Button(auto_dump_frame, text="Start Auto Dump", command=self.start_auto_dump, bg="lightblue")\
-            .grid(row=0, column=4, padx=10)
-        tk.Button(auto_dump_frame, text="Stop Auto Dump", command=self.stop_auto_dump, bg="lightcoral")\
-            .grid(row=0, column=5, padx=10)
-        
-        # ---------------------------
-        # Simulation Parameters Frame
-        # ---------------------------
-        param_frame = tk.Frame(self)
-        param_frame.pack(pady=10, fill=tk.BOTH, expand=True)
-        
-        # Canvas & Scrollbar for many parameters.
-        canvas = tk.Canvas(param_frame)
-        scrollbar = tk.Scrollbar(param_frame, orient="vertical", command=canvas.yview)
-        self.scrollable_frame = tk.Frame(canvas)
-        
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
-        canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        # Create one row per parameter with label, current value, and + / - buttons.
-        row = 0
-        for param, value in self.params.items():
-            tk.Label(self.scrollable_frame, text=param, width=20, anchor="w")\
-                .grid(row=row, column=0, padx=5, pady=5)
-            var = tk.DoubleVar(value=value)
-            self.param_vars[param] = var
-            value_label = tk.Label(self.scrollable_frame, textvariable=var, width=10, relief="sunken")
-            value_label.grid(row=row, column=1, padx=5)
-            tk.Button(self.scrollable_frame, text="+", width=3, 
-                      command=lambda p=param: self.increment(p))\
-                      .grid(row=row, column=2, padx=5)
-            tk.Button(self.scrollable_frame, text="-", width=3, 
-                      command=lambda p=param: self.decrement(p))\
-                      .grid(row=row, column=3, padx=5)
-            row += 1
-        
-        # ---------------------------
-        # Auto Dump Log (Dashboard)
-        # ---------------------------
-        log_frame = tk.Frame(self)
-        log_frame.pack(pady=10, fill=tk.BOTH, expand=True)
-        tk.Label(log_frame, text="Auto Dump Log (Dashboard)", font=("Arial", 12, "bold"))\
-            .pack()
-        self.dump_log = tk.Text(log_frame, height=10)
-        self.dump_log.pack(fill=tk.BOTH, expand=True)
-    
-    # ----- Database Connection -----
-    def connect_database(self):
-        db_type = self.db_type_var.get()
-        if db_type == "SQLite":
-            file_path = self.db_file_var.get() or "simulation_data.db"
-            connection_string = f"sqlite:///{file_path}"
-        elif db_type == "PostgreSQL":
-            host = self.db_file_var.get() or "localhost"
-            port = self.db_port_var.get() or "5432"
-            username = self.db_username_var.get() or "postgres"
-            password = self.db_password_var.get() or ""
-            dbname = self.db_name_var.get() or "hvac_db"
-            connection_string = f"postgresql://{username}:{password}@{host}:{port}/{dbname}"
-        elif db_type == "MySQL":
-            host = self.db_file_var.get() or "localhost"
-            port = self.db_port_var.get() or "3306"
-            username = self.db_username_var.get() or "root"
-            password = self.db_password_var.get() or ""
-            dbname = self.db_name_var.get() or "hvac_db"
-            connection_string = f"mysql+pymysql://{username}:{password}@{host}:{port}/{dbname}"
-        else:
-            connection_string = "sqlite:///simulation_data.db"
-        
-        try:
-            self.engine = create_engine(connection_string, echo=False)
-            Base.metadata.create_all(self.engine)
-            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-            self.dump_log.insert(tk.END, f"Connected to database using: {connection_string}\n")
-        except Exception as e:
-            self.dump_log.insert(tk.END, f"Error connecting to database: {e}\n")
-    
-    # ----- Building and Floor Controls -----
-    def increase_building(self):
-        self.building += 1
-        self.building_label.config(text=str(self.building))
-    
-    def decrease_building(self):
-        if self.building > 1:
-            self.building -= 1
-        self.building_label.config(text=str(self.building))
-    
-    def increase_floor(self):
-        self.floor += 1
-        self.floor_label.config(text=str(self.floor))
-    
-    def decrease_floor(self):
-        if self.floor > 1:
-            self.floor -= 1
-        self.floor_label.config(text=str(self.floor))
-    
-    # ----- Parameter Adjustment -----
-    def increment(self, param):
-        current = self.param_vars[param].get()
-        self.param_vars[param].set(current + 1)
-    
-    def decrement(self, param):
-        current = self.param_vars[param].get()
-        self.param_vars[param].set(current - 1)
-    
-    # ----- Dump Data to Database using SQLAlchemy -----
-    def dump_data(self):
-        # If not connected, default to SQLite
-        if not self.SessionLocal:
-            self.engine = create_engine("sqlite:///simulation_data.db", echo=False)
-            Base.metadata.create_all(self.engine)
-            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-        
-        session = self.SessionLocal()
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        data = {param: var.get() for param, var in self.param_vars.items()}
-        record = SimulationData(
-            timestamp=timestamp,
-            building=self.building,
-            floor=self.floor,
-            unit_status_fb=data["Unit Status F/B"],
-            ra_temp=data["RA Temp"],
-            ra_humidity=data["RA Humidity"],
-            sa_temp=data["SA Temp"],
-            sa_dpt=data["SA DPT"],
-            chws_temp=data["CHWS Temp"],
-            chwr_temp=data["CHWR Temp"],
-            delta_tcw=data["Delta TCW"],
-            cw_actuator_level=data["CW Actuator Level"],
-            cw_actuator_fb=data["CW Actuator F/B"],
-            fa_temp=data["FA Temp"],
-            delta_t_air=data["Delta T Air"],
-            ra_dft=data["RA DFT"],
-            ra_set_temp=data["RA Set Temp"],
-            dh_rh_set=data["DH %RH Set"],
-            unit_status=data["Unit Status"],
-            hw_actuator_level=data["HW Actuator Level"],
-            hw_actuator_fb=data["HW Actuator F/B"]
-        )
-        session.add(record)
-        session.commit()
-        session.close()
-        
-        log_str = f"{timestamp}: " + ", ".join([f"{p}={data[p]}" for p in data])
-        return log_str
-    
-    # ----- Auto Dump Functions -----
-    def start_auto_dump(self):
-        try:
-            interval = float(self.dump_interval_entry.get())
-            total_duration = float(self.total_duration_entry.get())
-        except ValueError:
-            self.dump_log.insert(tk.END, "Invalid interval or duration input.\n")
-            return
-        
-        self.auto_dump_interval = interval
-        self.auto_dump_end_time = time.time() + total_duration
-        self.dump_log.insert(tk.END, f"Auto dump started: interval {interval}s, duration {total_duration}s.\n")
-        self.auto_dump()  # begin the auto dump cycle
-    
-    def auto_dump(self):
-        current_time = time.time()
-        if current_time <= self.auto_dump_end_time:
-            log_str = self.dump_data()
-            self.dump_log.insert(tk.END, "Auto Dump -> " + log_str + "\n")
-            # Schedule next dump after the specified interval
-            self.auto_dump_job = self.after(int(self.auto_dump_interval * 1000), self.auto_dump)
-        else:
-            self.dump_log.insert(tk.END, "Auto dump finished. Total duration reached.\n")
-            self.auto_dump_job = None
-    
-    def stop_auto_dump(self):
-        if self.auto_dump_job:
-            self.after_cancel(self.auto_dump_job)
-            self.auto_dump_job = None
-            self.dump_log.insert(tk.END, "Auto dump manually stopped.\n")
+# Initial value of every parameter, and the simulation_data column it is stored in
+DEFAULT_PARAMS = {
+    "Unit Status F/B": 0,
+    "RA Temp": 22.0,
+    "RA Humidity": 50.0,
+    "SA Temp": 22.0,
+    "SA DPT": 10.0,
+    "CHWS Temp": 6.0,
+    "CHWR Temp": 12.0,
+    "Delta TCW": 4.0,
+    "CW Actuator Level": 50.0,
+    "CW Actuator F/B": 0,
+    "FA Temp": 22.0,
+    "Delta T Air": 2.0,
+    "RA DFT": 0.0,
+    "RA Set Temp": 22.0,
+    "DH %RH Set": 50.0,
+    "Unit Status": 1,
+    "HW Actuator Level": 50.0,
+    "HW Actuator F/B": 0,
+}
+
+PARAM_COLUMNS = {
+    "Unit Status F/B": "unit_status_fb",
+    "RA Temp": "ra_temp",
+    "RA Humidity": "ra_humidity",
+    "SA Temp": "sa_temp",
+    "SA DPT": "sa_dpt",
+    "CHWS Temp": "chws_temp",
+    "CHWR Temp": "chwr_temp",
+    "Delta TCW": "delta_tcw",
+    "CW Actuator Level": "cw_actuator_level",
+    "CW Actuator F/B": "cw_actuator_fb",
+    "FA Temp": "fa_temp",
+    "Delta T Air": "delta_t_air",
+    "RA DFT": "ra_dft",
+    "RA Set Temp": "ra_set_temp",
+    "DH %RH Set": "dh_rh_set",
+    "Unit Status": "unit_status",
+    "HW Actuator Level": "hw_actuator_level",
+    "HW Actuator F/B": "hw_actuator_fb",
+}
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _relax(current, target, dt, tau):
+    """Move `current` toward `target` as a first-order lag with time constant `tau` (stable for any dt)."""
+    return current + (target - current) * (1.0 - np.exp(-dt / tau))
+
+
+class SimulationEngine:
+    """State of many air handling units held as NumPy arrays, one element per (building, floor).
+
+    Each step() advances every unit at once: the return air temperature
+    drifts with the outdoor temperature and internal gains, the chilled and
+    hot water valves follow the error from the set point, and the supply
+    air, water temperatures, humidity and feedback signals follow the
+    valves. write() stores the current state as one row per unit.
+    """
+
+    def __init__(self, units, seed=None):
+        self.units = list(units)
+        n = len(self.units)
+        self.rng = np.random.default_rng(seed)
+        self.building = np.array([b for b, _ in self.units], dtype=np.int64)
+        self.floor = np.array([f for _, f in self.units], dtype=np.int64)
+        self.state = {column: np.full(n, float(DEFAULT_PARAMS[param])) for param, column in PARAM_COLUMNS.items()}
+        # Per-unit differences so units do not move in lockstep
+        self.state["ra_set_temp"] += self.rng.choice([-1.0, 0.0, 0.0, 1.0, 2.0], n)
+        self.state["ra_temp"] = self.state["ra_set_temp"] + self.rng.normal(0.0, 1.0, n)
+        self.envelope_tau = self.rng.uniform(5400.0, 9000.0, n)   # s, how fast rooms follow outdoor air
+        self.internal_gain = self.rng.uniform(0.0002, 0.0008, n)  # degC/s from people and equipment
+        # Outdoor air and the chilled water plant are shared by every floor of a building
+        self.buildings, self.building_index = np.unique(self.building, return_inverse=True)
+        self.climate_offset = self.rng.normal(0.0, 1.5, len(self.buildings))
+        self.plant_offset = np.zeros(len(self.buildings))
+
+    @classmethod
+    def grid(cls, buildings, floors, seed=None):
+        """An engine for buildings 1..N, each with floors 1..M."""
+        return cls([(b, f) for b in range(1, buildings + 1) for f in range(1, floors + 1)], seed)
+
+    def __len__(self):
+        return len(self.units)
+
+    def get_values(self, index):
+        """Parameter values of one unit, keyed like DEFAULT_PARAMS."""
+        return {param: round(float(self.state[column][index]), 2) for param, column in PARAM_COLUMNS.items()}
+
+    def set_values(self, index, values):
+        """Overwrite parameters (keyed like DEFAULT_PARAMS) of one unit."""
+        for param, value in values.items():
+            self.state[PARAM_COLUMNS[param]][index] = value
+
+    def step(self, dt, now):
+        """Advance every unit by `dt` seconds, ending at datetime `now`."""
+        s, n, rng = self.state, len(self), self.rng
+        hour = now.hour + now.minute / 60.0
+
+        # Outdoor air: daily cycle peaking mid-afternoon
+        outdoor = 26.0 + 6.0 * np.sin(2 * np.pi * (hour - 9.0) / 24.0) + self.climate_offset
+        s["fa_temp"] = outdoor[self.building_index] + rng.normal(0.0, 0.2, n)
+
+        # Units trip now and then and restart a few minutes later; the feedback follows the command
+        running = s["unit_status"] > 0.5
+        trip = rng.random(n) < dt / (7 * 24 * 3600.0)
+        restart = rng.random(n) < dt / 600.0
+        running = np.where(running, ~trip, restart)
+        s["unit_status"] = running.astype(float)
+        s["unit_status_fb"] = np.where(rng.random(n) < 0.001, 1.0 - s["unit_status"], s["unit_status"])
+
+        # Proportional valve control on the return air error
+        error = s["ra_temp"] - s["ra_set_temp"]
+        cw_target = np.where(running, np.clip(50.0 + 25.0 * error, 0.0, 100.0), 0.0)
+        hw_target = np.where(running, np.clip(-40.0 * (error + 0.5), 0.0, 100.0), 0.0)
+        s["cw_actuator_level"] = _relax(s["cw_actuator_level"], cw_target, dt, 60.0)
+        s["hw_actuator_level"] = _relax(s["hw_actuator_level"], hw_target, dt, 60.0)
+        s["cw_actuator_fb"] = np.clip(_relax(s["cw_actuator_fb"], s["cw_actuator_level"], dt, 20.0)
+                                      + rng.normal(0.0, 0.5, n), 0.0, 100.0)
+        s["hw_actuator_fb"] = np.clip(_relax(s["hw_actuator_fb"], s["hw_actuator_level"], dt, 20.0)
+                                      + rng.normal(0.0, 0.5, n), 0.0, 100.0)
+        cooling = s["cw_actuator_fb"] / 100.0
+        heating = s["hw_actuator_fb"] / 100.0
+
+        # Room heat balance: envelope and internal gains against coil capacity
+        drift = (s["fa_temp"] - s["ra_temp"]) / self.envelope_tau + self.internal_gain \
+            - running * (0.0025 * cooling - 0.002 * heating)
+        s["ra_temp"] = s["ra_temp"] + np.clip(drift * dt, -5.0, 5.0) + rng.normal(0.0, 0.02 * np.sqrt(dt), n)
+        s["ra_dft"] = s["ra_temp"] - s["ra_set_temp"]
+
+        # Supply air leaves the coils colder (or warmer) in proportion to the valve positions
+        coil = running * (12.0 * cooling - 10.0 * heating)
+        s["sa_temp"] = _relax(s["sa_temp"], s["ra_temp"] - coil, dt, 30.0) + rng.normal(0.0, 0.1, n)
+        s["delta_t_air"] = s["ra_temp"] - s["sa_temp"]
+
+        # The cooling coil dries the air; the dehumidification set point caps the room humidity
+        humidity_target = np.minimum(60.0 - 15.0 * cooling * running, s["dh_rh_set"] + 5.0)
+        s["ra_humidity"] = np.clip(_relax(s["ra_humidity"], humidity_target, dt, 900.0)
+                                   + rng.normal(0.0, 0.1, n), 20.0, 90.0)
+        s["sa_dpt"] = np.minimum(s["ra_temp"] - (100.0 - s["ra_humidity"]) / 5.0, s["sa_temp"])
+
+        # Chilled water: the plant supply wanders slowly; the return warms with the coil load
+        self.plant_offset = np.clip(self.plant_offset + rng.normal(0.0, 0.01 * np.sqrt(dt), len(self.buildings)),
+                                    -1.0, 2.0)
+        s["chws_temp"] = 6.0 + self.plant_offset[self.building_index] + rng.normal(0.0, 0.05, n)
+        s["delta_tcw"] = _relax(s["delta_tcw"], 1.0 + 5.0 * cooling * running, dt, 120.0)
+        s["chwr_temp"] = s["chws_temp"] + s["delta_tcw"]
+
+    def rows(self, timestamp, ts):
+        """One simulation_data row (a dict) per unit, for a bulk insert."""
+        columns = ["timestamp", "ts", "building", "floor"] + list(self.state)
+        values = np.column_stack([self.state[column] for column in self.state]).round(3).tolist()
+        return [dict(zip(columns, (timestamp, ts, b, f, *row)))
+                for b, f, row in zip(self.building.tolist(), self.floor.tolist(), values)]
+
+    def write(self, conn, now):
+        """Insert the current state stamped `now` with a single executemany; returns the row count."""
+        rows = self.rows(now.strftime(TIMESTAMP_FORMAT), calendar.timegm(now.timetuple()))
+        conn.execute(SimulationData.__table__.insert(), rows)
+        return len(rows)
+
+
+def make_engine(db_url):
+    """Engine for the simulator; SQLite databases get WAL and relaxed fsync for sustained writes."""
+    engine = create_engine(db_url, echo=False)
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _pragmas(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA journal_mode=WAL")
+            dbapi_connection.execute("PRAGMA synchronous=NORMAL")
+    create_schema(engine)
+    return engine
+
+
+def run_simulation(engine, simulator, rate=None, interval=1.0, duration=60.0, start=None, end=None):
+    """Write simulator ticks and report throughput.
+
+    Both modes stamp ticks with a simulated clock that starts at `start`
+    (live mode: now) and advances by `interval`, at least one second since
+    timestamps have one-second resolution, so no two ticks share a
+    timestamp. Live mode (no `start`) writes one tick every `interval`
+    seconds, or at `rate` rows/s when given, for `duration` seconds of wall
+    time; above one tick per second its clock runs ahead of the wall clock.
+    Backfill mode writes from `start` to `end` inclusive as fast as the
+    database accepts.
+    """
+    if rate:
+        interval = len(simulator) / rate
+    tick = timedelta(seconds=max(interval, 1.0))
+    insert_latencies = []
+    rows = 0
+    clock = start if start is not None else datetime.now().replace(microsecond=0)
+    begin = time.perf_counter()
+    while True:
+        if start is None:
+            elapsed = time.perf_counter() - begin
+            if elapsed >= duration:
+                break
+            due = len(insert_latencies) * interval
+            if due > elapsed:
+                time.sleep(min(due - elapsed, duration - elapsed))
+                continue
+        elif clock > end:
+            break
+        simulator.step(tick.total_seconds(), clock)
+        insert_start = time.perf_counter()
+        with engine.begin() as conn:
+            rows += simulator.write(conn, clock)
+        insert_latencies.append(time.perf_counter() - insert_start)
+        clock += tick
+    elapsed = time.perf_counter() - begin
+
+    to_ms = lambda seconds: round(seconds * 1000, 2)
+    latencies = np.array(insert_latencies or [0.0])
+    return {
+        'units': len(simulator),
+        'ticks': len(insert_latencies),
+        'rows': rows,
+        'seconds': round(elapsed, 2),
+        'target_rows_per_s': rate,
+        'achieved_rows_per_s': round(rows / elapsed, 1) if elapsed else None,
+        'insert_ms_p50': to_ms(np.percentile(latencies, 50)),
+        'insert_ms_p95': to_ms(np.percentile(latencies, 95)),
+        'insert_ms_max': to_ms(latencies.max()),
+    }
+
 
 # ---------------------------
 # Run the Application
 # ---------------------------
+def main():
+    parser = argparse.ArgumentParser(description="HVAC simulator")
+    parser.add_argument('command', nargs='?', choices=['gui', 'simulate'], default='gui')
+    parser.add_argument('--db-url', default='sqlite:///simulation_data.db')
+    parser.add_argument('--buildings', type=int, default=10)
+    parser.add_argument('--floors', type=int, default=10)
+    parser.add_argument('--rate', type=int, default=None, help="target rows/s (overrides --interval)")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between ticks")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds to run (live mode)")
+    parser.add_argument('--start', default=None, help="backfill from this timestamp instead of running live")
+    parser.add_argument('--end', default=None, help="end of the backfill (default: now)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'gui':
+        # Imported here so that `simulate` runs on Python builds without Tk
+        from simulator_gui import HVACSimulatorApp
+        app = HVACSimulatorApp()
+        app.mainloop()
+        return
+
+    engine = make_engine(args.db_url)
+    simulator = SimulationEngine.grid(args.buildings, args.floors, args.seed)
+    start = datetime.strptime(args.start, TIMESTAMP_FORMAT) if args.start else None
+    end = datetime.strptime(args.end, TIMESTAMP_FORMAT) if args.end else datetime.now().replace(microsecond=0)
+    report = run_simulation(engine, simulator, args.rate, args.interval, args.duration, start, end)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
 if __name__ == "__main__":
-    app = HVACSimulatorApp()
-    app.mainloop()
+    main()
@@ -0,0 +1,151 @@
+"""Summary PDF reports built from chunked, vectorised pandas aggregations."""
+
+import pandas as pd
+from fpdf import FPDF
+
+# Summary periods and the pandas period frequency used for each
+PERIODS = {
+    'hourly': 'h',
+    'daily': 'D',
+    'weekly': 'W',
+    'monthly': 'M',
+    'yearly': 'Y',
+}
+
+# Hard cap on raw rows printed in the optional appendix
+MAX_APPENDIX_ROWS = 1000
+
+SUMMARY_COLUMNS = [('Period', 40), ('Sensor', 54), ('Min', 24), ('Max', 24), ('Avg', 24), ('Count', 24)]
+
+
+def summarise(frames, keys, period='monthly', sensor_col='sensor', value_col='value',
+              wide_columns=None, appendix_rows=0, progress=None):
+    """Aggregate min/max/avg/count per key, period and sensor over DataFrame chunks.
+
+    Long frames carry one reading per row in `sensor_col`/`value_col`; wide
+    frames are melted using `wide_columns` as the sensor columns. Only the
+    per-group partial aggregates are kept, so memory is bounded by the
+    number of groups rather than the number of rows.
+    Returns (summary, appendix) DataFrames.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unsupported period '{period}'")
+    freq = PERIODS[period]
+    appendix_rows = max(0, min(int(appendix_rows or 0), MAX_APPENDIX_ROWS))
+
+    partials = []
+    appendix = []
+    kept = 0
+    rows_read = 0
+    for frame in frames:
+        if kept < appendix_rows:
+            appendix.append(frame.head(appendix_rows - kept))
+            kept += len(appendix[-1])
+        rows_read += len(frame)
+
+        if wide_columns is not None:
+            frame = frame.melt(id_vars=keys + ['timestamp'], value_vars=list(wide_columns),
+                               var_name=sensor_col, value_name=value_col)
+        frame = frame.assign(
+            period=pd.to_datetime(frame['timestamp']).dt.to_period(freq),
+            **{value_col: pd.to_numeric(frame[value_col], errors='coerce')},
+        )
+        partials.append(
+            frame.groupby(keys + ['period', sensor_col])[value_col].agg(['min', 'max', 'sum', 'count'])
+        )
+        if progress:
+            progress(rows_read)
+
+    if not partials:
+        summary = pd.DataFrame(columns=keys + ['period', sensor_col, 'min', 'max', 'avg', 'count'])
+    else:
+        combined = pd.concat(partials)
+        summary = combined.groupby(level=list(range(combined.index.nlevels))).agg(
+            {'min': 'min', 'max': 'max', 'sum': 'sum', 'count': 'sum'})
+        summary['avg'] = summary['sum'] / summary['count'].where(summary['count'] > 0)
+        summary = summary.drop(columns='sum').reset_index()
+        summary['period'] = summary['period'].astype(str)
+        summary = summary.rename(columns={sensor_col: 'sensor'})
+    appendix = pd.concat(appendix) if appendix else pd.DataFrame()
+    return summary, appendix
+
+
+def _fmt(value):
+    if value is None or pd.isna(value):
+        return '-'
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def _clip(value, width):
+    text = _fmt(value)
+    max_chars = int(width / 2)
+    return text if len(text) <= max_chars else text[:max_chars - 3] + '...'
+
+
+class ReportPDF(FPDF):
+    def footer(self):
+        self.set_y(-12)
+        self.set_font('Arial', size=8)
+        self.cell(0, 8, f"Page {self.page_no()}", align='C')
+
+    def ensure_space(self, height, header=None):
+        # Start a new page (repeating the table header) when the next row would not fit
+        if self.get_y() + height > self.h - 20:
+            self.add_page()
+            if header:
+                header()
+
+    def table_header(self, columns, body_size=9):
+        self.set_font('Arial', 'B', body_size)
+        for title, width in columns:
+            self.cell(width, 7, title, border=1, align='C')
+        self.ln()
+        self.set_font('Arial', size=body_size)
+
+
+def write_report_pdf(path, title, summary, keys, key_labels, appendix=None):
+    """Render a summary report: one paginated table per key group, then the raw appendix."""
+    pdf = ReportPDF()
+    pdf.set_auto_page_break(auto=False)
+    pdf.add_page()
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, title, ln=True, align='C')
+    pdf.set_font('Arial', size=9)
+    pdf.cell(0, 6, f"{len(summary)} summary rows", ln=True, align='C')
+    pdf.ln(4)
+
+    header = lambda: pdf.table_header(SUMMARY_COLUMNS)
+    for group, rows in summary.groupby(keys, sort=True) if len(summary) else []:
+        group = group if isinstance(group, tuple) else (group,)
+        pdf.ensure_space(24)
+        pdf.set_font('Arial', 'B', 11)
+        label = ', '.join(f"{name} {value}" for name, value in zip(key_labels, group))
+        pdf.cell(0, 8, label, ln=True)
+        header()
+        for row in rows.itertuples(index=False):
+            pdf.ensure_space(6, header)
+            values = [row.period, row.sensor, row.min, row.max, row.avg, row.count]
+            for (_, width), value in zip(SUMMARY_COLUMNS, values):
+                pdf.cell(width, 6, _clip(value, width), border=1)
+            pdf.ln()
+        pdf.ln(4)
+
+    if appendix is not None and len(appendix):
+        columns = list(appendix.columns)
+        width = (pdf.w - 20) / len(columns)
+        appendix_columns = [(str(col), width) for col in columns]
+        pdf.add_page()
+        pdf.set_font('Arial', 'B', 11)
+        pdf.cell(0, 8, f"Raw data appendix (first {len(appendix)} rows)", ln=True)
+        header = lambda: pdf.table_header([(_clip(col, width), width) for col, width in appendix_columns], 7)
+        header()
+        for row in appendix.itertuples(index=False):
+            pdf.ensure_space(5, header)
+            for value in row:
+                pdf.cell(width, 5, _clip(value, width), border=1)
+            pdf.ln()
+
+    pdf.output(path)
+    return path
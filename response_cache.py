@@ -0,0 +1,177 @@
+"""Response cache for metadata and aggregate endpoints.
+
+Entries are stamped with the data version - the id and timestamp of the newest
+row the ingest path has written - so a cached answer is only topped up from
+rows written after it rather than recomputed. Responses carry an ETag derived
+from the same version, letting browsers revalidate with 304s.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import Response, jsonify, request
+
+from aggregation import TIMESTAMP_FORMAT, bucket_start
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+# Seconds before an entry is rebuilt from scratch (bounds staleness after deletes)
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 3600))
+# Optional shared backend, e.g. redis://localhost:6379/0
+CACHE_URL = os.environ.get('CACHE_URL')
+
+
+class LRUCache:
+    """In-process LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """Cache shared between worker processes; needs the optional `redis` package."""
+
+    def __init__(self, url, ttl=CACHE_TTL, prefix='hvac-cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        return self.prefix + hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.client.get(self._key(key))
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self._key(key), pickle.dumps(value), ex=int(self.ttl))
+
+    def clear(self):
+        for name in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(name)
+
+
+def make_cache(url=CACHE_URL):
+    if url and url.startswith(('redis://', 'rediss://')):
+        return RedisCache(url)
+    return LRUCache()
+
+
+cache = make_cache()
+
+
+def data_version(execute, table):
+    """(max id, its timestamp) of `table`: a primary-key lookup, not a scan."""
+    rows = execute(f"SELECT id, timestamp FROM {table} ORDER BY id DESC LIMIT 1")
+    return tuple(rows[0]) if rows else (0, None)
+
+
+def cached_distinct(key, version, compute, compute_since):
+    """Sorted distinct values, topped up from rows written after the cached version.
+
+    `compute()` reads every row; `compute_since(last_id)` only rows with a
+    larger id, which the primary key answers without a table scan.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry[1] == version:
+        return entry[0]
+    if entry is not None:
+        values = set(entry[0]) | set(compute_since(entry[1][0]))
+    else:
+        values = compute()
+    values = sorted(value for value in set(values) if value is not None)
+    cache.set(key, (values, version))
+    return values
+
+
+def cached_series(key, version, fetch, oldest_change):
+    """Bucketed (label, value) rows, ascending, re-reading only the buckets new rows fall in.
+
+    Rows can arrive late, with timestamps inside already cached buckets. On a
+    new version, `oldest_change(last_id)` gives the oldest timestamp among the
+    rows written after the cached version. `fetch(since_label)` then
+    re-aggregates from the bucket holding it onwards, and `fetch(None)` reads
+    the whole series.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry[1] == version:
+        return entry[0]
+    if entry is not None and entry[0]:
+        cached = entry[0]
+        oldest = oldest_change(entry[1][0])
+        starts = [bucket_start(label) for label, *_ in cached]
+        if oldest is None:
+            # Nothing newer by id (e.g. rows were deleted): re-read the newest bucket
+            keep = len(cached) - 1
+        else:
+            keep = min(bisect_right(starts, str(oldest)) - 1, len(cached) - 1)
+        if keep < 0:
+            rows = [tuple(row) for row in fetch(None)]
+        else:
+            rows = cached[:keep] + [tuple(row) for row in fetch(cached[keep][0])]
+    else:
+        rows = [tuple(row) for row in fetch(None)]
+    cache.set(key, (rows, version))
+    return rows
+
+
+def _last_modified(timestamp):
+    if isinstance(timestamp, datetime):
+        return timestamp
+    try:
+        return datetime.strptime(str(timestamp), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def conditional_json(key, version, build):
+    """JSON response validated by ETag/Last-Modified; 304 when the client is current.
+
+    `build()` is only called when the client's copy is stale and returns
+    either a JSON-able payload or a ready Response (e.g. a binary series).
+    """
+    etag = hashlib.sha1(repr((key, version)).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    payload = build()
+    response = payload if isinstance(payload, Response) else jsonify(payload)
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    if version[1] is not None:
+        response.last_modified = _last_modified(version[1])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
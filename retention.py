@@ -0,0 +1,318 @@
+"""Retention and archival of raw sensor rows.
+
+Raw simulation_data rows older than RETENTION_RAW_DAYS are written to
+compressed archive partitions, one per building and month, and then deleted
+in small batches. Rollups are kept longer, per granularity. On SQLite, the freed pages
+are handed back with incremental VACUUM, so the hot database stays small
+without a blocking full VACUUM.
+
+    <ARCHIVE_DIR>/<database>/<table>/building=<building>/month=<YYYY-MM>/<first id>-<last id>.parquet (or .csv.gz)
+    <ARCHIVE_DIR>/<database>/<table>/manifest.json   archived extent (timestamps, ids) per building and month
+
+Usage:
+    python retention.py run sqlite:///simulation_data.db [--dry-run] [--watch SECONDS]
+    python retention.py enable-incremental-vacuum sqlite:///sensor_data.db
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import bindparam, create_engine, inspect, text
+
+import rollups
+from aggregation import TIMESTAMP_FORMAT
+from storage import LAYOUTS
+from storage import STATE_TABLE as MIGRATION_STATE_TABLE
+
+logger = logging.getLogger(__name__)
+
+# Days of raw rows kept in the database
+RETENTION_RAW_DAYS = float(os.environ.get('RETENTION_RAW_DAYS', 30))
+
+# Days kept per rollup granularity (None keeps them forever)
+ROLLUP_RETENTION_DAYS = {
+    'minute': float(os.environ.get('RETENTION_MINUTE_ROLLUP_DAYS', 90)),
+    'hour': float(os.environ.get('RETENTION_HOUR_ROLLUP_DAYS', 730)),
+    'day': None,
+}
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+# parquet, csv (gzip) or none (delete without archiving)
+ARCHIVE_FORMAT = os.environ.get('ARCHIVE_FORMAT', 'parquet')
+
+# Rows archived and deleted per transaction, and seconds to yield to writers between batches
+RETENTION_BATCH = int(os.environ.get('RETENTION_BATCH', 5000))
+RETENTION_PAUSE = float(os.environ.get('RETENTION_PAUSE', 0.05))
+
+# Free pages returned per incremental_vacuum step
+VACUUM_PAGES = 2000
+
+# Raw tables and the column their archive is partitioned by. Only tables whose readers merge the
+# archive back in (app.py via archive.py) are expired; sensor_data and hvac_data are kept whole
+RAW_TABLES = {
+    'simulation_data': 'building',
+}
+
+ARCHIVE_EXTENSIONS = {'parquet': '.parquet', 'csv': '.csv.gz'}
+MANIFEST_NAME = 'manifest.json'
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        try:
+            import fastparquet  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+def archive_format(requested=ARCHIVE_FORMAT):
+    if requested not in ('parquet', 'csv', 'none'):
+        raise ValueError(f"Unsupported archive format '{requested}'")
+    if requested == 'parquet' and not parquet_available():
+        logger.warning("Parquet archives need 'pyarrow' (or 'fastparquet'); writing gzip CSV instead")
+        return 'csv'
+    return requested
+
+
+def cutoff(days, now=None):
+    """Stored-format timestamp before which rows are expired."""
+    return ((now or datetime.now()) - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
+
+def _partition_name(value):
+    return str(value).replace(os.sep, '_').replace('/', '_')
+
+
+def archive_root(engine, archive_dir=ARCHIVE_DIR):
+    """Archive directory of one database (its file stem or database name)."""
+    name = os.path.splitext(os.path.basename(engine.url.database or ''))[0] or 'default'
+    return os.path.join(archive_dir, _partition_name(name))
+
+
+def load_manifest(table_dir):
+    """{building: {month: extent}} recorded for one archived table, or None when there is no manifest."""
+    try:
+        with open(os.path.join(table_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def update_manifest(table_dir, extents):
+    """Widen the recorded extent of each (building, month) partition in `extents`."""
+    manifest = load_manifest(table_dir) or {}
+    for (building, month), extent in extents.items():
+        current = manifest.setdefault(building, {}).get(month)
+        if current is not None:
+            extent = {
+                'min_timestamp': min(current['min_timestamp'], extent['min_timestamp']),
+                'max_timestamp': max(current['max_timestamp'], extent['max_timestamp']),
+                'min_id': min(current['min_id'], extent['min_id']),
+                'max_id': max(current['max_id'], extent['max_id']),
+            }
+        manifest[building][month] = extent
+    path = os.path.join(table_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def write_partitions(frame, table, building_column, archive_dir, fmt):
+    """Write one batch of expired rows, split by building and month; returns the files written.
+
+    The manifest is updated before the rows are deleted, so it always covers
+    everything the archive holds.
+    """
+    paths, extents = [], {}
+    months = frame['timestamp'].astype(str).str[:7]
+    for (building, month), part in frame.groupby([frame[building_column].fillna(''), months], sort=False):
+        building = _partition_name(building)
+        directory = os.path.join(archive_dir, table, f"building={building}", f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{part['id'].min()}-{part['id'].max()}{ARCHIVE_EXTENSIONS[fmt]}")
+        if fmt == 'parquet':
+            part.to_parquet(path, index=False, compression='zstd')
+        else:
+            part.to_csv(path, index=False, compression='gzip')
+        paths.append(path)
+        timestamps = part['timestamp'].astype(str)
+        extents[(building, month)] = {
+            'min_timestamp': timestamps.min(),
+            'max_timestamp': timestamps.max(),
+            'min_id': int(part['id'].min()),
+            'max_id': int(part['id'].max()),
+        }
+    if extents:
+        update_manifest(os.path.join(archive_dir, table), extents)
+    return paths
+
+
+def protected_id(conn, table):
+    """Highest id that may be deleted: rows not yet folded into rollups or migrated are kept."""
+    tables = set(inspect(conn).get_table_names())
+    limits = []
+    if table == rollups.SOURCE_TABLE and rollups.STATE_TABLE in tables:
+        limits.append(rollups.watermark(conn))
+    if MIGRATION_STATE_TABLE in tables:
+        sources = [f"{cls.layout}:{table}" for cls in LAYOUTS.values() if cls.table == table]
+        rows = conn.execute(text(f"SELECT last_id FROM {MIGRATION_STATE_TABLE} WHERE source IN :sources")
+                            .bindparams(bindparam('sources', expanding=True)), {'sources': sources}).fetchall()
+        limits += [row[0] for row in rows]
+    return min(limits) if limits else None
+
+
+def expire_raw(engine, table, days=RETENTION_RAW_DAYS, archive_dir=ARCHIVE_DIR, fmt=ARCHIVE_FORMAT,
+               batch_size=RETENTION_BATCH, pause=RETENTION_PAUSE, dry_run=False):
+    """Archive and delete rows of `table` older than `days`, oldest first, one batch per transaction."""
+    building_column = RAW_TABLES[table]
+    fmt = archive_format(fmt)
+    filters = ["timestamp < :cutoff"]
+    params = {'cutoff': cutoff(days)}
+    with engine.connect() as conn:
+        limit_id = protected_id(conn, table)
+        if limit_id is not None:
+            filters.append("id <= :limit_id")
+            params['limit_id'] = limit_id
+        where = " AND ".join(filters)
+        if dry_run:
+            expired = conn.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {where}"), params).scalar()
+            return {'cutoff': params['cutoff'], 'expired': expired, 'deleted': 0, 'files': []}
+
+    # The timestamp index hands back the oldest rows first; deleted rows drop out of the next scan
+    select = text(f"SELECT * FROM {table} WHERE {where} ORDER BY timestamp, id LIMIT {int(batch_size)}")
+    delete = text(f"DELETE FROM {table} WHERE id IN :ids").bindparams(bindparam('ids', expanding=True))
+    report = {'cutoff': params['cutoff'], 'expired': 0, 'deleted': 0, 'files': []}
+    while True:
+        with engine.connect() as conn:
+            frame = pd.read_sql(select, conn, params=params)
+        if frame.empty:
+            return report
+        report['expired'] += len(frame)
+        if fmt != 'none':
+            # Archive first: a crash before the delete leaves rows in both places, never in neither
+            report['files'] += write_partitions(frame, table, building_column, archive_root(engine, archive_dir), fmt)
+        with engine.begin() as conn:
+            report['deleted'] += conn.execute(delete, {'ids': frame['id'].tolist()}).rowcount
+        logger.info(f"Expired {report['deleted']} rows of {table} older than {params['cutoff']}")
+        if len(frame) < batch_size:
+            return report
+        time.sleep(pause)
+
+
+def expire_rollups(engine, retention=None, pause=RETENTION_PAUSE, dry_run=False):
+    """Delete rollup buckets older than their granularity's retention, one day of buckets at a time."""
+    retention = ROLLUP_RETENTION_DAYS if retention is None else retention
+    tables = set(inspect(engine).get_table_names())
+    report = {}
+    for granularity, table in rollups.ROLLUP_TABLES.items():
+        days = retention.get(granularity)
+        if days is None or table not in tables:
+            continue
+        limit = cutoff(days)
+        with engine.connect() as conn:
+            oldest = conn.execute(text(f"SELECT MIN(timestamp) FROM {table}")).scalar()
+            if dry_run:
+                report[table] = conn.execute(text(f"SELECT COUNT(*) FROM {table} WHERE timestamp < :cutoff"),
+                                             {'cutoff': limit}).scalar()
+                continue
+        deleted = 0
+        step = datetime.strptime(oldest, TIMESTAMP_FORMAT) if oldest and oldest < limit else None
+        while step is not None:
+            step = step + timedelta(days=1)
+            bound = min(step.strftime(TIMESTAMP_FORMAT), limit)
+            with engine.begin() as conn:
+                deleted += conn.execute(text(f"DELETE FROM {table} WHERE timestamp < :bound"),
+                                        {'bound': bound}).rowcount
+            if bound == limit:
+                break
+            time.sleep(pause)
+        report[table] = deleted
+    return report
+
+
+def incremental_vacuum(engine, pages=VACUUM_PAGES, pause=RETENTION_PAUSE):
+    """Return free pages to the filesystem in small steps; returns pages freed (SQLite only).
+
+    Needs auto_vacuum=INCREMENTAL (see enable_incremental_vacuum); other
+    databases reclaim space with their own background vacuum.
+    """
+    if engine.dialect.name != 'sqlite':
+        return 0
+    freed = 0
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            logger.info("auto_vacuum is not INCREMENTAL; run `retention.py enable-incremental-vacuum` once")
+            return 0
+        while True:
+            free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            conn.commit()
+            if not free:
+                return freed
+            # The pragma frees one page per step; executescript runs it to completion
+            conn.connection.dbapi_connection.executescript(f"PRAGMA incremental_vacuum({pages});")
+            freed += min(free, pages)
+            time.sleep(pause)
+
+
+def enable_incremental_vacuum(engine):
+    """Switch a SQLite database to auto_vacuum=INCREMENTAL (a one-off full VACUUM that blocks writers)."""
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        return conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+
+
+def apply_retention(engine, raw_days=RETENTION_RAW_DAYS, archive_dir=ARCHIVE_DIR, fmt=ARCHIVE_FORMAT,
+                    batch_size=RETENTION_BATCH, dry_run=False):
+    """Run the whole policy against one database and report what it did."""
+    tables = set(inspect(engine).get_table_names())
+    report = {'raw': {}, 'rollups': {}, 'vacuumed_pages': 0}
+    for table in RAW_TABLES:
+        if table in tables:
+            report['raw'][table] = expire_raw(engine, table, raw_days, archive_dir, fmt, batch_size,
+                                              dry_run=dry_run)
+            report['raw'][table]['files'] = len(report['raw'][table]['files'])
+    report['rollups'] = expire_rollups(engine, dry_run=dry_run)
+    if not dry_run:
+        report['vacuumed_pages'] = incremental_vacuum(engine)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive and delete expired sensor rows")
+    parser.add_argument('command', choices=['run', 'enable-incremental-vacuum'])
+    parser.add_argument('db_url', nargs='?', default='sqlite:///simulation_data.db')
+    parser.add_argument('--raw-days', type=float, default=RETENTION_RAW_DAYS)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    parser.add_argument('--format', choices=['parquet', 'csv', 'none'], default=ARCHIVE_FORMAT)
+    parser.add_argument('--batch-size', type=int, default=RETENTION_BATCH)
+    parser.add_argument('--dry-run', action='store_true', help="only count what would expire")
+    parser.add_argument('--watch', type=float, default=None, help="re-apply the policy every N seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(args.db_url)
+
+    if args.command == 'enable-incremental-vacuum':
+        print(f"auto_vacuum = {enable_incremental_vacuum(engine)}")
+        return
+
+    while True:
+        report = apply_retention(engine, args.raw_days, args.archive_dir, args.format, args.batch_size,
+                                 args.dry_run)
+        print(json.dumps(report, indent=2))
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""Materialized per-minute/hour/day rollups of simulation_data.
+
+Each rollup table holds, per (building, floor, bucket start), the min, max,
+sum and count of every sensor column. Rollups are maintained incrementally
+from an id watermark, so a refresh only reads rows inserted since the last one.
+
+On PostgreSQL and MySQL, ids are assigned before commit, so a row can become
+visible after a higher id has been folded in. A refresh therefore only folds
+ids that were already allocated ROLLUP_SETTLE_SECONDS earlier, as seen by this
+process. Rows of a transaction that stays open longer than that are skipped
+and never counted, and retention may expire them. Rollups are exact on
+SQLite, where writers commit one at a time.
+
+Usage:
+    python rollups.py backfill sqlite:///simulation_data.db
+    python rollups.py refresh sqlite:///simulation_data.db [--watch SECONDS] [--settle SECONDS]
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine, inspect, text
+
+from aggregation import MINUTE_TIMELINES, truncate_expression
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TABLE = 'simulation_data'
+# Columns of simulation_data that are not sensors (ts: optional integer epoch timestamp)
+NON_SENSOR_COLUMNS = ('id', 'timestamp', 'ts', 'building', 'floor')
+STATE_TABLE = 'rollup_state'
+
+ROLLUP_TABLES = {
+    'minute': 'simulation_data_rollup_minute',
+    'hour': 'simulation_data_rollup_hour',
+    'day': 'simulation_data_rollup_day',
+}
+
+# Coarsest rollup whose buckets still divide each timeline evenly
+TIMELINE_GRANULARITY = dict.fromkeys(MINUTE_TIMELINES, 'minute')
+TIMELINE_GRANULARITY.update({
+    'hourly': 'hour',
+    'daily': 'day',
+    'weekly': 'day',
+    'monthly': 'day',
+    'yearly': 'day',
+})
+
+# Time of day of the first and last second of a bucket, as the tail of a stored timestamp
+BUCKET_EDGES = {
+    'minute': (':00', ':59'),
+    'hour': (':00:00', ':59:59'),
+    'day': ('00:00:00', '23:59:59'),
+}
+
+STAT_SUFFIXES = ('_min', '_max', '_sum', '_count')
+
+# Source ids folded into the rollups per transaction
+REFRESH_BATCH = int(os.environ.get('ROLLUP_REFRESH_BATCH', 100000))
+
+# Minimum seconds between opportunistic refreshes triggered by reads
+REFRESH_INTERVAL = float(os.environ.get('ROLLUP_REFRESH_INTERVAL', 5))
+
+# Seconds an allocated id is given to commit before it is folded in (not applied to SQLite)
+SETTLE_SECONDS = float(os.environ.get('ROLLUP_SETTLE_SECONDS', 60))
+
+
+def rollup_metadata(sensor_columns):
+    """Return MetaData describing the rollup and watermark tables."""
+    metadata = MetaData()
+    for table_name in ROLLUP_TABLES.values():
+        columns = [
+            Column('building', Integer, primary_key=True),
+            Column('floor', Integer, primary_key=True),
+            Column('timestamp', String(19), primary_key=True),
+        ]
+        for sensor in sensor_columns:
+            columns += [
+                Column(f'{sensor}_min', Float),
+                Column(f'{sensor}_max', Float),
+                Column(f'{sensor}_sum', Float),
+                Column(f'{sensor}_count', Integer),
+            ]
+        Table(table_name, metadata, *columns)
+    Table(
+        STATE_TABLE, metadata,
+        Column('name', String(64), primary_key=True),
+        Column('last_id', Integer, nullable=False),
+    )
+    return metadata
+
+
+def rollup_sensors(columns):
+    """Return the sensor names a rollup table with `columns` covers."""
+    return tuple(col[:-len('_min')] for col in columns if col.endswith('_min'))
+
+
+def _source_sensors(engine):
+    return [col['name'] for col in inspect(engine).get_columns(SOURCE_TABLE)
+            if col['name'] not in NON_SENSOR_COLUMNS]
+
+
+def _least(dialect, a, b):
+    fn = 'MIN' if dialect == 'sqlite' else 'LEAST'
+    return f"{fn}(COALESCE({a}, {b}), COALESCE({b}, {a}))"
+
+
+def _greatest(dialect, a, b):
+    fn = 'MAX' if dialect == 'sqlite' else 'GREATEST'
+    return f"{fn}(COALESCE({a}, {b}), COALESCE({b}, {a}))"
+
+
+def _merge_sql(dialect, granularity, sensors):
+    table = ROLLUP_TABLES[granularity]
+    bucket = truncate_expression(dialect, 'timestamp', granularity)
+    target_cols = ['building', 'floor', 'timestamp']
+    select_cols = ['building', 'floor', f'{bucket} AS timestamp']
+    for sensor in sensors:
+        target_cols += [f'{sensor}{suffix}' for suffix in STAT_SUFFIXES]
+        select_cols += [f'MIN({sensor})', f'MAX({sensor})', f'SUM({sensor})', f'COUNT({sensor})']
+    select = (f"SELECT {', '.join(select_cols)} FROM {SOURCE_TABLE} "
+              f"WHERE id > :lo AND id <= :hi GROUP BY building, floor, {bucket}")
+
+    if dialect in ('mysql', 'mariadb'):
+        old, new = table, 'new_rows'
+    else:
+        old, new = 't', 'excluded'
+    updates = []
+    for sensor in sensors:
+        updates += [
+            f"{sensor}_min = {_least(dialect, f'{old}.{sensor}_min', f'{new}.{sensor}_min')}",
+            f"{sensor}_max = {_greatest(dialect, f'{old}.{sensor}_max', f'{new}.{sensor}_max')}",
+            f"{sensor}_sum = COALESCE({old}.{sensor}_sum, 0) + COALESCE({new}.{sensor}_sum, 0)",
+            f"{sensor}_count = {old}.{sensor}_count + {new}.{sensor}_count",
+        ]
+
+    if dialect in ('mysql', 'mariadb'):
+        return (f"INSERT INTO {table} ({', '.join(target_cols)}) "
+                f"SELECT * FROM ({select}) AS new_rows "
+                f"ON DUPLICATE KEY UPDATE {', '.join(updates)}")
+    return (f"INSERT INTO {table} AS t ({', '.join(target_cols)}) {select} "
+            f"ON CONFLICT (building, floor, timestamp) DO UPDATE SET {', '.join(updates)}")
+
+
+def create_rollups(engine, sensor_columns=None):
+    """Create the rollup tables (if missing) for the current sensor columns."""
+    sensors = sensor_columns or _source_sensors(engine)
+    rollup_metadata(sensors).create_all(engine)
+    return sensors
+
+
+# Database URL -> (monotonic time, MAX(id)) seen by refreshes still settling, and the newest settled id
+_observed = {}
+_settled = {}
+_observed_lock = threading.Lock()
+
+
+def settled_id(engine, max_id, settle=SETTLE_SECONDS):
+    """Highest id that may be folded in, given the current MAX(id).
+
+    That is the MAX(id) this process saw at least `settle` seconds ago, so
+    transactions holding lower ids have had that long to commit. SQLite
+    commits one writer at a time, so all of `max_id` can be folded there.
+    """
+    if settle <= 0 or engine.dialect.name == 'sqlite':
+        return max_id
+    key = str(engine.url)
+    now = time.monotonic()
+    with _observed_lock:
+        observed = _observed.setdefault(key, deque())
+        observed.append((now, max_id))
+        while observed and now - observed[0][0] >= settle:
+            _settled[key] = observed.popleft()[1]
+        return _settled.get(key, 0)
+
+
+def refresh_rollups(engine, sensor_columns=None, batch_size=REFRESH_BATCH, settle=SETTLE_SECONDS):
+    """Fold rows inserted since the last refresh, up to the settled id, into every rollup; returns rows folded."""
+    dialect = engine.dialect.name
+    if sensor_columns is None:
+        sensor_columns = rollup_sensors(
+            col['name'] for col in inspect(engine).get_columns(ROLLUP_TABLES['minute']))
+    statements = [text(_merge_sql(dialect, g, sensor_columns)) for g in ROLLUP_TABLES]
+    with engine.connect() as conn:
+        max_id = conn.execute(text(f"SELECT MAX(id) FROM {SOURCE_TABLE}")).scalar() or 0
+    target = settled_id(engine, max_id, settle)
+
+    folded = 0
+    while True:
+        with engine.begin() as conn:
+            row = conn.execute(text(f"SELECT last_id FROM {STATE_TABLE} WHERE name = :name"),
+                               {'name': SOURCE_TABLE}).first()
+            lo = row[0] if row else 0
+            if target <= lo:
+                return folded
+            hi = min(target, lo + batch_size)
+
+            # Claim the id range first so concurrent refreshers cannot fold it twice
+            if row is None:
+                conn.execute(text(f"INSERT INTO {STATE_TABLE} (name, last_id) VALUES (:name, :hi)"),
+                             {'name': SOURCE_TABLE, 'hi': hi})
+            else:
+                claimed = conn.execute(
+                    text(f"UPDATE {STATE_TABLE} SET last_id = :hi WHERE name = :name AND last_id = :lo"),
+                    {'name': SOURCE_TABLE, 'lo': lo, 'hi': hi},
+                ).rowcount
+                if not claimed:
+                    return folded
+
+            for statement in statements:
+                conn.execute(statement, {'lo': lo, 'hi': hi})
+            folded += conn.execute(
+                text(f"SELECT COUNT(*) FROM {SOURCE_TABLE} WHERE id > :lo AND id <= :hi"),
+                {'lo': lo, 'hi': hi},
+            ).scalar()
+
+
+def watermark(conn):
+    """Highest source id already folded into the rollups."""
+    return conn.execute(text(f"SELECT last_id FROM {STATE_TABLE} WHERE name = :name"),
+                        {'name': SOURCE_TABLE}).scalar() or 0
+
+
+def backfill_rollups(engine, batch_size=REFRESH_BATCH):
+    """Rebuild every rollup from scratch over the whole source table.
+
+    Folds every id present without waiting for it to settle: run it while no
+    transaction is writing to the source table.
+    """
+    sensors = _source_sensors(engine)
+    metadata = rollup_metadata(sensors)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    return refresh_rollups(engine, sensors, batch_size, settle=0)
+
+
+_last_refresh = {}
+# Database URL -> thread folding new rows into its rollups
+_refreshing = {}
+_refresh_lock = threading.Lock()
+
+
+def _background_refresh(key, engine, sensor_columns):
+    try:
+        refresh_rollups(engine, sensor_columns)
+    except Exception as e:
+        logger.warning(f"Rollup refresh failed: {e}")
+    finally:
+        with _refresh_lock:
+            _refreshing.pop(key, None)
+
+
+def maybe_refresh(engine, sensor_columns, interval=REFRESH_INTERVAL):
+    """Start a rollup refresh at most every `interval` seconds per database.
+
+    The refresh runs on a background thread, so readers never wait for it and
+    answer from the rollups as folded so far.
+    """
+    key = str(engine.url)
+    now = time.monotonic()
+    with _refresh_lock:
+        if now - _last_refresh.get(key, 0) < interval or key in _refreshing:
+            return
+        _last_refresh[key] = now
+        thread = _refreshing[key] = threading.Thread(target=_background_refresh, args=(key, engine, sensor_columns),
+                                                     name='rollup-refresh', daemon=True)
+    thread.start()
+
+
+def rollup_table_for(timeline, sensor, available, start=None, end=None):
+    """Pick the coarsest rollup table that answers `timeline` and covers `sensor`.
+
+    `available` maps rollup table names to the sensors they hold. Rollup rows
+    are filtered on their bucket start, so they only answer a window that
+    starts on a bucket boundary and ends (inclusively) on the last second of
+    a bucket. Returns None when the raw table has to be scanned instead.
+    """
+    granularity = TIMELINE_GRANULARITY.get(timeline)
+    if granularity is None:
+        return None
+    first, last = BUCKET_EDGES[granularity]
+    if (start and not start.endswith(first)) or (end and not end.endswith(last)):
+        return None
+    table = ROLLUP_TABLES[granularity]
+    if sensor not in available.get(table, ()):
+        return None
+    return table
+
+
+def value_expression(sensor, aggregation):
+    """SQL that re-aggregates rollup statistics for `sensor`."""
+    if aggregation == 'min':
+        return f"MIN({sensor}_min)"
+    if aggregation == 'max':
+        return f"MAX({sensor}_max)"
+    if aggregation == 'avg':
+        return f"SUM({sensor}_sum) / NULLIF(SUM({sensor}_count), 0)"
+    raise ValueError(f"Unsupported aggregation '{aggregation}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain simulation_data rollup tables")
+    parser.add_argument('command', choices=['backfill', 'refresh'])
+    parser.add_argument('db_url', nargs='?', default='sqlite:///simulation_data.db')
+    parser.add_argument('--batch-size', type=int, default=REFRESH_BATCH)
+    parser.add_argument('--watch', type=float, default=None,
+                        help="keep refreshing every N seconds")
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help="seconds an id is given to commit before it is folded (ignored on SQLite)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(args.db_url)
+
+    if args.command == 'backfill':
+        start = time.perf_counter()
+        rows = backfill_rollups(engine, args.batch_size)
+        logger.info(f"Backfilled {rows} rows in {time.perf_counter() - start:.1f}s")
+        return
+
+    create_rollups(engine)
+    if args.watch is None and args.settle > 0 and engine.dialect.name != 'sqlite':
+        # A single run has no earlier observation: note MAX(id) now and fold up to it once settled
+        refresh_rollups(engine, batch_size=args.batch_size, settle=args.settle)
+        time.sleep(args.settle)
+    while True:
+        rows = refresh_rollups(engine, batch_size=args.batch_size, settle=args.settle)
+        if rows:
+            logger.info(f"Folded {rows} new rows into rollups")
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
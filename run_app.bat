@@ -1,2 +1,2 @@
 @echo off
-pythonw "C:\Users\shril\Desktop\internship\app.py"
+pythonw "C:\Users\shril\Desktop\internship\serve.py" app
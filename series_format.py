@@ -0,0 +1,85 @@
+"""Compact wire formats for (timestamp, value) series, negotiated per request.
+
+    rows      application/json                         [{"timestamp": ..., "value": ...}, ...]
+    columnar  application/vnd.hvac.columnar+json       {"t": [epoch seconds], "v": [values]}
+    arrow     application/vnd.apache.arrow.stream      Arrow IPC stream, columns t (timestamp[s]) and v
+    float64   application/octet-stream                 little-endian Float64: N timestamps, then N values
+
+Columnar and binary bodies are written straight from NumPy/pandas buffers,
+without building a Python dict per row. Naive timestamps are taken as UTC.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+from flask import Response, jsonify
+
+ROWS_JSON = 'application/json'
+COLUMNAR_JSON = 'application/vnd.hvac.columnar+json'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+FLOAT64 = 'application/octet-stream'
+
+SERIES_FORMATS = {
+    'rows': ROWS_JSON,
+    'columnar': COLUMNAR_JSON,
+    'arrow': ARROW_STREAM,
+    'float64': FLOAT64,
+}
+
+
+def arrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate(request):
+    """Pick a series format from `?format=` or the Accept header (rows by default)."""
+    requested = request.args.get('format')
+    if requested:
+        if requested not in SERIES_FORMATS:
+            raise ValueError(f"Unsupported format '{requested}'")
+        if requested == 'arrow' and not arrow_available():
+            raise ValueError("Arrow output needs the 'pyarrow' package")
+        return requested
+    offers = [ROWS_JSON, COLUMNAR_JSON, FLOAT64] + ([ARROW_STREAM] if arrow_available() else [])
+    best = request.accept_mimetypes.best_match(offers, default=ROWS_JSON)
+    return next(name for name, mimetype in SERIES_FORMATS.items() if mimetype == best)
+
+
+def epoch_seconds(timestamps):
+    """Integer epoch seconds for timestamp strings, datetimes or bucket labels."""
+    parsed = pd.to_datetime(pd.Series(timestamps, dtype=object), format='mixed')
+    return parsed.to_numpy('datetime64[s]').astype(np.int64)
+
+
+def series_response(fmt, timestamps, values, extra=None):
+    """Serialise one series in `fmt`; `extra` adds top-level keys (columnar) or headers (binary)."""
+    if fmt == 'rows':
+        return jsonify([{'timestamp': t, 'value': v} for t, v in zip(timestamps, values)])
+
+    t = epoch_seconds(timestamps)
+    v = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(np.float64)
+
+    if fmt == 'columnar':
+        # to_json writes NaN as null from the array buffer
+        body = '{"t":' + pd.Series(t).to_json(orient='values') + ',"v":' + pd.Series(v).to_json(orient='values', double_precision=15)
+        for key, value in (extra or {}).items():
+            body += f',{json.dumps(key)}:{json.dumps(value)}'
+        return Response(body + '}', mimetype=COLUMNAR_JSON)
+
+    headers = {'X-Series-Length': str(len(t))}
+    headers.update({f"X-Series-{key.title()}": str(value) for key, value in (extra or {}).items()})
+    if fmt == 'float64':
+        body = np.concatenate([t.astype('<f8'), v.astype('<f8')]).tobytes()
+        return Response(body, mimetype=FLOAT64, headers=headers)
+
+    import pyarrow as pa
+    table = pa.table({'t': pa.array(t, type=pa.timestamp('s')), 'v': pa.array(v, from_pandas=True)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_STREAM, headers=headers)
@@ -0,0 +1,191 @@
+"""Production server for the dashboards (app.py or application.py).
+
+Runs the app under gunicorn with SERVE_WORKERS processes of SERVE_THREADS
+threads each. The app is preloaded in the master before the workers are
+forked. Preloading imports the module, compiles every template and opens the
+engine registry for the --preload-db URLs, which reflects their schema and
+detects their storage layout. Pooled connections are closed before the fork,
+so each worker opens its own. Worker metrics are merged at /metrics through
+PROMETHEUS_MULTIPROC_DIR, and the slow-query log is shared through
+SLOW_QUERY_DIR. Both default to a fresh temporary directory.
+
+Graceful restarts:
+    kill -HUP <master pid>    replace every worker; requests in flight and running export jobs finish first
+    kill -TERM <master pid>   graceful shutdown, same wait (up to SERVE_GRACEFUL_TIMEOUT seconds)
+Workers are also replaced after SERVE_MAX_REQUESTS requests (0: never). The
+app is loaded once in the master, so code changes need a full restart.
+Live streams (app.py /stream/sensor) are ended as soon as their worker starts
+to shut down. Their clients reconnect to another worker.
+
+Thread budget: every open live stream holds one of its worker's threads for
+up to LIVE_MAX_LIFETIME seconds. Only workers x threads minus the open
+streams are left for other requests, so raise SERVE_THREADS with the number
+of dashboards kept open.
+
+gunicorn needs fork(). On Windows, or when gunicorn is not installed, the app
+is served by waitress instead: one process with SERVE_THREADS threads.
+
+Usage:
+    python serve.py app [--workers 4] [--threads 8] [--bind 127.0.0.1:5000]
+    python serve.py application --bind 0.0.0.0:5000
+    python serve.py app --preload-db "sqlite:///C:/data/simulation_data.db"
+"""
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', min(os.cpu_count() or 1, 8)))
+SERVE_THREADS = int(os.environ.get('SERVE_THREADS', 8))
+SERVE_TIMEOUT = int(os.environ.get('SERVE_TIMEOUT', 120))
+SERVE_GRACEFUL_TIMEOUT = int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 60))
+SERVE_MAX_REQUESTS = int(os.environ.get('SERVE_MAX_REQUESTS', 10000))
+# Comma-separated database URLs opened before the workers are forked
+SERVE_PRELOAD_DB = os.environ.get('SERVE_PRELOAD_DB', '')
+
+# Module and default bind address per app, as their development servers listen
+APPS = {
+    'app': '127.0.0.1:5000',
+    'application': '0.0.0.0:5000',
+}
+
+
+def prepare_shared_dir(variable, prefix, pattern, workers):
+    """Point `variable` at a directory shared by the workers, emptied of stale `pattern` files.
+
+    Must run before the module that reads `variable` is imported.
+    """
+    directory = os.environ.get(variable)
+    if not directory:
+        if workers <= 1:
+            return None
+        directory = os.environ[variable] = tempfile.mkdtemp(prefix=prefix)
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, pattern)):
+        os.remove(path)
+    return directory
+
+
+def preload(name, db_urls):
+    """Import app `name`, compile its templates and warm the engine registry for `db_urls`."""
+    module = __import__(name)
+    app = module.app
+    for template in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template)
+
+    from engine_registry import registry
+    from storage import get_storage
+    if name == 'application' and os.path.exists(module.DB_PATH):
+        # The URL application.py opens its storage adapter with
+        db_urls = [f"sqlite:///{module.DB_PATH}"] + list(db_urls)
+    for db_url in db_urls:
+        try:
+            get_storage(registry.get_engine(db_url))
+            registry.get_schema(db_url)
+        except Exception as e:
+            logger.warning(f"Could not preload {db_url}: {e}")
+    # Workers must not share the parent's connections
+    registry.release_connections()
+    return app
+
+
+def serve_gunicorn(app, bind, workers, threads):
+    from gunicorn.app.base import BaseApplication
+    from prometheus_client import multiprocess
+
+    from export_jobs import jobs
+
+    def post_worker_init(worker):
+        # gthread has no hook for the start of a graceful stop (HUP, TERM or
+        # max_requests): watch for it, and end the streams that would hold it up
+        def close_streams_on_stop():
+            while worker.alive:
+                time.sleep(1)
+            live_feed = sys.modules.get('live_feed')
+            if live_feed is not None:
+                live_feed.close_streams()
+
+        threading.Thread(target=close_streams_on_stop, name='close-streams', daemon=True).start()
+
+    def worker_exit(server, worker):
+        # Let running export jobs finish (the master stops waiting after graceful_timeout)
+        jobs.shutdown(wait=True)
+
+    def child_exit(server, worker):
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            multiprocess.mark_process_dead(worker.pid)
+
+    options = {
+        'bind': bind,
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': threads,
+        'preload_app': True,
+        'timeout': SERVE_TIMEOUT,
+        'graceful_timeout': SERVE_GRACEFUL_TIMEOUT,
+        'max_requests': SERVE_MAX_REQUESTS,
+        # Spread recycling so workers are not all replaced at once
+        'max_requests_jitter': SERVE_MAX_REQUESTS // 10,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+        'child_exit': child_exit,
+    }
+
+    class DashboardServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    DashboardServer().run()
+
+
+def serve_waitress(app, bind, threads):
+    from waitress import serve
+    serve(app, listen=bind, threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a dashboard with a multi-worker WSGI server")
+    parser.add_argument('app', choices=sorted(APPS))
+    parser.add_argument('--bind', default=None, help="host:port (default: where the app's dev server listens)")
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help="worker processes (gunicorn only)")
+    parser.add_argument('--threads', type=int, default=SERVE_THREADS, help="request threads per worker")
+    parser.add_argument('--preload-db', action='append', default=[u for u in SERVE_PRELOAD_DB.split(',') if u],
+                        help="database URL to open before forking (repeatable)")
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress'], default='auto')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            server = 'waitress' if os.name == 'nt' else 'gunicorn'
+        except ImportError:
+            server = 'waitress'
+    bind = args.bind or APPS[args.app]
+
+    if server == 'gunicorn':
+        prepare_shared_dir('PROMETHEUS_MULTIPROC_DIR', 'prometheus-', '*.db', args.workers)
+        # Stale settings would override SLOW_QUERY_MS
+        prepare_shared_dir('SLOW_QUERY_DIR', 'slow-queries-', '*.json', args.workers)
+        app = preload(args.app, args.preload_db)
+        serve_gunicorn(app, bind, args.workers, args.threads)
+    else:
+        if args.workers > 1:
+            logger.info(f"waitress runs a single process; serving with {args.threads} threads")
+        serve_waitress(preload(args.app, args.preload_db), bind, args.threads)
+
+
+if __name__ == '__main__':
+    main()
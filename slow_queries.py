@@ -0,0 +1,253 @@
+"""Opt-in slow-query log with captured query plans.
+
+Statements that take longer than SLOW_QUERY_MS are kept in a ring buffer of
+the last SLOW_QUERY_LOG_SIZE, with their normalised SQL, parameters,
+duration and row count. The duration covers execution and reading the
+result. Each entry gets the statement's plan (EXPLAIN QUERY PLAN on SQLite,
+EXPLAIN elsewhere). The plan is captured on a background thread so the slow
+request does not pay for it. Entries are flagged when the plan scans a whole
+table. Statements are observed by the hooks in instrumentation.py; the log
+is off until SLOW_QUERY_MS is set or a threshold is POSTed.
+
+Under a multi-process server, set SLOW_QUERY_DIR to a directory shared by the
+workers (serve.py does). A POSTed threshold and a DELETE are then written to
+settings.json there, which every worker re-reads within SLOW_QUERY_SYNC_INTERVAL
+seconds. Each worker writes its buffer to its own file, and GET merges them.
+
+    GET    /admin/slow-queries[?limit=N]       newest first
+    POST   /admin/slow-queries?threshold_ms=N  set the threshold (0 turns the log off)
+    DELETE /admin/slow-queries                 clear the buffer
+"""
+
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+
+from aggregation import TIMESTAMP_FORMAT
+from indexes import explain_prefix, is_full_scan, plan_lines
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this many milliseconds are logged (unset or 0: off)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 200))
+# Directory shared by worker processes (unset: the log lives in this process only)
+SLOW_QUERY_DIR = os.environ.get('SLOW_QUERY_DIR') or None
+# Seconds between checks for a threshold set by another worker
+SLOW_QUERY_SYNC_INTERVAL = float(os.environ.get('SLOW_QUERY_SYNC_INTERVAL', 1))
+SETTINGS_NAME = 'settings.json'
+
+# Parameters kept per entry, and characters per parameter value
+MAX_PARAMETERS = 20
+MAX_PARAMETER_LENGTH = 100
+
+EXPLAINABLE = ('SELECT', 'WITH')
+
+
+def _summarise_parameters(parameters):
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        items = list(parameters.items())[:MAX_PARAMETERS]
+        return {key: repr(value)[:MAX_PARAMETER_LENGTH] for key, value in items}
+    return [repr(value)[:MAX_PARAMETER_LENGTH] for value in list(parameters)[:MAX_PARAMETERS]]
+
+
+def _write_json(path, data):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def explain_sqlite(database, sql, parameters):
+    """Plan of a statement against a SQLite file, read on a separate read-only connection."""
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        return plan_lines('sqlite', conn.execute(f"{explain_prefix('sqlite')} {sql}", parameters or ()))
+    finally:
+        conn.close()
+
+
+def explain_engine(engine, sql, parameters):
+    """Plan of a driver-level statement (as seen by SQLAlchemy cursor events)."""
+    dialect = engine.dialect.name
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"{explain_prefix(dialect)} {sql}", parameters or ())
+        return plan_lines(dialect, rows)
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_LOG_SIZE, directory=SLOW_QUERY_DIR):
+        self.threshold = threshold_ms / 1000 if threshold_ms else None
+        self.entries = deque(maxlen=size)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+        # Shared settings last applied, and when to read them again
+        self._settings = None
+        self._cleared_at = 0.0
+        self._next_sync = 0.0
+
+    @property
+    def enabled(self):
+        if self.directory is not None:
+            self._sync()
+        return self.threshold is not None
+
+    def configure(self, threshold_ms):
+        """Set the threshold in milliseconds; 0 or None turns the log off (in every worker)."""
+        self.threshold = threshold_ms / 1000 if threshold_ms else None
+        self._write_settings(threshold_ms=threshold_ms or 0)
+
+    def _settings_path(self):
+        return os.path.join(self.directory, SETTINGS_NAME)
+
+    def _entries_path(self):
+        return os.path.join(self.directory, f"entries-{os.getpid()}.json")
+
+    def _write_settings(self, **changes):
+        if self.directory is None:
+            return
+        settings = _read_json(self._settings_path(), {})
+        settings.setdefault('threshold_ms', None if self.threshold is None else self.threshold * 1000)
+        settings.update(changes)
+        _write_json(self._settings_path(), settings)
+        self._next_sync = 0.0
+
+    def _sync(self, force=False):
+        """Apply a threshold or clear written to the shared settings by any worker."""
+        now = time.monotonic()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + SLOW_QUERY_SYNC_INTERVAL
+        settings = _read_json(self._settings_path())
+        if settings is None or settings == self._settings:
+            return
+        self._settings = settings
+        threshold_ms = settings.get('threshold_ms')
+        self.threshold = threshold_ms / 1000 if threshold_ms else None
+        cleared_at = settings.get('cleared_at', 0.0)
+        if cleared_at > self._cleared_at:
+            self._cleared_at = cleared_at
+            with self._lock:
+                self.entries = deque((entry for entry in self.entries if entry['logged_at'] >= cleared_at),
+                                     maxlen=self.entries.maxlen)
+
+    def observe(self, statement, sql, parameters, seconds, rows, dialect, explain):
+        """Log one statement if it was slow; `explain(sql, parameters)` returns its plan lines."""
+        if self.threshold is None or seconds < self.threshold:
+            return
+        entry = {
+            'at': datetime.now().strftime(TIMESTAMP_FORMAT),
+            'logged_at': time.time(),
+            'statement': statement,
+            'parameters': _summarise_parameters(parameters),
+            'duration_ms': round(seconds * 1000, 2),
+            'rows': rows,
+            'dialect': dialect,
+            'plan': None,
+            'full_scan': None,
+        }
+        with self._lock:
+            self.entries.append(entry)
+        if sql.lstrip()[:6].upper().startswith(EXPLAINABLE) and explain is not None:
+            self._explainer.submit(self._explain, entry, explain, sql, parameters)
+        elif self.directory is not None:
+            self._explainer.submit(self._save)
+
+    def _explain(self, entry, explain, sql, parameters):
+        started = time.perf_counter()
+        try:
+            entry['plan'] = explain(sql, parameters)
+            entry['full_scan'] = is_full_scan(entry['dialect'], entry['plan'])
+        except Exception as e:
+            entry['plan'] = [f"EXPLAIN failed: {e}"]
+        entry['explain_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        if self.directory is not None:
+            self._save()
+
+    def _save(self):
+        # Runs on the explainer thread, after the entry's plan is in
+        self._sync(force=True)
+        with self._lock:
+            entries = list(self.entries)
+        try:
+            _write_json(self._entries_path(), entries)
+        except OSError as e:
+            logger.warning(f"Could not write the slow-query log to {self.directory}: {e}")
+
+    def snapshot(self, limit=None):
+        """Entries newest first; with a shared directory, the last `size` of every worker's."""
+        if self.directory is None:
+            with self._lock:
+                entries = list(self.entries)
+        else:
+            self._sync(force=True)
+            entries = []
+            for path in glob.glob(os.path.join(self.directory, 'entries-*.json')):
+                entries.extend(_read_json(path, []))
+            # A worker may not have picked up the latest clear yet
+            entries = [entry for entry in entries if entry['logged_at'] >= self._cleared_at]
+            entries.sort(key=lambda entry: entry['logged_at'])
+            entries = entries[-self.entries.maxlen:]
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        """Empty the buffer (of every worker)."""
+        with self._lock:
+            self.entries.clear()
+        if self.directory is not None:
+            self._write_settings(cleared_at=time.time())
+            for path in glob.glob(os.path.join(self.directory, 'entries-*.json')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+slow_log = SlowQueryLog()
+
+slow_queries_blueprint = Blueprint('slow_queries', __name__)
+
+
+@slow_queries_blueprint.route('/admin/slow-queries', methods=['GET', 'POST', 'DELETE'])
+def admin_slow_queries():
+    if request.method == 'POST':
+        try:
+            slow_log.configure(float(request.args.get('threshold_ms', 0)))
+        except ValueError:
+            return jsonify({'error': "threshold_ms must be a number"}), 400
+        logger.info(f"Slow-query threshold set to {request.args.get('threshold_ms')} ms")
+    elif request.method == 'DELETE':
+        slow_log.clear()
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({'error': "limit must be an integer"}), 400
+    # Read first: it picks up settings changed by other workers
+    queries = slow_log.snapshot(limit)
+    threshold = slow_log.threshold
+    return jsonify({
+        'threshold_ms': None if threshold is None else threshold * 1000,
+        'size': slow_log.entries.maxlen,
+        'queries': queries,
+    })
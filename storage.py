@@ -0,0 +1,472 @@
+"""One query interface over the project's sensor storage layouts.
+
+    wide       simulation_data   one column per sensor (app.py, the HVAC simulator)
+    long       sensor_data       sensor_type / value rows (application.py, data_generator.py)
+    parameter  hvac_data         parameter_name / value rows per unit (project intenship/hvac.db)
+    canonical  ts_sensors + ts_readings: integer sensor ids, integer epoch-second
+               timestamps and REAL values, filled from any of the above by `migrate`
+
+Every adapter answers buildings / floors / sensors / series with SQL built from
+the shared bucket helpers, and series() reads any number of sensors in one
+grouped scan. Once `epoch` has given a source table a filled integer `ts`
+column, its ranges and buckets are integer comparisons and arithmetic
+instead of strftime() on every row.
+
+Usage:
+    python storage.py migrate sqlite:///simulation_data.db
+    python storage.py migrate sqlite:///sensor_data.db --target sqlite:///canonical.db --watch 10
+    python storage.py epoch sqlite:///sensor_data.db
+"""
+
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import (BigInteger, Column, Float, Index, Integer, MetaData, String, Table, UniqueConstraint,
+                        create_engine, inspect, text)
+
+from aggregation import (aggregate_function, bucket_expression, epoch_bucket_expression, epoch_expression,
+                         epoch_label, to_epoch)
+from indexes import analyze, apply_indexes
+from rollups import NON_SENSOR_COLUMNS
+from series_format import epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+SENSORS_TABLE = 'ts_sensors'
+READINGS_TABLE = 'ts_readings'
+STATE_TABLE = 'ts_migration_state'
+# Integer epoch-seconds column added next to the timestamp strings of the source tables
+EPOCH_COLUMN = 'ts'
+
+# Forces a layout (e.g. 'canonical' once migrated); otherwise it is detected from the tables present
+STORAGE_LAYOUT = os.environ.get('STORAGE_LAYOUT')
+
+# Source rows copied per migration transaction
+MIGRATION_BATCH = int(os.environ.get('STORAGE_MIGRATION_BATCH', 20000))
+
+
+def canonical_metadata():
+    metadata = MetaData()
+    Table(
+        SENSORS_TABLE, metadata,
+        Column('id', Integer, primary_key=True),
+        Column('building', String(64), nullable=False),
+        Column('floor', Integer),
+        Column('name', String(64), nullable=False),
+        UniqueConstraint('building', 'floor', 'name', name='uq_ts_sensors_building_floor_name'),
+    )
+    Table(
+        READINGS_TABLE, metadata,
+        Column('sensor_id', Integer, nullable=False),
+        Column('ts', BigInteger, nullable=False),
+        Column('value', Float),
+        # Covering index: a sensor's time range and its values are read from the index alone
+        Index('ix_ts_readings_sensor_ts_value', 'sensor_id', 'ts', 'value'),
+    )
+    Table(
+        STATE_TABLE, metadata,
+        Column('source', String(128), primary_key=True),
+        Column('last_id', BigInteger, nullable=False),
+    )
+    return metadata
+
+
+def sensor_key(name):
+    """Canonical sensor name: 'Unit Status F/B' -> 'unit_status_fb', 'ra_temp' unchanged."""
+    return '_'.join(re.sub(r'[^a-z0-9_ ]', '', str(name).lower()).split())
+
+
+class Storage:
+    """Base adapter; subclasses say where buildings, floors, sensors, times and values live."""
+
+    layout = None
+    table = None
+    building_column = None
+    floor_column = None
+    time_column = 'timestamp'
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        if self.time_column != EPOCH_COLUMN and self._epoch_ready():
+            self.time_column = EPOCH_COLUMN
+
+    @property
+    def epoch(self):
+        return self.time_column == EPOCH_COLUMN
+
+    def _epoch_ready(self):
+        """True when the table has an integer ts column filled for every row.
+
+        Checked once per adapter, and adapters are cached per process until
+        reset_storages(). Once series filter on ts, rows written without it
+        are missing from them. Writers must fill ts before the switch, e.g.
+        by restarting an ingest_server.py that detected the column at startup.
+        """
+        if EPOCH_COLUMN not in {col['name'] for col in inspect(self.engine).get_columns(self.table)}:
+            return False
+        return not self._query(f"SELECT 1 FROM {self.table} WHERE {EPOCH_COLUMN} IS NULL LIMIT 1")
+
+    def _query(self, sql, params=None):
+        with self.engine.connect() as conn:
+            return conn.execute(text(sql), params or {}).fetchall()
+
+    def _distinct(self, column, table=None, filters=(), params=None):
+        where = ' WHERE ' + ' AND '.join(filters) if filters else ''
+        rows = self._query(f"SELECT DISTINCT {column} FROM {table or self.table}{where}", params)
+        return sorted(row[0] for row in rows if row[0] is not None)
+
+    def buildings(self):
+        return self._distinct(self.building_column)
+
+    def floors(self, building=None):
+        if self.floor_column is None:
+            return []
+        if building is None:
+            return self._distinct(self.floor_column)
+        return self._distinct(self.floor_column, filters=[f"{self.building_column} = :building"],
+                              params={'building': building})
+
+    def sensors(self):
+        raise NotImplementedError
+
+    def bucket(self, timeline):
+        if self.epoch:
+            return epoch_bucket_expression(self.dialect, self.time_column, timeline)
+        return bucket_expression(self.dialect, self.time_column, timeline)
+
+    def time_param(self, value):
+        return to_epoch(value) if self.epoch else value
+
+    def label(self, bucket, timeline):
+        return epoch_label(bucket, timeline) if self.epoch else bucket
+
+    def _filters(self, building, floor, start, end):
+        filters = []
+        params = {}
+        if building is not None:
+            filters.append(f"{self.building_column} = :building")
+            params['building'] = building
+        if floor is not None and self.floor_column is not None:
+            filters.append(f"{self.floor_column} = :floor")
+            params['floor'] = floor
+        if start:
+            filters.append(f"{self.time_column} >= :start")
+            params['start'] = self.time_param(start)
+        if end:
+            filters.append(f"{self.time_column} <= :end")
+            params['end'] = self.time_param(end)
+        return filters, params
+
+    def _select(self, sensors, agg_function, building, floor, start, end):
+        """(value expressions, WHERE terms, params) for one grouped scan, or None when nothing matches."""
+        raise NotImplementedError
+
+    def series(self, sensors, timeline, aggregation, building=None, floor=None, start=None, end=None):
+        """Bucketed rows (label, value_1, ..., value_k) for k sensors, oldest first, from one scan.
+
+        `start`/`end` are stored-format timestamp strings; labels match
+        aggregation.bucket_expression() whatever the layout.
+        """
+        agg_function = aggregate_function(aggregation)
+        if agg_function is None:
+            raise ValueError("A bucketed series needs an aggregation (min, max or avg)")
+        selected = self._select(list(sensors), agg_function, building, floor, start, end)
+        if selected is None:
+            return []
+        return self._grouped(timeline, *selected)
+
+    def bucket_stats(self, sensor, timeline, building=None, floor=None, start=None, end=None):
+        """Rows (label, min, max, sum, count) for one sensor: partial aggregates that can be merged."""
+        selected = [self._select([sensor], function, building, floor, start, end)
+                    for function in ('MIN', 'MAX', 'SUM', 'COUNT')]
+        if selected[0] is None:
+            return []
+        return self._grouped(timeline, [values[0] for values, _, _ in selected], *selected[0][1:])
+
+    def _grouped(self, timeline, values, filters, params):
+        bucket = self.bucket(timeline)
+        columns = ', '.join(f"{value} AS value_{i}" for i, value in enumerate(values))
+        query = f"SELECT {bucket} AS bucket, {columns} FROM {self.table}"
+        if filters:
+            query += " WHERE " + " AND ".join(filters)
+        query += f" GROUP BY {bucket} ORDER BY {bucket}"
+        return [(self.label(row[0], timeline),) + tuple(row[1:]) for row in self._query(query, params)]
+
+    def read_batch(self, after_id, limit):
+        """Source rows past `after_id` as ([(building, floor, sensor, timestamp, value)], last id read)."""
+        raise NotImplementedError
+
+
+class WideStorage(Storage):
+    layout = 'wide'
+    table = 'simulation_data'
+    building_column = 'building'
+    floor_column = 'floor'
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self._sensors = None
+
+    def sensors(self):
+        if self._sensors is None:
+            self._sensors = [col['name'] for col in inspect(self.engine).get_columns(self.table)
+                             if col['name'] not in NON_SENSOR_COLUMNS]
+        return self._sensors
+
+    def _select(self, sensors, agg_function, building, floor, start, end):
+        unknown = [name for name in sensors if name not in self.sensors()]
+        if unknown:
+            raise ValueError(f"Invalid sensor name(s): {', '.join(unknown)}")
+        filters, params = self._filters(building, floor, start, end)
+        return [f"{agg_function}({name})" for name in sensors], filters, params
+
+    def read_batch(self, after_id, limit):
+        sensors = self.sensors()
+        rows = self._query(
+            f"SELECT id, building, floor, timestamp, {', '.join(sensors)} FROM {self.table} "
+            f"WHERE id > :after_id ORDER BY id LIMIT :limit",
+            {'after_id': after_id, 'limit': limit},
+        )
+        readings = [(row[1], row[2], name, row[3], value)
+                    for row in rows
+                    for name, value in zip(sensors, row[4:]) if value is not None]
+        return readings, (rows[-1][0] if rows else after_id)
+
+
+class LongStorage(Storage):
+    layout = 'long'
+    table = 'sensor_data'
+    building_column = 'building_id'
+    floor_column = 'floor_number'
+    sensor_column = 'sensor_type'
+
+    def sensors(self):
+        return self._distinct(self.sensor_column)
+
+    def _select(self, sensors, agg_function, building, floor, start, end):
+        filters, params = self._filters(building, floor, start, end)
+        names = []
+        for i, name in enumerate(sensors):
+            params[f'sensor_{i}'] = name
+            names.append(f':sensor_{i}')
+        if len(sensors) == 1:
+            filters.append(f"{self.sensor_column} = :sensor_0")
+            return [f"{agg_function}(value)"], filters, params
+        # Pivot the requested sensors into columns in the same scan
+        filters.append(f"{self.sensor_column} IN ({', '.join(names)})")
+        values = [f"{agg_function}(CASE WHEN {self.sensor_column} = {name} THEN value END)" for name in names]
+        return values, filters, params
+
+    def read_batch(self, after_id, limit):
+        rows = self._query(
+            f"SELECT id, {self.building_column}, {self.floor_column or 'NULL'}, {self.sensor_column}, "
+            f"{self.time_column}, value FROM {self.table} WHERE id > :after_id ORDER BY id LIMIT :limit",
+            {'after_id': after_id, 'limit': limit},
+        )
+        readings = [tuple(row[1:]) for row in rows if row[5] is not None]
+        return readings, (rows[-1][0] if rows else after_id)
+
+
+class ParameterStorage(LongStorage):
+    layout = 'parameter'
+    table = 'hvac_data'
+    building_column = 'unit_id'
+    floor_column = None
+    sensor_column = 'parameter_name'
+
+
+class CanonicalStorage(Storage):
+    layout = 'canonical'
+    table = READINGS_TABLE
+    time_column = EPOCH_COLUMN
+
+    def buildings(self):
+        # Stored as text so unit ids fit too; numeric buildings come back as numbers
+        return sorted(int(b) if b.isdigit() else b for b in self._distinct('building', SENSORS_TABLE))
+
+    def floors(self, building=None):
+        if building is None:
+            return self._distinct('floor', SENSORS_TABLE)
+        return self._distinct('floor', SENSORS_TABLE, ["building = :building"], {'building': str(building)})
+
+    def sensors(self):
+        return self._distinct('name', SENSORS_TABLE)
+
+    def watermark(self):
+        """Highest source id migrated so far (the canonical tables' data version)."""
+        rows = self._query(f"SELECT MAX(last_id) FROM {STATE_TABLE}")
+        return rows[0][0] or 0
+
+    def _select(self, sensors, agg_function, building, floor, start, end):
+        # Resolve names (and building/floor) to sensor ids in the small dictionary table,
+        # then read the readings index by (sensor_id, ts)
+        lookup = [f"name IN ({', '.join(f':name_{i}' for i in range(len(sensors)))})"]
+        lookup_params = {f'name_{i}': name for i, name in enumerate(sensors)}
+        if building is not None:
+            lookup.append("building = :building")
+            lookup_params['building'] = str(building)
+        if floor is not None:
+            lookup.append("floor = :floor")
+            lookup_params['floor'] = floor
+        ids = {}
+        for sensor_id, name in self._query(f"SELECT id, name FROM {SENSORS_TABLE} WHERE {' AND '.join(lookup)}",
+                                           lookup_params):
+            ids.setdefault(name, []).append(int(sensor_id))
+        if not ids:
+            return None
+
+        filters, params = self._filters(None, None, start, end)
+        every_id = ', '.join(str(i) for name in sensors for i in ids.get(name, ()))
+        filters.insert(0, f"sensor_id IN ({every_id})")
+        if len(sensors) == 1:
+            return [f"{agg_function}(value)"], filters, params
+        values = []
+        for name in sensors:
+            matching = ', '.join(str(sensor_id) for sensor_id in ids.get(name, ())) or 'NULL'
+            values.append(f"{agg_function}(CASE WHEN sensor_id IN ({matching}) THEN value END)")
+        return values, filters, params
+
+
+LAYOUTS = {cls.layout: cls for cls in (WideStorage, LongStorage, ParameterStorage, CanonicalStorage)}
+
+
+def detect_layout(engine):
+    """Layout of the source table present in the database (canonical only if nothing else is)."""
+    tables = set(inspect(engine).get_table_names())
+    for cls in (WideStorage, LongStorage, ParameterStorage, CanonicalStorage):
+        if cls.table in tables:
+            return cls.layout
+    raise ValueError("No known sensor table in this database")
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(engine, layout=None):
+    """Shared adapter for an engine: `layout`, else STORAGE_LAYOUT, else the detected layout."""
+    layout = layout or STORAGE_LAYOUT or detect_layout(engine)
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown storage layout '{layout}'")
+    key = (id(engine), layout)
+    with _storages_lock:
+        storage = _storages.get(key)
+        if storage is None:
+            storage = _storages[key] = LAYOUTS[layout](engine)
+        return storage
+
+
+def reset_storages():
+    """Drop cached adapters so layouts and ts columns are detected again (e.g. after a migration)."""
+    with _storages_lock:
+        _storages.clear()
+
+
+def add_epoch_column(source, batch_size=MIGRATION_BATCH):
+    """Add the integer ts column to a source table, index it and backfill it; returns rows filled.
+
+    Rows are filled in id ranges, one short transaction each, so writers are
+    not blocked for long. Writers that set ts themselves keep it complete;
+    re-running only fills rows still missing it.
+    """
+    engine = source.engine
+    table = source.table
+    if EPOCH_COLUMN not in {col['name'] for col in inspect(engine).get_columns(table)}:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {EPOCH_COLUMN} BIGINT"))
+    apply_indexes(engine)
+
+    expression = epoch_expression(source.dialect, 'timestamp')
+    update = text(f"UPDATE {table} SET {EPOCH_COLUMN} = {expression} "
+                  f"WHERE id > :low AND id <= :high AND {EPOCH_COLUMN} IS NULL")
+    with engine.connect() as conn:
+        low, high = conn.execute(text(f"SELECT MIN(id) - 1, MAX(id) FROM {table} "
+                                      f"WHERE {EPOCH_COLUMN} IS NULL")).fetchone()
+    filled = 0
+    while high is not None and low < high:
+        with engine.begin() as conn:
+            filled += conn.execute(update, {'low': low, 'high': low + batch_size}).rowcount
+        low += batch_size
+        logger.info(f"Filled {EPOCH_COLUMN} for {filled} rows of {table} (up to id {min(low, high)})")
+    analyze(engine, table)
+    return filled
+
+
+def migrate(source, target_engine=None, batch_size=MIGRATION_BATCH):
+    """Copy source rows past the stored watermark into the canonical tables; returns readings copied.
+
+    Safe to re-run: each batch and its watermark commit together.
+    """
+    target_engine = target_engine or source.engine
+    metadata = canonical_metadata()
+    metadata.create_all(target_engine)
+    sensors_table = metadata.tables[SENSORS_TABLE]
+    readings_table = metadata.tables[READINGS_TABLE]
+    state_key = f"{source.layout}:{source.table}"
+
+    with target_engine.connect() as conn:
+        sensor_ids = {(row.building, row.floor, row.name): row.id
+                      for row in conn.execute(text(f"SELECT id, building, floor, name FROM {SENSORS_TABLE}"))}
+        last_id = conn.execute(text(f"SELECT last_id FROM {STATE_TABLE} WHERE source = :source"),
+                               {'source': state_key}).scalar()
+    copied = 0
+    while True:
+        readings, next_id = source.read_batch(last_id or 0, batch_size)
+        if next_id == (last_id or 0):
+            return copied
+        epochs = epoch_seconds([reading[3] for reading in readings]) if readings else []
+
+        with target_engine.begin() as conn:
+            rows = []
+            for (building, floor, name, _, value), ts in zip(readings, epochs):
+                key = (str(building), None if floor is None else int(floor), sensor_key(name))
+                sensor_id = sensor_ids.get(key)
+                if sensor_id is None:
+                    result = conn.execute(sensors_table.insert().values(building=key[0], floor=key[1], name=key[2]))
+                    sensor_id = sensor_ids[key] = result.inserted_primary_key[0]
+                rows.append({'sensor_id': sensor_id, 'ts': int(ts), 'value': float(value)})
+            if rows:
+                conn.execute(readings_table.insert(), rows)
+            if last_id is None:
+                conn.execute(text(f"INSERT INTO {STATE_TABLE} (source, last_id) VALUES (:source, :last_id)"),
+                             {'source': state_key, 'last_id': next_id})
+            else:
+                conn.execute(text(f"UPDATE {STATE_TABLE} SET last_id = :last_id WHERE source = :source"),
+                             {'source': state_key, 'last_id': next_id})
+        last_id = next_id
+        copied += len(rows)
+        logger.info(f"Migrated {copied} readings from {state_key} (up to id {last_id})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate sensor tables to integer-epoch storage")
+    parser.add_argument('command', choices=['migrate', 'epoch'],
+                        help="migrate: copy into the canonical tables; epoch: add and fill the integer ts column")
+    parser.add_argument('source_url', help="database holding simulation_data, sensor_data or hvac_data")
+    parser.add_argument('--layout', choices=['wide', 'long', 'parameter'], help="source layout (detected by default)")
+    parser.add_argument('--target', help="database for the canonical tables (defaults to the source)")
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH)
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help="keep copying new rows every N seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(args.source_url)
+    source = LAYOUTS[args.layout or detect_layout(engine)](engine)
+    if args.command == 'epoch':
+        print(f"Filled {add_epoch_column(source, args.batch_size)} rows")
+        return
+    target = create_engine(args.target) if args.target else engine
+    while True:
+        print(f"Copied {migrate(source, target, args.batch_size)} readings")
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import time
+
+from sqlalchemy import create_engine, text
+
+from live_feed import LiveFeed
+
+
+def make_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE simulation_data (id INTEGER PRIMARY KEY, timestamp TEXT, "
+                          "building INTEGER, floor INTEGER, ra_temp REAL)"))
+    return engine
+
+
+def insert_rows(engine, count):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO simulation_data (timestamp, building, floor, ra_temp) "
+                          "VALUES ('2026-01-01 00:00:00', 1, 1, 21.5)"), [{}] * count)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_poller_restarts_from_newest_row(tmp_path):
+    engine = make_engine(tmp_path / 'live.db')
+    insert_rows(engine, 5)
+    feed = LiveFeed(engine, ['ra_temp'], interval=0.01, batch_size=10)
+
+    subscription = feed.subscribe()
+    wait_for(lambda: feed.last_id == 5)
+    feed.unsubscribe(subscription)
+    wait_for(lambda: feed._thread is None)
+
+    # Rows written while nobody listens are not replayed to the next subscriber
+    insert_rows(engine, 2000)
+    subscription = feed.subscribe()
+    wait_for(lambda: feed.last_id == 2005)
+    insert_rows(engine, 3)
+    rows = subscription.queue.get(timeout=5)
+    feed.unsubscribe(subscription)
+
+    assert [row['id'] for row in rows] == [2006, 2007, 2008]
+    assert subscription.queue.empty()
+    assert not subscription.overflowed